@@ -1,31 +1,137 @@
 """
-Configuration for Flask App
+Application factory
 """
 
-# pylint: disable=invalid-name,no-member,wrong-import-position
+# pylint: disable=invalid-name,cyclic-import
+
+from importlib import import_module
 
 from flask import Flask
 from flask_mail import Mail
 
 from app_name import config
 
-app = Flask(__name__)
-app.config.from_object(config.get_config())
+mail = Mail()
+
+# Optional subsystem -> modules adding routes to the blueprint of its package
+BLUEPRINT_MODULES = {
+    'auth': ('app_name.auth.email.routes', 'app_name.auth.facebook.routes',
+             'app_name.auth.google.routes'),
+    'users': ('app_name.users.routes',),
+    'resources': ('app_name.resources.routes',),
+    'admin': ('app_name.admin.routes',),
+}
+
+
+def register_blueprints(app, blueprints):
+    """
+    Imports the routes of each subsystem and registers its blueprint
+    :param app: Flask
+    :param blueprints: tuple of str -- keys of BLUEPRINT_MODULES
+    :return:
+    """
+    unknown = set(blueprints) - set(BLUEPRINT_MODULES)
+
+    if unknown:
+        raise ValueError('Unknown blueprints: {}'.format(', '.join(sorted(unknown))))
+
+    # Internal endpoints, e.g. metrics, are served whatever the subsystems
+    import_module('app_name.internal.routes')
+    app.register_blueprint(import_module('app_name.internal').blueprint)
 
-mail = Mail(app)
+    for name in blueprints:
+        for module in BLUEPRINT_MODULES[name]:
+            import_module(module)
 
-# Import routes
-from app_name.admin import routes as admin_routes
-from app_name.auth.email import routes as auth_routes
-from app_name.auth.facebook import routes as fb_routes
-from app_name.users import routes as user_routes
-from app_name.resources import routes as resource_routes
-from app_name.security import security as app_security
+        package = import_module('app_name.' + name)
 
+        app.register_blueprint(package.blueprint)
 
-def get_app():
+        if hasattr(package, 'init_app'):
+            package.init_app(app)
+
+
+def register_commands(app):
+    """
+    :param app: Flask
+    :return:
+    """
+    from app_name.database import commands as database_commands
+    from app_name.outbox import commands as outbox_commands
+    from app_name.util import compression
+
+    app.cli.add_command(database_commands.db_pool_stats)
+    app.cli.add_command(database_commands.seed_command)
+    app.cli.add_command(outbox_commands.outbox_send)
+    app.cli.add_command(compression.compress_static)
+
+
+def create_app(environment=None, blueprints=None):
     """
-    Returns the instance of the Flask app_name
-    :return: Flask app_name
+    Creates an instance of the app
+    Only the enabled subsystems are imported, so what isn't served isn't loaded either
+    :param environment: str -- config to use, e.g. 'TESTING', ENVIRONMENT by default
+    :param blueprints: iterable of str -- subsystems to serve, BLUEPRINTS by default
+    :return: Flask
     """
+    from app_name import database, security
+    from app_name.util import compression, metrics, queries
+
+    app = Flask(__name__)
+    app.config.from_object(config.get_config(environment))
+
+    if blueprints is not None:
+        app.config['BLUEPRINTS'] = tuple(blueprints)
+
+    # Registers its request hooks first, so their time is measured too
+    metrics.init_app(app)
+    queries.init_app(app)
+
+    database.init_app(app)
+    mail.init_app(app)
+    security.init_app(app)
+    compression.init_app(app)
+
+    register_blueprints(app, app.config['BLUEPRINTS'])
+    register_commands(app)
+
     return app
+
+
+def before_fork(app):
+    """
+    Run by a master that preloaded the app, before it forks a worker
+    Closes what the master may have opened while loading, e.g. a database connection, so
+    workers don't inherit sockets they would share
+    :param app: Flask
+    :return:
+    """
+    from app_name.database import dispose_engines
+    from app_name.util import concurrency, outbound, passwords
+
+    dispose_engines(app)
+    outbound.reset_session()
+    passwords.shutdown_pool()
+    concurrency.shutdown_executor()
+
+
+def after_fork(app):
+    """
+    Run in a worker right after it was forked from a master that preloaded the app
+    Drops the per-process clients inherited from the master so the worker opens its own:
+    connection pools, HTTP sessions, the hashing pool, the provider calls executor and the
+    replica's health. The HTTP session, hashing pool and executor are left for the master to
+    close. Disposing the engines does close their pooled connections, which is only safe
+    because before_fork already emptied the pools in the master
+    :param app: Flask
+    :return:
+    """
+    from app_name.database import dispose_engines
+    from app_name.database.routing import reset_replica_health
+    from app_name.util import concurrency, outbound, passwords
+
+    dispose_engines(app)
+    outbound.reset_session()
+    passwords.shutdown_pool()
+    concurrency.shutdown_executor()
+    reset_replica_health()
@@ -3,9 +3,9 @@ Admin panel initialization
 """
 
 # pylint: disable=no-member,invalid-name, too-many-locals
-from flask_admin import Admin
+from flask import Blueprint, url_for
+from flask_admin import Admin, helpers as admin_helpers
 
-from app_name import app
 from app_name.admin.views import (
     AuthModelView,
     AuthBaseView,
@@ -14,6 +14,9 @@ from app_name.admin.views import (
 
 from app_name.database import db
 
+# Named apart from Flask-Admin's own 'admin' blueprint
+blueprint = Blueprint('dashboard', __name__)
+
 
 def configure_admin(_app):
     """
@@ -44,4 +47,23 @@ def configure_admin(_app):
     return _admin
 
 
-admin = configure_admin(app)
+def init_app(app):
+    """
+    Sets up the admin dashboard and lets Flask-Security's login pages render inside it
+    :param app: Flask
+    :return:
+    """
+    admin = configure_admin(app)
+
+    @app.extensions['security'].context_processor
+    def security_context_processor():
+        """
+        Processes context of admin panel access
+        :return:
+        """
+        return dict(
+            admin_base_template=admin.base_template,
+            admin_view=admin.index_view,
+            h=admin_helpers,
+            get_url=url_for
+        )
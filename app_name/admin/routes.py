@@ -4,11 +4,12 @@ Routes for admin dashboard
 
 from flask import redirect, render_template
 
-from app_name import app
+from . import blueprint
+
 from app_name.util.exceptions import protect_500
 
 
-@app.route('/')
+@blueprint.route('/')
 @protect_500
 def index():
     """
@@ -18,7 +19,7 @@ def index():
     return redirect('admin/')
 
 
-@app.route('/admin')
+@blueprint.route('/admin')
 @protect_500
 def admin():
     """
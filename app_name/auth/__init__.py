@@ -1,3 +1,10 @@
 """
 Authentication module
 """
+
+# pylint: disable=invalid-name
+
+from flask import Blueprint
+
+# Routes of every provider, see email, facebook and google
+blueprint = Blueprint('auth', __name__)
@@ -1,14 +1,22 @@
 """
 Helper functions for auth module
 """
-from flask_security.confirmable import generate_confirmation_link
-from flask_mail import Message
+from flask import url_for
+from flask_security.confirmable import generate_confirmation_token
 
-from app_name import mail
+from app_name.outbox.helpers import enqueue_email
 
 
 def confirm_email(user):
-    confirmation_link, token = generate_confirmation_link(user)
+    """
+    Queues the confirmation email for a new user in the outbox
+    The user must have been flushed so it has an id, and the email goes out once the
+    caller commits
+    :param user: User
+    :return:
+    """
+    confirmation_link = url_for('auth.confirm', token=generate_confirmation_token(user),
+                                _external=True)
 
     subject = 'Confirmation Email for ' + user.first_name
 
@@ -18,6 +26,4 @@ def confirm_email(user):
               {}
               '''.format(confirmation_link)
 
-    msg = Message(subject=subject, body=content, recipients=[user.email])
-
-    mail.send(msg)
+    enqueue_email(subject=subject, body=content, recipients=[user.email])
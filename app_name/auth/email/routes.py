@@ -11,19 +11,21 @@ from flask_jwt_extended import (
     jwt_refresh_token_required,
     create_refresh_token
 )
-from flask_security.utils import verify_password
+from flask_security.confirmable import confirm_email_token_status, confirm_user
 
 from .helpers import confirm_email
 
-from app_name import app
+from app_name.auth import blueprint
 from app_name.database import db
+from app_name.database.routing import reads_from_primary
 from app_name.users.models import User
 
 from app_name.util import responses
+from app_name.util.passwords import verify_password
 from app_name.util.exceptions import protect_500
 
 
-@app.route('/auth/login/email', methods=['POST'])
+@blueprint.route('/auth/login/email', methods=['POST'])
 @protect_500
 def login():
     """
@@ -52,7 +54,7 @@ def login():
     return responses.user_logged_in(jwt_token, refresh_token, user.id)
 
 
-@app.route('/auth/signup/email', methods=['POST'])
+@blueprint.route('/auth/signup/email', methods=['POST'])
 @protect_500
 def signup_email():
     """
@@ -85,10 +87,12 @@ def signup_email():
     )
 
     db.session.add(user)
-    db.session.commit()
+    db.session.flush()
+
+    # Sent by the outbox sender, committed together with the user
+    confirm_email(user)
 
-    if not app.config.get('TESTING'):
-        confirm_email(user)
+    db.session.commit()
 
     # Return app_name user access token for access to app_name api
     # Identity can be any data that is json serializable
@@ -98,7 +102,7 @@ def signup_email():
     return responses.user_created(jwt_token, refresh_token)
 
 
-@app.route('/auth/refresh', methods=['POST'])
+@blueprint.route('/auth/refresh', methods=['POST'])
 @protect_500
 @jwt_refresh_token_required
 def refresh():
@@ -110,3 +114,31 @@ def refresh():
     new_token = create_access_token(identity=user_id)
 
     return responses.user_token_refreshed(new_token)
+
+
+@blueprint.route('/auth/confirm/<token>', methods=['GET'])
+@protect_500
+@reads_from_primary
+def confirm(token):
+    """
+    Confirms the email of the user the confirmation link was sent to
+    An expired link of an unconfirmed user gets a new one sent
+    :param token: str
+    :return:
+    """
+    expired, invalid, user = confirm_email_token_status(token)
+
+    if invalid or user is None:
+        return responses.invalid_confirmation_link()
+
+    if user.confirmed_at is None:
+        if expired:
+            confirm_email(user)
+            db.session.commit()
+
+            return responses.confirmation_link_expired()
+
+        confirm_user(user)
+        db.session.commit()
+
+    return responses.email_confirmed()
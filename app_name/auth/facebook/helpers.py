@@ -4,11 +4,16 @@ Facebook helper functions
 
 # pylint: disable=no-member,invalid-name
 
-import requests
+from flask import current_app
 
-from app_name.util import constants
+from app_name.util import constants, outbound
+from app_name.util.cache import ExpiringValue
 from app_name.util.exceptions import FBAuthException
 
+# Graph API error codes meaning the access token we sent is invalid
+GRAPH_AUTH_ERROR_CODES = (102, 190)
+
+
 def get_access_token(app_id, app_secret):
     """
     Returns FB access_token
@@ -26,13 +31,14 @@ def get_access_token(app_id, app_secret):
 
     url = constants.FB_GRAPH_API_URL + endpoint
 
-    response = requests.get(url, params=params).json()
+    response = outbound.get(url, 'facebook.access_token', params=params).json()
 
     if response.get('access_token'):
         return response.get('access_token')
 
     if 'error' in response:
-        raise FBAuthException(response.get('error').get('message'))
+        raise FBAuthException(response.get('error').get('message'),
+                              response.get('error').get('code'))
 
 
 def debug_user_token(user_token, access_token):
@@ -50,13 +56,48 @@ def debug_user_token(user_token, access_token):
     }
 
     url = constants.FB_GRAPH_API_URL + endpoint
-    response = requests.get(url, params=params).json()
+    response = outbound.get(url, 'facebook.debug_token', params=params).json()
 
     if 'data' in response:
         return response.get('data')
 
     if 'error' in response:
-        raise FBAuthException(response.get('error').get('message'))
+        raise FBAuthException(response.get('error').get('message'),
+                              response.get('error').get('code'))
+
+
+def fetch_app_access_token():
+    """
+    Fetches the app access token for the configured Facebook app
+    :return: str
+    """
+    return get_access_token(app_id=current_app.config.get('FACEBOOK_APP_ID'),
+                            app_secret=current_app.config.get('FACEBOOK_APP_SECRET'))
+
+
+# The app token is long-lived, so it's fetched once per process rather than once per login
+app_access_token = ExpiringValue(fetch_app_access_token,
+                                 ttl=lambda: current_app.config.get('FACEBOOK_APP_TOKEN_TTL'))
+
+
+def debug_user_token_as_app(user_token):
+    """
+    Debugs a FB user token with the cached app access token
+    If Graph rejects the app token it's dropped from the cache and fetched again, once
+    :param user_token:
+    :return: dict
+    """
+    access_token = app_access_token.get()
+
+    try:
+        return debug_user_token(user_token, access_token)
+    except FBAuthException as e:
+        if e.code not in GRAPH_AUTH_ERROR_CODES:
+            raise
+
+        app_access_token.invalidate(access_token)
+
+        return debug_user_token(user_token, app_access_token.get())
 
 
 def verify_user_token(*args, **kwargs):
@@ -89,7 +130,7 @@ def get_long_lived_token(app_id, app_secret, short_lived_token):
 
     url = constants.FB_GRAPH_API_URL + endpoint
 
-    response = requests.get(url, params=params).json()
+    response = outbound.get(url, 'facebook.access_token', params=params).json()
 
     return response
 
@@ -107,6 +148,6 @@ def get_user_info(user_id, access_token):
     headers = {'Authorization': 'Bearer ' + access_token}
 
     url = constants.FB_GRAPH_API_URL + endpoint
-    response = requests.get(url, params=params, headers=headers).json()
+    response = outbound.get(url, 'facebook.user_info', params=params, headers=headers).json()
 
     return response
@@ -4,7 +4,7 @@ Facebook auth routes
 
 # pylint: disable=no-member,invalid-name
 
-from flask import request
+from flask import current_app, request
 from flask_jwt_extended import (
     create_access_token,
     create_refresh_token
@@ -12,19 +12,20 @@ from flask_jwt_extended import (
 
 from . import helpers as fb
 
-from app_name import app
+from app_name.auth import blueprint
 
 from app_name.auth.email.helpers import confirm_email
 
 from app_name.database import db
 
-from app_name.users.models import User
+from app_name.users.models import User, OAuthConnection, OAuthConnectionType
 
 from app_name.util import responses
+from app_name.util.concurrency import run_concurrently
 from app_name.util.exceptions import protect_500
 
 
-@app.route('/auth/signup/facebook', methods=['POST'])
+@blueprint.route('/auth/signup/facebook', methods=['POST'])
 @protect_500
 def signup_facebook():
     """
@@ -37,25 +38,23 @@ def signup_facebook():
         return responses.missing_params()
 
     user_token = request_json.get('user_token')
-    user_type = request_json.get('user_type') or app.config.get('DEFAULT_USER_TYPE')
+    user_type = request_json.get('user_type') or current_app.config.get('DEFAULT_USER_TYPE')
 
     if not all([user_token, user_type]):
         return responses.missing_params()
 
-    # Get the access token again?
-    access_token = fb.get_access_token(
-        app_id=app.config.get('FACEBOOK_APP_ID'),
-        app_secret=app.config.get('FACEBOOK_APP_SECRET')
+    # The profile is read with the user token itself, so it doesn't have to wait on the debug
+    # call for the user id -- the two ids are compared instead
+    token_info, fb_user_info = run_concurrently(
+        lambda: fb.debug_user_token_as_app(user_token),
+        lambda: fb.get_user_info('me', user_token)
     )
 
-    token_info = fb.debug_user_token(user_token, access_token)
+    fb_user_id = token_info.get('user_id')
 
-    if token_info.get('is_valid'):
+    if not token_info.get('is_valid') or fb_user_info.get('id') != fb_user_id:
         return responses.invalid_fb_token()
 
-    fb_user_id = token_info.get('user_id')
-    fb_user_info = fb.get_user_info(fb_user_id, user_token)
-
     # check that the user does not exist already in the database
     user_exists = db.session.query(
         db.exists().where(User.email == fb_user_info.get('email'))).scalar()
@@ -66,15 +65,23 @@ def signup_facebook():
     user = User(
         first_name=fb_user_info.get('first_name'),
         last_name=fb_user_info.get('last_name'),
-        email=fb_user_info.get('email'),
-        facebook_user_id=fb_user_id
+        email=fb_user_info.get('email')
     )
 
+    user.oauth_connections.append(OAuthConnection(
+        type=OAuthConnectionType.FACEBOOK,
+        email_address=fb_user_info.get('email'),
+        ext_user_id=fb_user_id,
+        ext_access_token=user_token
+    ))
+
     db.session.add(user)
-    db.session.commit()
+    db.session.flush()
+
+    # Sent by the outbox sender, committed together with the user
+    confirm_email(user)
 
-    if not app.config.get('TESTING'):
-        confirm_email(user)
+    db.session.commit()
 
     jwt_token = create_access_token(identity=user.id)
     refresh_token = create_refresh_token(identity=user.id)
@@ -82,8 +89,7 @@ def signup_facebook():
     return responses.user_created(jwt_token, refresh_token)
 
 
-
-@app.route('/auth/login/facebook', methods=['POST'])
+@blueprint.route('/auth/login/facebook', methods=['POST'])
 @protect_500
 def login_facebook():
     """
@@ -101,34 +107,34 @@ def login_facebook():
     if not user_token:
         return responses.missing_params()
 
-    # Get the access token again?
-    access_token = fb.get_access_token(
-        app_id=app.config.get('FACEBOOK_APP_ID'),
-        app_secret=app.config.get('FACEBOOK_APP_SECRET')
-    )
+    app_id = current_app.config.get('FACEBOOK_APP_ID')
+    app_secret = current_app.config.get('FACEBOOK_APP_SECRET')
 
-    token_info = fb.debug_user_token(user_token, access_token)
+    # Independent Graph calls, made at the same time
+    token_info, long_lived_token_data = run_concurrently(
+        lambda: fb.debug_user_token_as_app(user_token),
+        lambda: fb.get_long_lived_token(app_id=app_id, app_secret=app_secret,
+                                        short_lived_token=user_token)
+    )
 
     if not token_info.get('is_valid'):
         return responses.invalid_fb_token()
 
-    long_lived_token = fb.get_long_lived_token(
-        app_id=app.config.get('FACEBOOK_APP_ID'),
-        app_secret=app.config.get('FACEBOOK_APP_SECRET'),
-        short_lived_token=user_token
-    ).get('access_token')
+    long_lived_token = long_lived_token_data.get('access_token')
 
-    # get user id to look up in database?
-    facebook_user_id = token_info.get('user_id')
+    oauth_connection = OAuthConnection.query.filter_by(
+        type=OAuthConnectionType.FACEBOOK,
+        ext_user_id=token_info.get('user_id')
+    ).first()
 
-    user = User.query.filter_by(facebook_user_id=facebook_user_id)
-
-    if user is None:
+    if oauth_connection is None:
         return responses.user_not_found()
 
+    user = oauth_connection.owner
+
     # check if current user token is the same if not change it
-    if user.facebook_access_token != long_lived_token:
-        user.facebook_access_token = long_lived_token
+    if oauth_connection.ext_access_token != long_lived_token:
+        oauth_connection.ext_access_token = long_lived_token
 
         db.session.commit()
 
@@ -136,5 +142,4 @@ def login_facebook():
     jwt_token = create_access_token(identity=user.id)
     refresh_token = create_refresh_token(identity=user.id)
 
-    return responses.user_logged_in(jwt_token, refresh_token)
-
+    return responses.user_logged_in(jwt_token, refresh_token, user.id)
@@ -1,69 +1,156 @@
 """
 Helper functions for Google Auth
 """
-from pprint import pprint
-
+import jwt
 import requests
 
-from app_name import app
+from flask import current_app
+
+from . import keys
+
+from app_name.util import outbound
+from app_name.util.concurrency import run_concurrently
 
 GOOGLE_TOKEN_INFO_ENDPOINT = 'https://www.googleapis.com/oauth2/v3/tokeninfo'
 GOOGLE_OAUTH2_ENDPOINT = 'https://www.googleapis.com/oauth2/v4/token'
 
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+
+# Seconds of clock skew tolerated when checking an ID token's exp/iat
+ID_TOKEN_LEEWAY = 30
+
+
+def request_google_tokens(data):
+    """
+    Posts to Google's token endpoint
+    If Google's signing keys need fetching, they're fetched at the same time, since the
+    returned id_token is verified with them right after
+    :param data: dict
+    :return: requests.Response
+    """
+    def exchange():
+        return outbound.post(GOOGLE_OAUTH2_ENDPOINT, 'google.token', data=data)
+
+    if keys.key_cache.is_fresh():
+        return exchange()
+
+    response, _ = run_concurrently(exchange, keys.key_cache.prefetch)
+
+    return response
+
 
 def get_google_access_token(auth_code, redirect_uri):
     """
     Gets Google access & refresh tokens using authorization code
     :param auth_code: str
     :param redirect_uri: str
-    :return: google_access_token (str), google_refresh_token (str)
+    :return: token_data (dict), id_token_info (dict) -- or None, None if Google Auth failed
     """
     data = {
         'code': auth_code,
-        'client_id': app.config.get('GOOGLE_CLIENT_ID'),
-        'client_secret': app.config.get('GOOGLE_CLIENT_SECRET'),
+        'client_id': current_app.config.get('GOOGLE_CLIENT_ID'),
+        'client_secret': current_app.config.get('GOOGLE_CLIENT_SECRET'),
         'redirect_uri': redirect_uri,
         'grant_type': 'authorization_code'
     }
 
-    r = requests.post(GOOGLE_OAUTH2_ENDPOINT, data=data)
-
-    token_data = r.json()
+    r = request_google_tokens(data)
 
-    pprint(token_data)
+    if not r.ok:
+        return None, None
 
-    token_info = get_google_token_info(token_data.get('access_token'), 'access_token')
-
-    if r.ok and verify_google_access_token(token_data.get('access_token'), token_info):
-        return token_data, token_info
-
-    return None, None
+    return verify_google_token_data(r.json())
 
 
 def refresh_google_access_token(refresh_token):
     """
     Gets a new access token form Google
     :param refresh_token: str
-    :return: google_access_token (str)
+    :return: token_data (dict), id_token_info (dict) -- or None, None if Google Auth failed
     """
     data = {
         'refresh_token': refresh_token,
-        'client_id': app.config.get('GOOGLE_CLIENT_ID'),
-        'client_secret': app.config.get('GOOGLE_CLIENT_SECRET'),
+        'client_id': current_app.config.get('GOOGLE_CLIENT_ID'),
+        'client_secret': current_app.config.get('GOOGLE_CLIENT_SECRET'),
         'grant_type': 'refresh_token'
     }
 
-    r = requests.post(GOOGLE_OAUTH2_ENDPOINT, data=data)
+    r = request_google_tokens(data)
+
+    if not r.ok:
+        return None, None
+
+    return verify_google_token_data(r.json())
+
 
-    token_data = r.json()
-    token_info = get_google_token_info(token_data.get('access_token'), 'access_token')
+def verify_google_token_data(token_data):
+    """
+    Verifies the tokens returned by Google's token endpoint
+    The id_token is checked locally against Google's signing keys; since it proves the tokens
+    were issued to our client id, the access_token isn't introspected. Only when there's no
+    id_token, or Google's keys can't be fetched, do we fall back to the tokeninfo endpoint
+    :param token_data: dict
+    :return: token_data (dict), id_token_info (dict) -- or None, None if verification fails
+    """
+    id_token = token_data.get('id_token')
+
+    if id_token:
+        try:
+            id_token_info = verify_google_id_token(id_token)
+        except requests.RequestException:
+            id_token_info = get_google_token_info(id_token, 'id_token')
+
+            if not verify_google_audience(id_token_info):
+                return None, None
+
+        return (token_data, id_token_info) if id_token_info else (None, None)
 
-    if r.ok and verify_google_access_token(token_data.get('access_token'), token_info):
-        return token_data, token_info
+    access_token_info = get_google_token_info(token_data.get('access_token'), 'access_token')
+
+    if verify_google_access_token(token_data.get('access_token'), access_token_info):
+        return token_data, access_token_info
 
     return None, None
 
 
+def verify_google_id_token(id_token):
+    """
+    Verifies a Google ID token's signature, audience, issuer and expiry in-process
+    :param id_token: str
+    :return: dict of the token's claims, or None if the token is invalid
+    :raises requests.RequestException: if Google's signing keys couldn't be fetched
+    """
+    try:
+        kid = jwt.get_unverified_header(id_token).get('kid')
+    except jwt.InvalidTokenError:
+        return None
+
+    key = keys.key_cache.get_key(kid)
+
+    if key is None:
+        return None
+
+    try:
+        claims = jwt.decode(id_token, key, algorithms=['RS256'], leeway=ID_TOKEN_LEEWAY,
+                            audience=current_app.config.get('GOOGLE_CLIENT_ID'))
+    except jwt.InvalidTokenError:
+        return None
+
+    if claims.get('iss') not in GOOGLE_ISSUERS:
+        return None
+
+    return claims
+
+
+def verify_google_audience(token_info):
+    """
+    Checks that a tokeninfo response was issued to our client id
+    :param token_info: dict
+    :return: bool
+    """
+    return token_info.get('aud') == current_app.config.get('GOOGLE_CLIENT_ID')
+
+
 def verify_google_access_token(google_access_token, token_info=None):
     """
     Verifies the Google access token and
@@ -73,7 +160,7 @@ def verify_google_access_token(google_access_token, token_info=None):
     """
     token_info = token_info or get_google_token_info(google_access_token, 'access_token')
 
-    return token_info.get('aud') in app.config.get('GOOGLE_CLIENT_ID')
+    return token_info.get('aud') in current_app.config.get('GOOGLE_CLIENT_ID')
 
 
 def get_google_token_info(google_token, token_type):
@@ -85,6 +172,6 @@ def get_google_token_info(google_token, token_type):
     """
     params = {token_type: google_token}
 
-    r = requests.get(GOOGLE_TOKEN_INFO_ENDPOINT, params=params)
+    r = outbound.get(GOOGLE_TOKEN_INFO_ENDPOINT, 'google.tokeninfo', params=params)
 
     return r.json()
@@ -0,0 +1,176 @@
+"""
+Cache of Google's public ID token signing keys
+"""
+
+# pylint: disable=invalid-name
+
+import json
+import re
+import threading
+import time
+
+import requests
+
+from flask import current_app
+from jwt.algorithms import RSAAlgorithm
+
+from app_name.util import outbound
+from app_name.util.concurrency import run_in_app_context
+
+GOOGLE_CERTS_ENDPOINT = 'https://www.googleapis.com/oauth2/v3/certs'
+
+# Used when Google doesn't send a max-age
+DEFAULT_MAX_AGE = 60 * 60
+
+# Keys are refreshed in the background once they're this close to expiring
+REFRESH_MARGIN = 5 * 60
+
+# Minimum seconds between two fetches, so unknown key ids can't make us hammer Google
+MIN_REFRESH_INTERVAL = 30
+
+MAX_AGE_PATTERN = re.compile(r'max-age=(\d+)')
+
+
+def parse_max_age(headers):
+    """
+    Returns how long a response may be cached for, from its Cache-Control and Age headers
+    :param headers: dict
+    :return: int -- seconds
+    """
+    match = MAX_AGE_PATTERN.search(headers.get('Cache-Control', ''))
+
+    if not match:
+        return DEFAULT_MAX_AGE
+
+    try:
+        age = int(headers.get('Age', 0))
+    except ValueError:
+        age = 0
+
+    return max(int(match.group(1)) - age, 0)
+
+
+class GoogleKeyCache(object):
+    """
+    Google's JWKS signing keys, kept for as long as Google's cache headers allow
+    Keys close to expiring are refreshed by a background thread while the current ones keep
+    being served; requests only wait on Google when the cache is empty, expired, or missing
+    the key id a token was signed with
+    """
+    def __init__(self, url=GOOGLE_CERTS_ENDPOINT):
+        self.url = url
+
+        self.keys = {}
+        self.expires_at = 0
+        self.last_fetch_at = 0
+
+        self.lock = threading.Lock()
+        self.refreshing = False
+
+    def load(self, jwks, max_age):
+        """
+        Replaces the cached keys
+        :param jwks: dict -- JSON Web Key Set, {"keys": [...]}
+        :param max_age: int -- seconds the keys may be used for
+        :return:
+        """
+        self.keys = {jwk['kid']: RSAAlgorithm.from_jwk(json.dumps(jwk))
+                     for jwk in jwks.get('keys', []) if jwk.get('kty') == 'RSA'}
+        self.expires_at = time.time() + max_age
+
+    def fetch(self):
+        """
+        Fetches the current keys from Google
+        :return:
+        """
+        self.last_fetch_at = time.time()
+
+        r = outbound.get(self.url, 'google.certs')
+        r.raise_for_status()
+
+        self.load(r.json(), parse_max_age(r.headers))
+
+    def refresh(self, force=False):
+        """
+        Fetches the keys unless another thread just did
+        :param force: bool -- fetch even if the keys haven't expired
+        :return:
+        """
+        with self.lock:
+            now = time.time()
+
+            if not force and now < self.expires_at:
+                return
+
+            if self.keys and now - self.last_fetch_at < MIN_REFRESH_INTERVAL:
+                return
+
+            self.fetch()
+
+    def is_fresh(self):
+        """
+        Whether unexpired keys are loaded
+        :return: bool
+        """
+        return bool(self.keys) and time.time() < self.expires_at
+
+    def prefetch(self):
+        """
+        Loads the keys if they've expired, e.g. while the code exchange is in flight
+        Errors are ignored here -- get_key raises them when the keys are actually needed
+        :return:
+        """
+        if self.is_fresh():
+            return
+
+        try:
+            self.refresh()
+        except (requests.RequestException, ValueError):
+            pass
+
+    def refresh_in_background(self):
+        """
+        Starts a background refresh unless one is already running
+        :return:
+        """
+        with self.lock:
+            if self.refreshing or time.time() - self.last_fetch_at < MIN_REFRESH_INTERVAL:
+                return
+
+            self.refreshing = True
+
+        # The thread needs a context of the app to read its outbound HTTP settings
+        app = current_app._get_current_object()         # pylint: disable=protected-access
+
+        def run():
+            try:
+                run_in_app_context(app, lambda: self.refresh(force=True))
+            except (requests.RequestException, ValueError):
+                # Keep serving the current keys, a later call retries
+                pass
+            finally:
+                self.refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get_key(self, kid):
+        """
+        Returns the public key with the given key id
+        :param kid: str
+        :return: RSA public key or None if Google doesn't know the key id
+        :raises requests.RequestException: if the keys had to be fetched and couldn't be
+        """
+        now = time.time()
+
+        if now >= self.expires_at:
+            self.refresh()
+        elif kid not in self.keys:
+            # Google may have rotated its keys before ours expired
+            self.refresh(force=True)
+        elif self.expires_at - now < REFRESH_MARGIN:
+            self.refresh_in_background()
+
+        return self.keys.get(kid)
+
+
+key_cache = GoogleKeyCache()
@@ -4,26 +4,26 @@ Routes for Google Auth
 
 # pylint: disable=no-member,invalid-name
 
-from flask import request, jsonify
+from flask import request
 
 from flask_jwt_extended import (
     create_access_token,
     create_refresh_token
 )
 
-from .helpers import get_google_access_token, get_google_token_info
+from .helpers import get_google_access_token
 
-from app_name import app
+from app_name.auth import blueprint
 
 from app_name.database import db
 
-from app_name.util import responses, status
+from app_name.util import responses
 from app_name.util.exceptions import protect_500
 
 from app_name.users.models import User, OAuthConnection, OAuthConnectionType
 
 
-@app.route('/auth/google/signup', methods=['POST'])
+@blueprint.route('/auth/google/signup', methods=['POST'])
 @protect_500
 def signup_google():
     """
@@ -39,13 +39,12 @@ def signup_google():
 
     request_origin = request.environ.get('HTTP_ORIGIN')
 
-    token_data, access_token_info = get_google_access_token(auth_code=incoming.get('code'),
-                                                            redirect_uri=request_origin)
+    token_data, id_token_info = get_google_access_token(auth_code=incoming.get('code'),
+                                                        redirect_uri=request_origin)
 
-    if not token_data or not access_token_info:
-        return jsonify({'error': 'Google Auth failed...'}), status.UNPROCESSABLE_ENTITY
+    if not token_data or not id_token_info:
+        return responses.google_auth_failed()
 
-    id_token_info = get_google_token_info(token_data.get('id_token'), 'id_token')
     oauth_email = id_token_info.get('email')
 
     user = User(
@@ -74,7 +73,7 @@ def signup_google():
     return responses.user_logged_in(jwt_token, refresh_token, user.id, user_info=user_info)
 
 
-@app.route('/auth/google/login', methods=['POST'])
+@blueprint.route('/auth/google/login', methods=['POST'])
 @protect_500
 def login_google():
     """
@@ -90,13 +89,12 @@ def login_google():
 
     request_origin = request.environ.get('HTTP_ORIGIN')
 
-    token_data, access_token_info = get_google_access_token(auth_code=incoming.get('code'),
-                                                            redirect_uri=request_origin)
+    token_data, id_token_info = get_google_access_token(auth_code=incoming.get('code'),
+                                                        redirect_uri=request_origin)
 
-    if not token_data or not access_token_info:
-        return jsonify({'error': 'Google Auth failed...'}), status.UNPROCESSABLE_ENTITY
+    if not token_data or not id_token_info:
+        return responses.google_auth_failed()
 
-    id_token_info = get_google_token_info(token_data.get('id_token'), 'id_token')
     oauth_email = id_token_info.get('email')
 
     user = User.query.filter_by(email=oauth_email).first()
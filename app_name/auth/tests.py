@@ -4,15 +4,28 @@ Tests for User classes
 
 # pylint: disable=missing-docstring,invalid-name,no-member,attribute-defined-outside-init
 
+import threading
+import time
 import unittest
 import json
 
-from app_name.testing import AppTest
+import mock
+import requests
+
+from flask_security.confirmable import generate_confirmation_token
+
+from app_name.auth.facebook import helpers as fb
+from app_name.auth.google import keys
+from app_name.auth.google.keys import GoogleKeyCache, parse_max_age
+from app_name.testing import AppTest, get_app
+from app_name.testing.google import GoogleKeySet
+from app_name.users.models import User, OAuthConnection, OAuthConnectionType
+from app_name.util import outbound
 
 
 class RefreshTokenTests(AppTest):
     def test_refresh_token(self):
-        signup_response = self.client.post('/signup/email', data=json.dumps({
+        signup_response = self.client.post('/auth/signup/email', data=json.dumps({
             'email': 'me@johndoe.com',
             'password': 'pass12345',
             'first_name': 'John',
@@ -25,7 +38,282 @@ class RefreshTokenTests(AppTest):
             headers={'Authorization': 'Bearer {}'.format(signup_response.json['app_refresh_token'])}
         )
 
-        self.assertStatus(refresh_response, 201)
+        self.assertStatus(refresh_response, 200)
+
+
+class ConfirmEmailTest(AppTest):
+    def test_confirmation_link(self):
+        user = User(email='me@johndoe.com', first_name='John')
+        self.db.session.add(user)
+        self.db.session.commit()
+
+        response = self.client.get('/auth/confirm/{}'.format(generate_confirmation_token(user)))
+
+        self.assertStatus(response, 200)
+        self.assertIsNotNone(User.query.get(user.id).confirmed_at)
+
+    def test_invalid_confirmation_link(self):
+        self.assertStatus(self.client.get('/auth/confirm/not-a-token'), 404)
+
+
+def fake_response(json_data, status_code=200, headers=None):
+    response = mock.Mock(ok=status_code < 400, status_code=status_code, headers=headers or {})
+    response.json.return_value = json_data
+
+    if status_code >= 400:
+        response.raise_for_status.side_effect = requests.HTTPError(response=response)
+
+    return response
+
+
+class GoogleAuthTest(AppTest):
+    def setUp(self):
+        super().setUp()
+
+        self.app.config['GOOGLE_CLIENT_ID'] = 'client-id.apps.googleusercontent.com'
+
+        self.key_set = GoogleKeySet()
+        self.key_cache = GoogleKeyCache()
+        self.key_cache.load(self.key_set.jwks(), max_age=3600)
+
+        patcher = mock.patch.object(keys, 'key_cache', self.key_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User(email='me@johndoe.com')
+        self.db.session.add(self.user)
+        self.db.session.commit()
+
+    def login(self, id_token):
+        token_response = fake_response({'access_token': 'access', 'refresh_token': 'refresh',
+                                        'id_token': id_token})
+
+        with mock.patch('app_name.auth.google.helpers.outbound') as http:
+            http.post.return_value = token_response
+
+            response = self.client.post('/auth/google/login', data=json.dumps({'code': 'code'}),
+                                        content_type='application/json')
+
+        return response, http
+
+    def test_login_verifies_id_token_locally(self):
+        response, http = self.login(self.key_set.sign(self.app.config['GOOGLE_CLIENT_ID']))
+
+        self.assert200(response)
+        self.assertEqual(response.json['user_id'], self.user.id)
+
+        # Only the code exchange, no tokeninfo calls
+        self.assertEqual(http.post.call_count, 1)
+        self.assertEqual(http.get.call_count, 0)
+
+    def test_login_fetches_keys_during_code_exchange(self):
+        self.key_cache.keys, self.key_cache.expires_at = {}, 0
+        certs_response = fake_response(self.key_set.jwks(), headers={'Cache-Control': 'max-age=60'})
+
+        with mock.patch.object(keys.outbound, 'get', return_value=certs_response) as get_certs:
+            response, _ = self.login(self.key_set.sign(self.app.config['GOOGLE_CLIENT_ID']))
+
+        self.assert200(response)
+        self.assertEqual(get_certs.call_count, 1)
+        self.assertTrue(self.key_cache.is_fresh())
+
+    def test_login_rejects_wrong_audience(self):
+        response, _ = self.login(self.key_set.sign('someone-else.apps.googleusercontent.com'))
+
+        self.assertStatus(response, 422)
+
+    def test_login_rejects_unknown_signer(self):
+        response, _ = self.login(GoogleKeySet().sign(self.app.config['GOOGLE_CLIENT_ID']))
+
+        self.assertStatus(response, 422)
+
+    def test_login_rejects_expired_token(self):
+        response, _ = self.login(self.key_set.sign(self.app.config['GOOGLE_CLIENT_ID'],
+                                                   exp=1000, iat=0))
+
+        self.assertStatus(response, 422)
+
+
+class GoogleKeyCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.key_set = GoogleKeySet()
+        self.key_cache = GoogleKeyCache()
+
+    def test_parse_max_age(self):
+        self.assertEqual(parse_max_age({'Cache-Control': 'public, max-age=19204, must-revalidate',
+                                        'Age': '204'}), 19000)
+        self.assertEqual(parse_max_age({}), keys.DEFAULT_MAX_AGE)
+
+    def test_keys_cached_for_max_age(self):
+        response = fake_response(self.key_set.jwks(), headers={'Cache-Control': 'max-age=3600'})
+
+        with mock.patch.object(keys.outbound, 'get', return_value=response) as get:
+            self.assertIsNotNone(self.key_cache.get_key(self.key_set.kid))
+            self.assertIsNotNone(self.key_cache.get_key(self.key_set.kid))
+
+        self.assertEqual(get.call_count, 1)
+
+    def test_unknown_key_id_refetch_is_rate_limited(self):
+        response = fake_response(self.key_set.jwks(), headers={'Cache-Control': 'max-age=3600'})
+
+        with mock.patch.object(keys.outbound, 'get', return_value=response) as get:
+            self.assertIsNone(self.key_cache.get_key('rotated'))
+            self.assertIsNone(self.key_cache.get_key('rotated'))
+
+        self.assertEqual(get.call_count, 1)
+
+    def test_refreshes_in_background_before_expiry(self):
+        self.key_cache.load(self.key_set.jwks(), max_age=keys.REFRESH_MARGIN - 1)
+
+        with mock.patch.object(GoogleKeyCache, 'refresh_in_background') as refresh:
+            self.assertIsNotNone(self.key_cache.get_key(self.key_set.kid))
+
+        refresh.assert_called_once_with()
+
+    def test_background_refresh_runs_in_app_context(self):
+        response = fake_response(self.key_set.jwks(), headers={'Cache-Control': 'max-age=3600'})
+        # Reads its timeout from the app, and fails outside of an app context
+        get = mock.Mock(side_effect=lambda url, endpoint: outbound.get_timeout(endpoint) and
+                        response)
+
+        with mock.patch.object(keys.outbound, 'get', get), get_app().app_context():
+            self.key_cache.refresh_in_background()
+
+        for _ in range(50):
+            if not self.key_cache.refreshing:
+                break
+            time.sleep(0.01)
+
+        self.assertIn(self.key_set.kid, self.key_cache.keys)
+
+
+class FacebookAppTokenTest(AppTest):
+    def setUp(self):
+        super().setUp()
+
+        fb.app_access_token.invalidate()
+        self.addCleanup(fb.app_access_token.invalidate)
+
+    def test_app_token_fetched_once(self):
+        responses = {
+            'facebook.access_token': fake_response({'access_token': 'app-token'}),
+            'facebook.debug_token': fake_response({'data': {'is_valid': True}})
+        }
+
+        with mock.patch.object(fb.outbound, 'get',
+                               side_effect=lambda url, endpoint, **kwargs: responses[endpoint]) \
+                as get:
+            for _ in range(3):
+                self.assertTrue(fb.debug_user_token_as_app('user-token')['is_valid'])
+
+        endpoints = [call[0][1] for call in get.call_args_list]
+        self.assertEqual(endpoints.count('facebook.access_token'), 1)
+        self.assertEqual(endpoints.count('facebook.debug_token'), 3)
+
+    def test_concurrent_callers_share_one_fetch(self):
+        fetches = []
+
+        def slow_fetch():
+            fetches.append(1)
+            time.sleep(0.1)
+            return 'app-token'
+
+        def get_token():
+            with self.app.app_context():
+                fb.app_access_token.get()
+
+        with mock.patch.object(fb.app_access_token, 'fetch', slow_fetch):
+            threads = [threading.Thread(target=get_token) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(fetches), 1)
+
+    def test_graph_auth_error_invalidates_app_token(self):
+        tokens = iter(['expired-token', 'new-token'])
+
+        def get(url, endpoint, **kwargs):
+            if endpoint == 'facebook.access_token':
+                return fake_response({'access_token': next(tokens)})
+
+            if kwargs['params']['access_token'] == 'expired-token':
+                return fake_response({'error': {'message': 'Session expired', 'code': 190}})
+
+            return fake_response({'data': {'is_valid': True}})
+
+        with mock.patch.object(fb.outbound, 'get', side_effect=get):
+            self.assertTrue(fb.debug_user_token_as_app('user-token')['is_valid'])
+
+        self.assertEqual(fb.app_access_token.get(), 'new-token')
+
+
+class FacebookAuthTest(AppTest):
+    GRAPH_LATENCY = 0.2
+
+    def setUp(self):
+        super().setUp()
+
+        fb.app_access_token.invalidate()
+        self.addCleanup(fb.app_access_token.invalidate)
+
+        # The app token is cached, so only the per-login calls are timed
+        fb.app_access_token.value, fb.app_access_token.expires_at = 'app-token', time.time() + 60
+
+        patcher = mock.patch.object(fb.outbound, 'get', side_effect=self.fake_graph)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_graph(self, url, endpoint, **kwargs):
+        time.sleep(self.GRAPH_LATENCY)
+
+        if endpoint == 'facebook.debug_token':
+            return fake_response({'data': {'is_valid': True, 'user_id': '42'}})
+
+        if endpoint == 'facebook.user_info':
+            return fake_response({'id': '42', 'first_name': 'John', 'last_name': 'Doe',
+                                  'email': 'me@johndoe.com'})
+
+        return fake_response({'access_token': 'long-lived-token'})
+
+    def post(self, url):
+        start = time.perf_counter()
+        response = self.client.post(url, data=json.dumps({'user_token': 'user-token',
+                                                          'user_type': 'user'}),
+                                    content_type='application/json')
+
+        return response, time.perf_counter() - start
+
+    def test_signup_then_login(self):
+        response, _ = self.post('/auth/signup/facebook')
+
+        self.assertStatus(response, 201)
+
+        connection = OAuthConnection.query.one()
+        self.assertEqual(connection.type, OAuthConnectionType.FACEBOOK)
+        self.assertEqual(connection.ext_user_id, '42')
+        self.assertEqual(connection.owner.email, 'me@johndoe.com')
+
+        response, elapsed = self.post('/auth/login/facebook')
+
+        self.assert200(response)
+        self.assertEqual(response.json['user_id'], connection.owner_id)
+        # Debug and long-lived token calls overlap
+        self.assertLess(elapsed, 2 * self.GRAPH_LATENCY)
+        self.assertEqual(connection.ext_access_token, 'long-lived-token')
+
+    def test_login_unknown_user(self):
+        response, _ = self.post('/auth/login/facebook')
+
+        self.assert404(response)
+
+    def test_deadline(self):
+        self.app.config['CONCURRENT_CALLS_TIMEOUT'] = self.GRAPH_LATENCY / 2
+
+        response, _ = self.post('/auth/login/facebook')
+
+        self.assertStatus(response, 504)
 
 
 if __name__ == '__main__':
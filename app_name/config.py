@@ -2,14 +2,54 @@
 Configurations for various environments
 """
 import os
+import tempfile
 
 # pylint: disable=too-few-public-methods
 
 
+def engine_options(database_uri, pool_size=5, max_overflow=5, pool_timeout=10,
+                   pool_recycle=1800, statement_timeout=None):
+    """
+    Builds SQLALCHEMY_ENGINE_OPTIONS for a database
+    Connections are pinged before being handed out and recycled before the server or a proxy
+    drops them for being idle. SQLite databases don't pool connections, so only get pre_ping
+    :param database_uri: str
+    :param pool_size: int -- connections kept open per process
+    :param max_overflow: int -- extra connections opened under load, closed once returned
+    :param pool_timeout: int -- seconds to wait for a connection before giving up
+    :param pool_recycle: int -- seconds after which a connection is reopened
+    :param statement_timeout: int -- milliseconds, Postgres only
+    :return: dict
+    """
+    options = {'pool_pre_ping': True}
+
+    if database_uri.startswith('sqlite'):
+        return options
+
+    options.update({
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': pool_recycle,
+        # Reuse the most recently returned connection, so the surplus goes idle and is recycled
+        'pool_use_lifo': True,
+    })
+
+    if statement_timeout and database_uri.startswith('postgres'):
+        options['connect_args'] = {'options': '-c statement_timeout={}'.format(statement_timeout)}
+
+    return options
+
+
 class Config(object):
     """
     Base Config class
     """
+    # Optional subsystems served, see create_app. A worker serving only the API, e.g.
+    # BLUEPRINTS=auth,users,resources, never loads Flask-Admin
+    BLUEPRINTS = tuple(filter(None, os.getenv('BLUEPRINTS', 'auth,users,resources,admin')
+                              .replace(' ', '').split(',')))
+
     CORS_HEADERS = 'Content-Type'
 
     SECURITY_URL_PREFIX = "/admin"
@@ -34,10 +74,77 @@ class Config(object):
         or os.getenv('SQLALCHEMY_DATABASE_URI') \
         or 'sqlite:///local.db'
 
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, statement_timeout=30000)
+
+    # Optional read replica for GET requests, see database/routing.py
+    REPLICA_DATABASE_URL = os.getenv('REPLICA_DATABASE_URL')
+    SQLALCHEMY_BINDS = {'replica': REPLICA_DATABASE_URL} if REPLICA_DATABASE_URL else {}
+    REPLICA_HEALTH_INTERVAL = 5
+    REPLICA_MAX_LAG = 10
+    REPLICA_STICKY_SECONDS = 10
+    # Flask-Security's GET views of the admin panel write, e.g. its logout
+    REPLICA_EXCLUDED_BLUEPRINTS = {'security'}
+
+    # Pool of each gevent worker, shared by the requests it serves at once (see
+    # util/cooperative.py). Most of them wait on a provider without a connection checked out
+    DB_GREENLET_POOL_SIZE = int(os.getenv('DB_GREENLET_POOL_SIZE', '10'))
+    DB_GREENLET_MAX_OVERFLOW = int(os.getenv('DB_GREENLET_MAX_OVERFLOW', '5'))
+
+    # Where each worker writes its connection pool stats for `flask db-pool-stats`
+    DB_POOL_STATS_DIR = os.getenv('DB_POOL_STATS_DIR') or \
+        os.path.join(tempfile.gettempdir(), 'app_name-db-pool')
+    DB_POOL_STATS_INTERVAL = 5
+
+    # X-Query-Count and Server-Timing headers, and N+1 warnings, see util/queries.py
+    QUERY_DEBUG_HEADERS = False
+    # A statement run this many times in a request with different parameters is an N+1
+    QUERY_REPEAT_THRESHOLD = 3
+
+    # Request metrics served at /internal/metrics, see util/metrics.py
+    METRICS_ENABLED = True
+    METRICS_DIR = os.getenv('METRICS_DIR') or \
+        os.path.join(tempfile.gettempdir(), 'app_name-metrics')
+    METRICS_WRITE_INTERVAL = 5
+    METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    # Bearer token the scraper sends, without one metrics are only served under TESTING and LOCAL
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+    API_DEFAULT_PAGE_SIZE = 50
+    API_MAX_PAGE_SIZE = 200
+
+    STREAM_BATCH_SIZE = 1000
+    STREAM_CHUNK_SIZE = 16 * 1024
+
+    # Response compression, see util/compression.py
+    COMPRESS_ENABLED = True
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_LEVEL = 6
+    COMPRESS_BR_LEVEL = 4
+    COMPRESS_STREAMS = True
+    COMPRESS_MIMETYPES = {'application/json', 'text/html', 'text/css', 'text/plain',
+                          'text/javascript', 'application/javascript', 'image/svg+xml'}
+    COMPRESS_STATIC_EXTENSIONS = {'.js', '.css', '.html', '.json', '.svg', '.txt', '.map'}
+
+    # JSON encoder of API responses: 'auto' (orjson if installed), 'orjson' or 'json'
+    JSON_BACKEND = os.environ.get('JSON_BACKEND', 'auto')
+
+    USERS_BATCH_MAX_IDS = 250
+
+    # Per-process LRU of user rows read by GET /users/me, 0 disables it. A change is only
+    # invalidated in the worker that made it, other workers may serve the old row for up to
+    # USER_CACHE_TTL seconds. Authorization checks (active, is_admin, password) never use it
+    USER_CACHE_SIZE = 1000
+    USER_CACHE_TTL = 30
+
+    PASSWORD_HASH_POOL_SIZE = int(os.getenv('PASSWORD_HASH_POOL_SIZE', '2'))
+    PASSWORD_HASH_QUEUE_DEPTH = 16
+    PASSWORD_HASH_TIMEOUT = 10
+
     SUPERUSER_EMAIL = 'lol'
 
     FACEBOOK_APP_ID = 'lol'
     FACEBOOK_APP_SECRET = 'lol'
+    FACEBOOK_APP_TOKEN_TTL = 24 * 60 * 60
 
     MAIL_DEFAULT_SENDER = ''
     MAIL_SERVER = ''
@@ -47,9 +154,38 @@ class Config(object):
     MAIL_USERNAME = ''
     MAIL_PASSWORD = ''
 
+    OUTBOX_BATCH_SIZE = 50
+    OUTBOX_MAX_ATTEMPTS = 8
+    OUTBOX_RETRY_BACKOFF = 30
+    OUTBOX_RETRY_BACKOFF_MAX = 60 * 60
+    OUTBOX_POLL_INTERVAL = 5
+
     GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
     GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET')
 
+    # Shared executor fanning out independent provider calls, and their overall deadline
+    CONCURRENT_CALLS_MAX_WORKERS = 8
+    # Under gevent the executor's threads are greenlets, cheap enough for every login at once
+    CONCURRENT_CALLS_MAX_GREENLETS = 200
+    CONCURRENT_CALLS_TIMEOUT = 15
+
+    OUTBOUND_HTTP_POOL_HOSTS = 10
+    OUTBOUND_HTTP_POOL_SIZE = 10
+    # Connections kept per host under gevent, where that many calls can be in flight
+    OUTBOUND_HTTP_GREENLET_POOL_SIZE = 100
+    OUTBOUND_HTTP_RETRIES = 2
+    OUTBOUND_HTTP_RETRY_BACKOFF = 0.2
+    # (connect, read) timeouts in seconds, per endpoint with a default
+    OUTBOUND_HTTP_TIMEOUT = (3.05, 10)
+    OUTBOUND_HTTP_TIMEOUTS = {
+        'google.token': (3.05, 10),
+        'google.tokeninfo': (3.05, 5),
+        'google.certs': (3.05, 5),
+        'facebook.access_token': (3.05, 5),
+        'facebook.debug_token': (3.05, 5),
+        'facebook.user_info': (3.05, 5),
+    }
+
 
 class ProductionConfig(Config):
     """
@@ -66,6 +202,17 @@ class ProductionConfig(Config):
 
     PORT = 80
 
+    # Every web worker and the mailer get their own pool: keep
+    # processes * (DB_POOL_SIZE + DB_MAX_OVERFLOW) under the server's max_connections
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(
+        Config.SQLALCHEMY_DATABASE_URI,
+        pool_size=int(os.getenv('DB_POOL_SIZE', 4)),
+        max_overflow=int(os.getenv('DB_MAX_OVERFLOW', 2)),
+        pool_timeout=int(os.getenv('DB_POOL_TIMEOUT', 5)),
+        pool_recycle=int(os.getenv('DB_POOL_RECYCLE', 300)),
+        statement_timeout=int(os.getenv('DB_STATEMENT_TIMEOUT', 15000))
+    )
+
 
 class DevelopmentConfig(Config):
     """
@@ -82,6 +229,11 @@ class DevelopmentConfig(Config):
 
     PORT = 5000
 
+    QUERY_DEBUG_HEADERS = True
+
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(Config.SQLALCHEMY_DATABASE_URI, pool_size=2,
+                                               max_overflow=2, statement_timeout=60000)
+
 
 class LocalConfig(DevelopmentConfig):
     """
@@ -102,7 +254,12 @@ class TestingConfig(DevelopmentConfig):
 
     PRESERVE_CONTEXT_ON_EXCEPTION = False
 
+    PASSWORD_HASH_POOL_SIZE = 0
+
+    USER_CACHE_SIZE = 0
+
     SQLALCHEMY_DATABASE_URI = 'sqlite:///testing.db'
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
 
 
 CONFIGS = {
@@ -116,10 +273,11 @@ CONFIGS = {
 ENVIRONMENT = os.getenv('ENVIRONMENT', 'LOCAL')
 
 
-def get_config():
+def get_config(environment=None):
     """
-    Gets the config type set by environment variable
+    Gets the config type of an environment, the one set by environment variable by default
+    :param environment: str -- e.g. 'TESTING'
     :return: config object
     """
 
-    return 'app_name.config.' + CONFIGS.get(ENVIRONMENT)
+    return 'app_name.config.' + CONFIGS.get(environment or ENVIRONMENT)
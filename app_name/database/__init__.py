@@ -2,31 +2,170 @@
 Initializes database
 """
 
-# pylint: disable=invalid-name,no-member
+# pylint: disable=invalid-name,no-member,global-statement,unused-argument
 
-from flask_sqlalchemy import SQLAlchemy
+import time
+
+from flask import current_app, request
 from flask_migrate import Migrate
 
-from app_name import app
+from app_name.util import cooperative
+
+from .pool import TimedQueuePool, get_pool_stats, write_pool_stats
+from .routing import RoutingSQLAlchemy, USE_REPLICA, WROTE, has_replica
+
+db = RoutingSQLAlchemy()
+
+migrate = Migrate()
+
+READ_METHODS = frozenset(['GET', 'HEAD'])
+
+# Set on responses to writes, holds the time until which the client reads from the primary
+PRIMARY_COOKIE = 'read_primary_until'
+
+# When this process last wrote its pool stats
+_pool_stats_written_at = 0
+
+
+def save_pool_stats(response):
+    """
+    Writes this worker's pool stats for `flask db-pool-stats` at most every
+    DB_POOL_STATS_INTERVAL seconds
+    :param response: Response
+    :return: Response
+    """
+    global _pool_stats_written_at
+
+    now = time.time()
+
+    if now - _pool_stats_written_at >= current_app.config.get('DB_POOL_STATS_INTERVAL'):
+        _pool_stats_written_at = now
+
+        try:
+            write_pool_stats(get_pool_stats(db.engine), current_app.config.get('DB_POOL_STATS_DIR'))
+        except OSError:
+            current_app.logger.exception('Could not write the connection pool stats')
+
+    return response
+
+
+def read_primary_until():
+    """
+    Returns until when the requester must read its own writes from the primary
+    :return: float -- timestamp, 0 if the request didn't carry PRIMARY_COOKIE
+    """
+    try:
+        return float(request.cookies.get(PRIMARY_COOKIE, 0))
+    except ValueError:
+        return 0
+
+
+def route_reads_to_replica():
+    """
+    Lets GET/HEAD requests read from the replica, unless the view is marked
+    reads_from_primary or the client wrote something less than REPLICA_STICKY_SECONDS ago
+    :return:
+    """
+    if not has_replica(current_app) or request.method not in READ_METHODS:
+        return
+
+    if request.blueprint in current_app.config.get('REPLICA_EXCLUDED_BLUEPRINTS'):
+        return
+
+    view = current_app.view_functions.get(request.endpoint)
+
+    if view is None or getattr(view, 'reads_from_primary', False):
+        return
 
-db = SQLAlchemy(app)
+    if read_primary_until() > time.time():
+        return
 
-migrate = Migrate(app, db)
+    db.session.info[USE_REPLICA] = True
 
 
-def clean_db():
+def remember_writes(response):
+    """
+    After a successful write, has the client read from the primary for REPLICA_STICKY_SECONDS
+    so it sees its own write however far the replica lags
+    :param response: Response
+    :return: Response
+    """
+    sticky_seconds = current_app.config.get('REPLICA_STICKY_SECONDS')
+
+    if has_replica(current_app) and sticky_seconds and request.method not in READ_METHODS and \
+            response.status_code < 400:
+        response.set_cookie(PRIMARY_COOKIE, str(time.time() + sticky_seconds),
+                            max_age=sticky_seconds, httponly=True)
+
+    return response
+
+
+def stop_routing(exc):
+    """
+    The session can outlive the request, e.g. in tests, so routing flags don't
+    :param exc: Exception or None
+    :return:
+    """
+    db.session.info.pop(USE_REPLICA, None)
+    db.session.info.pop(WROTE, None)
+
+
+def init_app(app):
+    """
+    Binds the database to the app and registers the request hooks routing reads to the replica
+    :param app: Flask
+    :return:
+    """
+    database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+
+    # SQLite doesn't pool connections, every other database gets an instrumented QueuePool
+    if not database_uri.startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(
+            app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}, poolclass=TimedQueuePool)
+
+        # A gevent worker's requests share its pool, see DB_GREENLET_POOL_SIZE
+        if cooperative.is_cooperative():
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'].update(
+                pool_size=app.config.get('DB_GREENLET_POOL_SIZE'),
+                max_overflow=app.config.get('DB_GREENLET_MAX_OVERFLOW'))
+
+            if database_uri.startswith('postgres'):
+                cooperative.patch_psycopg()
+
+    db.init_app(app)
+    migrate.init_app(app, db)
+
+    app.after_request(save_pool_stats)
+    app.before_request(route_reads_to_replica)
+    app.after_request(remember_writes)
+    app.teardown_request(stop_routing)
+
+
+def dispose_engines(app):
+    """
+    Closes the pooled connections of the app's engines, the replica's included
+    A process forked afterwards opens its own instead of sharing the parent's sockets
+    :param app: Flask
+    :return:
+    """
+    for bind in [None] + list(app.config.get('SQLALCHEMY_BINDS') or {}):
+        db.get_engine(app, bind=bind).dispose()
+
+
+def clean_db(app):
     """
     Initializes clean database
+    :param app: Flask
     """
     print('Cleaning database...')
 
     from app_name.users.models import User, Role        # pylint: disable=cyclic-import
 
-    db.reflect()
-    db.drop_all()
-    db.create_all()
-
     with app.app_context():
+        db.reflect()
+        db.drop_all()
+        db.create_all()
+
         user_role = Role.query.filter_by(name='user').first()
         if not user_role:
             user_role = Role(name='user')
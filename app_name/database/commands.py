@@ -0,0 +1,68 @@
+"""
+CLI commands for the database
+"""
+import time
+
+import click
+
+from flask import current_app
+from flask.cli import with_appcontext
+
+from . import db
+from .pool import read_pool_stats
+from .seed import seed
+
+COLUMNS = ('pid', 'size', 'checked_out', 'idle', 'overflow', 'checkouts', 'timeouts',
+           'avg_wait_ms', 'max_wait_ms')
+
+
+@click.command('db-pool-stats')
+@with_appcontext
+def db_pool_stats():
+    """
+    Prints the connection pool stats last written by each running worker
+    """
+    all_stats = read_pool_stats(current_app.config.get('DB_POOL_STATS_DIR'))
+
+    if not all_stats:
+        click.echo('No pool stats written yet')
+        return
+
+    click.echo(' '.join('{:>12}'.format(column) for column in COLUMNS + ('age_s',)))
+
+    for stats in all_stats:
+        values = [stats.get(column, '-') for column in COLUMNS]
+        values.append(time.time() - stats['time'])
+
+        click.echo(' '.join('{:>12.2f}'.format(value) if isinstance(value, float)
+                            else '{:>12}'.format(value) for value in values))
+
+
+@click.command('seed')
+@click.option('--users', type=int, default=1000, help='Users to create')
+@click.option('--resources', type=int, default=None,
+              help='Resource A\'s to create, as many as users by default')
+@click.option('--children', type=float, default=3.0, help='Mean resource B\'s per resource A')
+@click.option('--seed', 'seed_value', type=int, default=0,
+              help='Seed of the generator, the same seed gives the same rows')
+@click.option('--reset', is_flag=True, help='Drop and recreate every table first')
+@click.option('--force', is_flag=True, help='Seed even a production database')
+@with_appcontext
+def seed_command(users, resources, children, seed_value, reset, force):
+    """
+    Bulk generates users, OAuth connections, resource A's and resource B's
+    """
+    if current_app.config.get('PRODUCTION') and not force:
+        raise click.UsageError('Refusing to seed a production database without --force')
+
+    if reset:
+        click.confirm('Drop every table of {!r} and recreate them?'.format(db.engine.url),
+                      abort=True)
+
+    start = time.perf_counter()
+
+    counts = seed(users, resources=resources, children=children, seed_value=seed_value,
+                  reset=reset, echo=click.echo, force=force)
+
+    click.echo('Seeded {} rows in {:.1f}s'.format(sum(counts.values()),
+                                                 time.perf_counter() - start))
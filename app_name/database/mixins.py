@@ -0,0 +1,140 @@
+"""
+Reusable model mixins
+"""
+
+# pylint: disable=no-member
+
+from sqlalchemy import event
+from sqlalchemy.ext import baked
+from sqlalchemy.orm import Session, configure_mappers
+from sqlalchemy.sql.expression import and_, bindparam
+
+from app_name.database import db
+
+# Compiled SQL for every (model, filtered attributes) shape used so far
+bakery = baked.bakery(size=500)
+
+
+class AttrFilterMixin(object):
+    """
+    Lets a model be filtered by attribute name/value pairs, e.g. User.filter_by_attrs(email=...)
+    The attribute names are looked up in a registry of the model's columns built once when its
+    mapper is configured, and the query for each set of attribute names is compiled only once
+    """
+    __filter_columns__ = None
+    __filter_queries__ = None
+
+    @classmethod
+    def filter_columns(cls):
+        """
+        Returns the registry of the model's filterable columns
+        :return: dict of attribute name -> column attribute
+        """
+        if cls.__filter_columns__ is None:
+            configure_mappers()
+
+        return cls.__filter_columns__
+
+    @classmethod
+    def _baked_filter_query(cls, names, null_names, has_limit, has_offset):
+        """
+        Returns the baked query filtering on the given attribute names, building it on first use
+        :param names: tuple of attribute names compared against bound values
+        :param null_names: tuple of attribute names that must be NULL
+        :param has_limit: bool -- whether a limit is bound
+        :param has_offset: bool -- whether an offset is bound
+        :return: BakedQuery
+        """
+        key = (names, null_names, has_limit, has_offset)
+        baked_query = cls.__filter_queries__.get(key)
+
+        if baked_query is not None:
+            return baked_query
+
+        columns = cls.filter_columns()
+
+        filters = [columns[name] == bindparam(name) for name in names]
+        filters.extend(columns[name].is_(None) for name in null_names)
+
+        baked_query = bakery(lambda session: session.query(cls), cls.__name__, *key)
+        baked_query += lambda query: query.filter(and_(*filters))
+
+        if has_limit:
+            baked_query += lambda query: query.limit(bindparam('_limit'))
+
+        if has_offset:
+            baked_query += lambda query: query.offset(bindparam('_offset'))
+
+        cls.__filter_queries__[key] = baked_query
+
+        return baked_query
+
+    @classmethod
+    def filter_by_attrs(cls, get_all=False, limit=None, offset=None, **attrs):
+        """
+        Filters the model by provided attributes
+        Provided attributes must be columns of the model
+        :param get_all: bool -- return every match instead of the first one
+        :param limit: int -- only used with get_all
+        :param offset: int -- only used with get_all
+        :param attrs: dict
+        :return: model instance, list of model instances or None if an attribute isn't a column
+        """
+        columns = cls.filter_columns()
+
+        if not all(attr in columns for attr in attrs):
+            return None
+
+        names = tuple(sorted(attr for attr, value in attrs.items() if value is not None))
+        null_names = tuple(sorted(attr for attr, value in attrs.items() if value is None))
+        has_limit = get_all and limit is not None
+        has_offset = get_all and offset is not None
+
+        params = {name: attrs[name] for name in names}
+
+        if has_limit:
+            params['_limit'] = limit
+
+        if has_offset:
+            params['_offset'] = offset
+
+        baked_query = cls._baked_filter_query(names, null_names, has_limit, has_offset)
+        query = baked_query(db.session()).params(**params)
+
+        return query.all() if get_all else query.first()
+
+
+@event.listens_for(AttrFilterMixin, 'mapper_configured', propagate=True)
+def build_filter_registry(mapper, cls):
+    """
+    Maps each column attribute name of a newly configured model to its column
+    :param mapper: Mapper
+    :param cls: model class
+    :return:
+    """
+    cls.__filter_columns__ = {attr.key: getattr(cls, attr.key) for attr in mapper.column_attrs}
+    cls.__filter_queries__ = {}
+
+
+class VersionMixin(object):
+    """
+    Adds a version column incremented by every UPDATE of the row
+    The version is what a row's ETag is derived from, so it's bumped by the database itself:
+    two concurrent updates can never end up with the same version
+    """
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+
+@event.listens_for(VersionMixin, 'before_update', propagate=True)
+def increment_version(mapper, connection, target):
+    """
+    Bumps the version of rows with column changes
+    :param mapper: Mapper
+    :param connection: Connection
+    :param target: model instance
+    :return:
+    """
+    session = Session.object_session(target)
+
+    if session is not None and session.is_modified(target, include_collections=False):
+        target.version = type(target).version + 1
@@ -0,0 +1,156 @@
+"""
+Connection pool instrumentation
+Each process reports its own pool: how many connections are checked out, idle and in overflow,
+and how long requests waited to get one. Workers write their stats to a shared directory so
+one command can show every worker of the server
+"""
+import json
+import os
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool recording how long each checkout waited for a connection
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.record_wait(time.perf_counter() - start, timed_out)
+
+    def record_wait(self, wait, timed_out):
+        """
+        Adds one checkout to the wait stats
+        :param wait: float -- seconds
+        :param timed_out: bool
+        :return:
+        """
+        with self.stats_lock:
+            self.checkouts += 1
+            self.timeouts += int(timed_out)
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def wait_stats(self):
+        """
+        :return: dict
+        """
+        with self.stats_lock:
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'avg_wait_ms': self.total_wait / self.checkouts * 1000 if self.checkouts else 0.0,
+                'max_wait_ms': self.max_wait * 1000,
+            }
+
+
+def get_pool_stats(engine):
+    """
+    Returns the state of an engine's pool in this process
+    :param engine: Engine
+    :return: dict
+    """
+    pool = engine.pool
+    stats = {'pid': os.getpid(), 'pool': type(pool).__name__, 'time': time.time()}
+
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'idle': pool.checkedin(),
+            # QueuePool counts up from -size, so this is only positive once overflowing
+            'overflow': max(pool.overflow(), 0),
+        })
+
+    if isinstance(pool, TimedQueuePool):
+        stats.update(pool.wait_stats())
+
+    return stats
+
+
+def write_pool_stats(stats, directory):
+    """
+    Saves a process' pool stats as <directory>/<pid>.json
+    :param stats: dict returned by get_pool_stats
+    :param directory: str
+    :return:
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    path = os.path.join(directory, '{}.json'.format(stats['pid']))
+    tmp_path = path + '.tmp'
+
+    with open(tmp_path, 'w') as f:
+        json.dump(stats, f)
+
+    # Readers never see a half written file
+    os.replace(tmp_path, path)
+
+
+def is_running(pid):
+    """
+    :param pid: int
+    :return: bool
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+def read_pool_stats(directory):
+    """
+    Returns the last stats written by every process still running, removing those of dead ones
+    :param directory: str
+    :return: list of dict, ordered by pid
+    """
+    if not os.path.isdir(directory):
+        return []
+
+    all_stats = []
+
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json'):
+            continue
+
+        path = os.path.join(directory, filename)
+
+        try:
+            with open(path) as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            continue
+
+        if is_running(stats['pid']):
+            all_stats.append(stats)
+            continue
+
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    return sorted(all_stats, key=lambda stats: stats['pid'])
@@ -0,0 +1,207 @@
+"""
+Routing of read-only requests to a read replica
+When a 'replica' bind is configured, the session of a GET/HEAD request reads from it until the
+request writes anything, then sticks to the primary. Writes, SELECT ... FOR UPDATE, views marked
+with reads_from_primary and clients that just wrote always use the primary, and so does every
+request while the replica fails its health check
+"""
+
+# pylint: disable=invalid-name,global-statement,protected-access,unused-argument
+
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, exc, orm
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND = 'replica'
+
+# session.info keys
+USE_REPLICA = 'use_replica'
+WROTE = 'wrote'
+
+# Per process state -- reset whenever the pid changes, i.e. after a fork
+_health = {'pid': None, 'healthy': True, 'checked_at': 0}
+_health_lock = threading.Lock()
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session sending reads to the replica bind when its request allows it
+    """
+    def use_replica(self, clause=None):
+        """
+        Whether the next statement can be answered by the replica
+        :param clause: statement about to be executed, if known
+        :return: bool
+        """
+        if not self.info.get(USE_REPLICA) or self.info.get(WROTE) or self._flushing:
+            return False
+
+        if isinstance(clause, UpdateBase) or getattr(clause, '_for_update_arg', None):
+            return False
+
+        return is_replica_healthy(self.app)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.use_replica(clause):
+            return get_replica_engine(self.app)
+
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """
+    SQLAlchemy whose sessions route reads to the replica bind
+    """
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def stick_to_primary(session, flush_context):
+    """
+    Once a session writes, the rest of its reads must see the write
+    :param session: RoutingSession
+    :param flush_context: UOWTransaction
+    :return:
+    """
+    session.info[WROTE] = True
+
+
+@event.listens_for(RoutingSession, 'after_bulk_update')
+@event.listens_for(RoutingSession, 'after_bulk_delete')
+def stick_to_primary_after_bulk(context):
+    """
+    Same as stick_to_primary, for Query.update() and Query.delete()
+    :param context: BulkUpdate or BulkDelete
+    :return:
+    """
+    context.session.info[WROTE] = True
+
+
+def has_replica(app):
+    """
+    :param app: Flask
+    :return: bool
+    """
+    return REPLICA_BIND in (app.config.get('SQLALCHEMY_BINDS') or {})
+
+
+def get_replica_engine(app):
+    """
+    :param app: Flask
+    :return: Engine
+    """
+    engine = get_state(app).db.get_engine(app, bind=REPLICA_BIND)
+
+    if not event.contains(engine, 'handle_error', on_replica_error):
+        event.listen(engine, 'handle_error', on_replica_error)
+
+    return engine
+
+
+def on_replica_error(context):
+    """
+    Engine event: a replica that drops connections is skipped until its next health check
+    :param context: ExceptionContext
+    :return:
+    """
+    if context.is_disconnect or isinstance(context.original_exception, exc.OperationalError):
+        mark_replica_unhealthy()
+
+
+def check_replica(app):
+    """
+    Runs the health check: the replica must answer and, on Postgres, lag at most
+    REPLICA_MAX_LAG seconds behind the primary
+    :param app: Flask
+    :return: bool
+    """
+    engine = get_replica_engine(app)
+
+    try:
+        with engine.connect() as connection:
+            if engine.dialect.name != 'postgresql':
+                connection.scalar('SELECT 1')
+                return True
+
+            lag = connection.scalar(
+                'SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)')
+    except exc.DBAPIError:
+        app.logger.warning('Read replica failed its health check', exc_info=True)
+        return False
+
+    return lag <= app.config.get('REPLICA_MAX_LAG')
+
+
+def is_replica_healthy(app):
+    """
+    Whether the replica passed its last health check, checking it again every
+    REPLICA_HEALTH_INTERVAL seconds
+    :param app: Flask
+    :return: bool
+    """
+    now = time.time()
+
+    if _health['pid'] == os.getpid() and \
+            now - _health['checked_at'] < app.config.get('REPLICA_HEALTH_INTERVAL'):
+        return _health['healthy']
+
+    # Only one thread checks, the others keep using the last result meanwhile
+    if not _health_lock.acquire(blocking=False):
+        return _health['healthy'] and _health['pid'] == os.getpid()
+
+    try:
+        healthy = check_replica(app)
+        _health.update({'pid': os.getpid(), 'healthy': healthy, 'checked_at': time.time()})
+    finally:
+        _health_lock.release()
+
+    return healthy
+
+
+def mark_replica_unhealthy():
+    """
+    Sends reads to the primary until the next health check
+    :return:
+    """
+    _health.update({'pid': os.getpid(), 'healthy': False, 'checked_at': time.time()})
+
+
+def reset_replica_health():
+    """
+    Forgets the last health check, so the next read checks the replica again
+    :return:
+    """
+    _health.update({'pid': None, 'healthy': True, 'checked_at': 0})
+
+
+def reads_from_primary(f):
+    """
+    Marks a GET view that must see the latest writes, e.g. the requester's own profile
+    :param f: view function
+    :return: function
+    """
+    f.reads_from_primary = True
+
+    return f
+
+
+@contextmanager
+def use_primary(session):
+    """
+    Runs the block's reads on the primary, whatever the request
+    :param session: RoutingSession
+    :return:
+    """
+    use_replica = session.info.pop(USE_REPLICA, None)
+    try:
+        yield
+    finally:
+        if use_replica is not None:
+            session.info[USE_REPLICA] = use_replica
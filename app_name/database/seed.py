@@ -0,0 +1,406 @@
+"""
+Bulk generation of realistic fixture data for benchmarks and load tests
+Rows are generated from a seeded Random, so the same arguments always give the same data, and
+written straight through the DBAPI: COPY on Postgres, executemany on any other database. Every
+user shares one precomputed password hash. Production databases are only seeded when forced
+"""
+
+# pylint: disable=invalid-name
+
+import csv
+import io
+import itertools
+import random
+import time
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func
+
+from . import db
+
+from app_name.resources.models import ResourceA, ResourceB
+from app_name.users.models import OAuthConnection, OAuthConnectionType, Role, User, roles_users
+from app_name.util.passwords import hash_password
+
+BATCH_SIZE = 50000
+
+PASSWORD = 'pass12345'
+
+# Share of users with each kind of account
+GOOGLE_SHARE = 0.3
+FACEBOOK_SHARE = 0.15
+INACTIVE_SHARE = 0.03
+ADMIN_SHARE = 0.001
+WITH_PHONE_SHARE = 0.6
+
+# Resource A's go mostly to a few heavy users: the owner is picked at users * random ** skew
+OWNER_SKEW = 3
+MAX_CHILDREN = 50
+
+# Rows are created over this period, in id order
+START = datetime(2019, 1, 1)
+PERIOD = timedelta(days=730)
+
+FIRST_NAMES = ('James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda',
+               'William', 'Elizabeth', 'David', 'Barbara', 'Richard', 'Susan', 'Joseph',
+               'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen', 'Wei', 'Fatima', 'Ahmed',
+               'Yuki', 'Priya', 'Carlos', 'Olga', 'Kwame', 'Lucia', 'Mateo')
+LAST_NAMES = ('Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+              'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson',
+              'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin', 'Lee', 'Khan', 'Nguyen',
+              'Tanaka', 'Patel', 'Silva', 'Ivanova', 'Mensah', 'Rossi', 'Kowalski')
+EMAIL_DOMAINS = ('gmail.com', 'yahoo.com', 'outlook.com', 'icloud.com', 'example.com')
+WORDS = ('alpha', 'budget', 'campaign', 'draft', 'export', 'forecast', 'gallery', 'invoice',
+         'journal', 'kanban', 'launch', 'meeting', 'notes', 'onboarding', 'plan', 'quarterly',
+         'report', 'roadmap', 'sprint', 'summary', 'travel', 'update', 'vendor', 'weekly')
+
+
+def next_id(model):
+    """
+    :param model: db.Model
+    :return: int -- first id after the table's last row, so seeding can add to existing data
+    """
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def pick(rng, choices):
+    """
+    Same as rng.choice, for a fraction of the cost
+    :param rng: Random
+    :param choices: tuple
+    :return: one of choices
+    """
+    return choices[int(rng.random() * len(choices))]
+
+
+def timestamps(count):
+    """
+    :param count: int
+    :return: function giving the creation time of the i-th of count rows, spread over PERIOD
+    """
+    step = PERIOD / max(count, 1)
+
+    return lambda i: START + step * i
+
+
+USER_COLUMNS = ('id', 'version', 'full_name', 'first_name', 'last_name', 'email', 'password',
+                'phone_number', 'image_url', 'active', 'is_admin', 'created_at', 'login_count')
+
+
+def generate_users(rng, first_id, count, password):
+    """
+    :param rng: Random
+    :param first_id: int
+    :param count: int
+    :param password: str -- hash shared by every user
+    :return: generator of tuples of USER_COLUMNS
+    """
+    random_value, created_at = rng.random, timestamps(count)
+
+    for i in range(count):
+        user_id = first_id + i
+        first_name, last_name = pick(rng, FIRST_NAMES), pick(rng, LAST_NAMES)
+
+        yield (
+            user_id, 1, '{} {}'.format(first_name, last_name), first_name, last_name,
+            # The id keeps addresses and numbers unique
+            '{}.{}{}@{}'.format(first_name, last_name, user_id,
+                                pick(rng, EMAIL_DOMAINS)).lower(),
+            password,
+            '+1{:010d}'.format(user_id) if random_value() < WITH_PHONE_SHARE else None,
+            '', random_value() >= INACTIVE_SHARE, random_value() < ADMIN_SHARE, created_at(i),
+            int(rng.expovariate(0.1))
+        )
+
+
+ROLES_USERS_COLUMNS = ('user_id', 'role_id')
+
+
+def generate_roles_users(first_user_id, count, role_id):
+    """
+    :return: generator of tuples of ROLES_USERS_COLUMNS -- every user gets the user role
+    """
+    for user_id in range(first_user_id, first_user_id + count):
+        yield user_id, role_id
+
+
+OAUTH_CONNECTION_COLUMNS = ('id', 'owner_id', 'email_address', 'type', 'ext_user_id',
+                            'ext_access_token', 'created_at')
+
+
+def generate_oauth_connections(rng, first_id, first_user_id, count):
+    """
+    Gives a share of the users a Google and/or a Facebook connection
+    :return: generator of tuples of OAUTH_CONNECTION_COLUMNS
+    """
+    random_value, created_at = rng.random, timestamps(count)
+    connection_id = first_id
+
+    for i in range(count):
+        user_id = first_user_id + i
+
+        for connection_type, share in ((OAuthConnectionType.GOOGLE, GOOGLE_SHARE),
+                                       (OAuthConnectionType.FACEBOOK, FACEBOOK_SHARE)):
+            if random_value() >= share:
+                continue
+
+            yield (
+                connection_id, user_id,
+                'user{}@{}'.format(user_id, pick(rng, EMAIL_DOMAINS)), connection_type,
+                '{}{:012d}'.format(connection_type.name[0], user_id),
+                'token-{}'.format(connection_id), created_at(i)
+            )
+
+            connection_id += 1
+
+
+RESOURCE_A_COLUMNS = ('id', 'version', 'name', 'owner_id', 'created_at')
+
+
+def generate_resources(rng, first_id, count, first_user_id, users, children, stats):
+    """
+    Generates resource A's and, through stats['children'], how many resource B's each gets
+    :param children: float -- mean resource B's per resource A
+    :param stats: dict -- filled with the children count of each resource A
+    :return: generator of tuples of RESOURCE_A_COLUMNS
+    """
+    random_value, created_at = rng.random, timestamps(count)
+    children_counts = stats['children'] = []
+
+    for i in range(count):
+        children_counts.append(
+            min(int(rng.expovariate(1 / children)), MAX_CHILDREN) if children else 0)
+
+        yield (
+            first_id + i, 1,
+            '{} {}'.format(pick(rng, WORDS).capitalize(), pick(rng, WORDS)),
+            first_user_id + int(users * random_value() ** OWNER_SKEW), created_at(i)
+        )
+
+
+RESOURCE_B_COLUMNS = ('id', 'version', 'name', 'resource_a_id', 'created_at')
+
+
+def generate_resource_b(rng, first_id, first_resource_id, children_counts):
+    """
+    :param children_counts: list of int -- resource B's of each resource A
+    :return: generator of tuples of RESOURCE_B_COLUMNS
+    """
+    created_at = timestamps(len(children_counts))
+    resource_b_id = first_id
+
+    for i, children in enumerate(children_counts):
+        for j in range(children):
+            yield (
+                resource_b_id, 1, '{} {}'.format(pick(rng, WORDS).capitalize(), j + 1),
+                first_resource_id + i, created_at(i)
+            )
+
+            resource_b_id += 1
+
+
+def batches(rows, size):
+    """
+    :param rows: iterable
+    :param size: int
+    :return: generator of lists of at most size rows
+    """
+    rows = iter(rows)
+
+    while True:
+        batch = list(itertools.islice(rows, size))
+
+        if not batch:
+            return
+
+        yield batch
+
+
+def copy_rows(cursor, table, columns, rows):
+    """
+    Writes rows with Postgres' COPY, as CSV
+    :param cursor: psycopg2 cursor
+    :param table: Table
+    :param columns: tuple of str
+    :param rows: list of tuple, bind processed
+    :return:
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    # An unquoted empty field is NULL in COPY's CSV format
+    for row in rows:
+        writer.writerow(['' if value is None else value for value in row])
+
+    buffer.seek(0)
+
+    cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH (FORMAT csv)'.format(
+        table.name, ', '.join('"{}"'.format(column) for column in columns)), buffer)
+
+
+def insert_statement(dialect, table, columns):
+    """
+    :param dialect: Dialect
+    :param table: Table
+    :param columns: tuple of str
+    :return: str -- INSERT taking the columns positionally, None if the driver takes names
+    """
+    marks = {'qmark': '?', 'format': '%s', 'pyformat': '%s'}.get(dialect.paramstyle)
+
+    if marks is None:
+        return None
+
+    quote = dialect.identifier_preparer.quote
+
+    return 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(table.name), ', '.join(quote(column) for column in columns),
+        ', '.join([marks] * len(columns)))
+
+
+def insert_rows(connection, table, columns, rows, batch_size=BATCH_SIZE):
+    """
+    Bulk inserts rows, skipping SQLAlchemy's per row work
+    Values go through their column's bind processor, if it has one, e.g. enums are stored by name
+    :param connection: Connection
+    :param table: Table
+    :param columns: tuple of str
+    :param rows: iterable of tuples of columns' values
+    :param batch_size: int
+    :return: int -- rows inserted
+    """
+    dialect = connection.dialect
+    statement = insert_statement(dialect, table, columns)
+    processors = [(index, table.c[column].type.bind_processor(dialect))
+                  for index, column in enumerate(columns)]
+    processors = [(index, processor) for index, processor in processors if processor]
+
+    cursor = connection.connection.cursor()
+    count = 0
+
+    for batch in batches(rows, batch_size):
+        if processors:
+            for position, row in enumerate(batch):
+                row = list(row)
+
+                for index, processor in processors:
+                    if row[index] is not None:
+                        row[index] = processor(row[index])
+
+                batch[position] = row
+
+        if dialect.name == 'postgresql':
+            copy_rows(cursor, table, columns, batch)
+        elif statement is not None:
+            cursor.executemany(statement, batch)
+        else:
+            connection.execute(table.insert(), [dict(zip(columns, row)) for row in batch])
+
+        count += len(batch)
+
+    cursor.close()
+
+    return count
+
+
+def reset_sequences(connection, models):
+    """
+    Moves Postgres' id sequences past the ids written explicitly
+    :param connection: Connection
+    :param models: list of db.Model
+    :return:
+    """
+    if connection.dialect.name != 'postgresql':
+        return
+
+    for model in models:
+        table = model.__table__.name
+        connection.execute(
+            "SELECT setval(pg_get_serial_sequence('\"{0}\"', 'id'), "
+            "COALESCE((SELECT MAX(id) FROM \"{0}\"), 1))".format(table))
+
+
+def get_user_role():
+    """
+    :return: Role -- created if missing
+    """
+    role = Role.query.filter_by(name='user').first()
+
+    if role is None:
+        role = Role(name='user')
+        db.session.add(role)
+        db.session.commit()
+
+    return role
+
+
+def seed(users, resources=None, children=3.0, seed_value=0, reset=False, echo=None,
+         force=False):
+    """
+    Generates users with their roles and OAuth connections, resource A's and their resource B's
+    :param users: int
+    :param resources: int -- resource A's, as many as users by default
+    :param children: float -- mean resource B's per resource A
+    :param seed_value: int -- seed of the generator, the same seed gives the same rows
+    :param reset: bool -- drop and recreate every table first
+    :param echo: function called with a line of progress, if given
+    :param force: bool -- seed even under ProductionConfig
+    :return: dict of table name -> rows inserted
+    """
+    if current_app.config.get('PRODUCTION') and not force:
+        raise RuntimeError('Refusing to seed a production database unless forced')
+
+    echo = echo or (lambda line: None)
+    resources = users if resources is None else resources
+    rng = random.Random(seed_value)
+
+    if reset:
+        db.drop_all()
+
+    db.create_all()
+
+    role_id = get_user_role().id
+    password = hash_password(PASSWORD)
+
+    first_user_id, first_connection_id = next_id(User), next_id(OAuthConnection)
+    first_resource_id, first_resource_b_id = next_id(ResourceA), next_id(ResourceB)
+    db.session.remove()
+
+    resource_stats = {}
+
+    tables = [
+        (User.__table__, USER_COLUMNS,
+         lambda: generate_users(rng, first_user_id, users, password)),
+        (roles_users, ROLES_USERS_COLUMNS,
+         lambda: generate_roles_users(first_user_id, users, role_id)),
+        (OAuthConnection.__table__, OAUTH_CONNECTION_COLUMNS,
+         lambda: generate_oauth_connections(rng, first_connection_id, first_user_id, users)),
+        (ResourceA.__table__, RESOURCE_A_COLUMNS,
+         lambda: generate_resources(rng, first_resource_id, resources, first_user_id, users,
+                                    children, resource_stats)),
+        (ResourceB.__table__, RESOURCE_B_COLUMNS,
+         lambda: generate_resource_b(rng, first_resource_b_id, first_resource_id,
+                                     resource_stats['children'])),
+    ]
+
+    counts = {}
+    engine = db.get_engine()
+
+    with engine.begin() as connection:
+        if connection.dialect.name == 'sqlite':
+            # Nothing to recover if seeding fails half way, the data is generated again
+            connection.execute('PRAGMA synchronous = OFF')
+
+        for table, columns, rows in tables:
+            start = time.perf_counter()
+            counts[table.name] = insert_rows(connection, table, columns, rows())
+            elapsed = time.perf_counter() - start
+
+            echo('{:>16}: {:>9} rows in {:>6.1f}s ({:.0f} rows/s)'.format(
+                table.name, counts[table.name], elapsed, counts[table.name] / elapsed
+                if elapsed else 0))
+
+        reset_sequences(connection, [User, OAuthConnection, ResourceA, ResourceB])
+
+    return counts
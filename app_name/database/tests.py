@@ -0,0 +1,460 @@
+"""
+Tests for database helpers
+"""
+
+# pylint: disable=missing-docstring,invalid-name,no-member,attribute-defined-outside-init
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from contextlib import ExitStack
+
+import mock
+
+from flask import Flask
+from flask_jwt_extended import create_access_token
+from flask_migrate import downgrade, upgrade
+from flask_security.utils import hash_password
+from flask_sqlalchemy import get_state
+from sqlalchemy import create_engine, exc, func, inspect
+
+from . import db, init_app, routing
+from .pool import TimedQueuePool, get_pool_stats, read_pool_stats, write_pool_stats
+from .seed import seed
+
+from app_name import create_app
+from app_name.config import engine_options
+from app_name.resources.models import ResourceA, ResourceB
+from app_name.testing import AppTest
+from app_name.testing.explain import find_full_scans, record_selects
+from app_name.users import loaders
+from app_name.users.models import User, Role, OAuthConnection, OAuthConnectionType
+from app_name.util import cooperative
+from app_name.util.passwords import verify_password
+
+
+class EngineOptionsTest(unittest.TestCase):
+    def test_sqlite_is_not_pooled(self):
+        self.assertEqual(engine_options('sqlite:///local.db', pool_size=10),
+                         {'pool_pre_ping': True})
+
+    def test_postgres(self):
+        options = engine_options('postgresql://localhost/app', pool_size=4, max_overflow=2,
+                                 statement_timeout=15000)
+
+        self.assertEqual(options['pool_size'], 4)
+        self.assertEqual(options['max_overflow'], 2)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=15000'})
+
+    def test_gevent_worker_pool(self):
+        app = Flask(__name__)
+        app.config.from_object('app_name.config.ProductionConfig')
+        app.config.update(SQLALCHEMY_DATABASE_URI='postgresql://localhost/app',
+                          SQLALCHEMY_ENGINE_OPTIONS=engine_options('postgresql://localhost/app'),
+                          DB_GREENLET_POOL_SIZE=12, DB_GREENLET_MAX_OVERFLOW=3)
+
+        with mock.patch.object(cooperative, 'is_cooperative', return_value=True), \
+                mock.patch.object(cooperative, 'patch_psycopg') as patch_psycopg:
+            init_app(app)
+
+        options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+        self.assertEqual((options['pool_size'], options['max_overflow']), (12, 3))
+        self.assertIs(options['poolclass'], TimedQueuePool)
+        patch_psycopg.assert_called_once_with()
+
+
+class PoolStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_checkouts_and_timeouts(self):
+        engine = create_engine('sqlite://', poolclass=TimedQueuePool, pool_size=1,
+                               max_overflow=0, pool_timeout=0.05)
+
+        connection = engine.connect()
+        with self.assertRaises(exc.TimeoutError):
+            engine.connect()
+
+        stats = get_pool_stats(engine)
+
+        self.assertEqual(stats['checked_out'], 1)
+        self.assertEqual(stats['idle'], 0)
+        self.assertEqual(stats['overflow'], 0)
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreaterEqual(stats['max_wait_ms'], 50)
+
+        connection.close()
+
+        self.assertEqual(get_pool_stats(engine)['idle'], 1)
+
+    def test_stats_of_dead_workers_are_dropped(self):
+        write_pool_stats({'pid': os.getpid(), 'time': 0}, self.directory)
+
+        dead_path = os.path.join(self.directory, '999999999.json')
+        with open(dead_path, 'w') as f:
+            json.dump({'pid': 999999999, 'time': 0}, f)
+
+        self.assertEqual([stats['pid'] for stats in read_pool_stats(self.directory)],
+                         [os.getpid()])
+        self.assertFalse(os.path.exists(dead_path))
+
+
+class PoolStatsEndpointTest(AppTest):
+    def setUp(self):
+        super().setUp()
+
+        self.directory = tempfile.mkdtemp()
+        self.app.config['DB_POOL_STATS_DIR'] = self.directory
+        self.app.config['DB_POOL_STATS_INTERVAL'] = 0
+
+        self.admin = User(email='admin@example.com', phone_number='1', password='pass12345',
+                          is_admin=True)
+        self.user = User(email='user@example.com', phone_number='2', password='pass12345')
+        self.db.session.add_all([self.admin, self.user])
+        self.db.session.commit()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super().tearDown()
+
+    def get_stats(self, user):
+        return self.client.get('/internal/db-pool', headers={
+            'Authorization': 'Bearer {}'.format(create_access_token(user.id))})
+
+    def test_admin_only(self):
+        self.assert403(self.get_stats(self.user))
+
+    def test_stats(self):
+        # Any request writes this worker's stats
+        self.client.get('/users/{}'.format(self.user.id))
+
+        response = self.get_stats(self.admin)
+
+        self.assert200(response)
+        self.assertEqual(response.json['current']['pid'], os.getpid())
+        self.assertEqual([stats['pid'] for stats in response.json['workers']], [os.getpid()])
+
+        output = self.app.test_cli_runner().invoke(args=['db-pool-stats']).output
+        self.assertIn(str(os.getpid()), output)
+
+
+class ReplicaRoutingTest(AppTest):
+    """
+    The replica is a second, empty SQLite database: whatever is read from it is missing
+    """
+    def setUp(self):
+        super().setUp()
+
+        self.app.config['SQLALCHEMY_BINDS'] = {'replica': 'sqlite:///testing-replica.db'}
+        routing.reset_replica_health()
+
+        self.replica = routing.get_replica_engine(self.app)
+        self.db.Model.metadata.create_all(bind=self.replica)
+
+        self.user = User(email='user@example.com', password='pass12345')
+        self.db.session.add(self.user)
+        self.db.session.commit()
+
+        self.resource_a = ResourceA(name='Resource')
+        self.resource_a.owner_id = self.user.id
+        self.db.session.add(self.resource_a)
+        self.db.session.commit()
+
+        self.url = '/resource-a/{}'.format(self.resource_a.id)
+        self.headers = {'Authorization': 'Bearer {}'.format(create_access_token(self.user.id))}
+        self.user_id = self.user.id
+
+        # Requests start with a new session, which hasn't written anything yet
+        self.db.session.remove()
+
+    def tearDown(self):
+        self.db.session.remove()
+        self.db.Model.metadata.drop_all(bind=self.replica)
+        self.replica.dispose()
+
+        get_state(self.app).connectors.pop('replica', None)
+        self.app.config['SQLALCHEMY_BINDS'] = {}
+        routing.reset_replica_health()
+
+        super().tearDown()
+
+    def test_gets_read_from_replica(self):
+        self.assert404(self.client.get(self.url))
+        self.assertEqual(self.client.get('/resource-a').json['items'], [])
+
+    def record_binds(self):
+        binds = []
+        get_bind = routing.RoutingSession.get_bind
+
+        def record_bind(session, *args, **kwargs):
+            bind = get_bind(session, *args, **kwargs)
+            binds.append(bind)
+
+            return bind
+
+        return binds, mock.patch.object(routing.RoutingSession, 'get_bind', record_bind)
+
+    def test_views_reading_from_primary(self):
+        binds, patcher = self.record_binds()
+
+        # The user loader always reads from the primary, leave the routing to the view
+        with patcher, mock.patch.object(loaders, 'use_primary', lambda session: ExitStack()):
+            response = self.client.get('/users/me', headers=self.headers)
+
+        self.assert200(response)
+        self.assertEqual(response.json['email'], 'user@example.com')
+        self.assertTrue(binds)
+        self.assertNotIn(self.replica, binds)
+
+        # Any other GET does read from the replica
+        with patcher:
+            self.client.get(self.url)
+
+        self.assertIn(self.replica, binds)
+
+    def test_client_reads_own_writes(self):
+        self.assertStatus(self.client.post('/resource-a', json={'name': 'Mine'},
+                                           headers=self.headers), 201)
+
+        self.assert200(self.client.get(self.url))
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        routing.mark_replica_unhealthy()
+        self.assert200(self.client.get(self.url))
+
+        self.app.config['REPLICA_HEALTH_INTERVAL'] = 0
+        with mock.patch.object(routing, 'check_replica', return_value=True):
+            self.assert404(self.client.get(self.url))
+
+    def test_session_sticks_to_primary_after_writing(self):
+        user = User.query.get(self.user_id)
+
+        session = self.db.session()
+        session.info[routing.USE_REPLICA] = True
+
+        self.assertIs(session.get_bind(), self.replica)
+
+        user.first_name = 'Jane'
+        session.flush()
+
+        self.assertIsNot(session.get_bind(), self.replica)
+        session.info.clear()
+
+
+class QueryPlanTest(AppTest):
+    """
+    Fails when one of the hot queries can't use an index
+    """
+    def setUp(self):
+        super().setUp()
+
+        role = Role(name='user')
+        self.users = [User(email='{}@example.com'.format(i), phone_number=str(i))
+                      for i in range(20)]
+        for user in self.users:
+            user.roles = [role]
+
+        self.db.session.add_all(self.users)
+        self.db.session.commit()
+
+        for i, user in enumerate(self.users):
+            self.db.session.add_all([
+                OAuthConnection(owner_id=user.id, type=OAuthConnectionType.GOOGLE,
+                                email_address=user.email),
+                OAuthConnection(owner_id=user.id, type=OAuthConnectionType.FACEBOOK,
+                                ext_user_id='fb{}'.format(i)),
+            ])
+
+            for j in range(3):
+                resource_a = ResourceA(name='Resource {} {}'.format(i, j))
+                resource_a.owner_id = user.id
+                resource_a.resource_b_set = [ResourceB(name='Child {}'.format(k))
+                                             for k in range(3)]
+                self.db.session.add(resource_a)
+
+        self.db.session.commit()
+
+        self.user_ids = [user.id for user in self.users]
+        self.db.session.remove()
+
+    def run_hot_queries(self):
+        user_id = self.user_ids[3]
+        email = '3@example.com'
+
+        page = self.client.get('/resource-a?limit=10&expand=resource_b')
+        self.client.get('/resource-a?limit=10&after={}'.format(page.json['next_cursor']))
+
+        resource_a_url = '/resource-a/{}?expand=resource_b'.format(page.json['items'][0]['id'])
+        etag, _ = self.client.get(resource_a_url).get_etag()
+        self.client.get(resource_a_url, headers={'If-None-Match': '"{}"'.format(etag)})
+
+        self.client.get('/users/{}'.format(user_id))
+        self.client.get('/users?ids={},{}'.format(user_id, self.user_ids[4]))
+
+        User.filter_by_attrs(email=email)
+        OAuthConnection.query.filter_by(type=OAuthConnectionType.GOOGLE,
+                                        email_address=email).first()
+        OAuthConnection.query.filter_by(type=OAuthConnectionType.FACEBOOK,
+                                        ext_user_id='fb3').first()
+
+        owner = User.query.get(user_id)
+        ResourceA.query.filter_by(owner_id=owner.id).all()
+        list(owner.oauth_connections)
+        list(owner.roles)
+        list(Role.query.filter_by(name='user').first().users)
+
+    def test_hot_queries_use_indexes(self):
+        engine = self.db.get_engine()
+
+        with record_selects(engine) as statements:
+            self.run_hot_queries()
+
+        self.assertGreater(len(statements), 10)
+
+        offenders = find_full_scans(engine, statements)
+
+        self.assertFalse(offenders, '\n\n'.join(
+            '{}\nscans {}\n{}'.format(statement, ', '.join(tables), '\n'.join(plan))
+            for statement, tables, plan in offenders))
+
+
+class SeedTest(AppTest):
+    def test_same_seed_gives_same_rows(self):
+        counts = seed(50, children=2.0, seed_value=7)
+        emails = [user.email for user in User.query.order_by(User.id)]
+
+        self.assertEqual(counts['user'], 50)
+        self.assertEqual(counts['roles_users'], 50)
+        self.assertEqual(counts['resourceA'], 50)
+        self.assertEqual(counts['resourceB'], ResourceB.query.count())
+
+        self.db.session.remove()
+
+        self.assertEqual(seed(50, children=2.0, seed_value=7, reset=True), counts)
+        self.assertEqual([user.email for user in User.query.order_by(User.id)], emails)
+
+    def test_rows_load_through_models(self):
+        seed(30, resources=10)
+
+        connections = OAuthConnection.query.all()
+        user = User.query.get(1)
+
+        self.assertTrue(connections)
+        self.assertTrue(all(isinstance(connection.type, OAuthConnectionType)
+                            for connection in connections))
+        self.assertEqual([role.name for role in user.roles], ['user'])
+        self.assertIsInstance(user.active, bool)
+        self.assertTrue(verify_password('pass12345', user.password))
+        self.assertEqual(ResourceA.query.count(), 10)
+
+    def test_refuses_production_unless_forced(self):
+        runner = self.app.test_cli_runner()
+
+        with mock.patch.dict(self.app.config, {'PRODUCTION': True}):
+            with self.assertRaises(RuntimeError):
+                seed(10)
+
+            result = runner.invoke(args=['seed', '--users', '10'])
+            self.assertNotEqual(result.exit_code, 0)
+            self.assertIn('--force', result.output)
+            self.assertEqual(User.query.count(), 0)
+
+            result = runner.invoke(args=['seed', '--users', '10', '--force'])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(User.query.count(), 10)
+
+    def test_reset_asks_for_confirmation(self):
+        seed(10)
+        self.db.session.remove()
+        runner = self.app.test_cli_runner()
+
+        result = runner.invoke(args=['seed', '--users', '5', '--reset'], input='n\n')
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertEqual(User.query.count(), 10)
+
+        result = runner.invoke(args=['seed', '--users', '5', '--reset'], input='y\n')
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(User.query.count(), 5)
+
+    def test_adds_to_existing_rows(self):
+        seed(10)
+        seed(10, seed_value=1)
+
+        self.assertEqual(User.query.count(), 20)
+        self.assertEqual(Role.query.count(), 1)
+        self.assertEqual(self.db.session.query(func.max(User.id)).scalar(), 20)
+
+
+class MigrationTest(unittest.TestCase):
+    MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))), 'migrations')
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        self.app = create_app('TESTING')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///{}'.format(
+            os.path.join(directory, 'migrated.db'))
+
+        context = self.app.app_context()
+        context.push()
+        self.addCleanup(context.pop)
+        self.addCleanup(db.session.remove)
+
+    def test_migrations_build_the_models_schema(self):
+        upgrade(directory=self.MIGRATIONS)
+
+        inspector = inspect(db.engine)
+
+        for table in db.metadata.sorted_tables:
+            self.assertEqual({column['name'] for column in inspector.get_columns(table.name)},
+                             {column.name for column in table.columns}, table.name)
+            self.assertEqual({index['name'] for index in inspector.get_indexes(table.name)},
+                             {index.name for index in table.indexes}, table.name)
+
+    def test_baseline_database_is_upgraded(self):
+        # A database created before migrations existed, then stamped as the README says
+        upgrade(directory=self.MIGRATIONS, revision='5cd0faa9d95b')
+
+        # Only what the models had then: later additions come from their own revisions
+        inspector = inspect(db.engine)
+        self.assertNotIn('outbox_email', inspector.get_table_names())
+        self.assertNotIn('version', {column['name'] for column in inspector.get_columns('user')})
+        self.assertEqual(inspector.get_indexes('resourceA'), [])
+
+        # As the baseline stored them: a Google signup got the hash of the empty password
+        for user_id, email, password in ((1, 'google@example.com', ''),
+                                         (2, 'me@johndoe.com', 'pass12345')):
+            db.session.execute(
+                "INSERT INTO user (id, email, password, created_at) "
+                "VALUES (:id, :email, :password, '2020-01-01 00:00:00')",
+                {'id': user_id, 'email': email, 'password': hash_password(password)})
+        db.session.execute("INSERT INTO oauth_connection (owner_id, type, created_at) "
+                           "VALUES (1, 'GOOGLE', '2020-01-01 00:00:00')")
+        db.session.commit()
+
+        upgrade(directory=self.MIGRATIONS)
+
+        google, email = User.query.order_by(User.id).all()
+        self.assertEqual(google.version, 1)
+        self.assertIsNone(google.password)
+        self.assertTrue(verify_password('pass12345', email.password))
+        db.session.remove()
+
+        downgrade(directory=self.MIGRATIONS, revision='base')
+
+        self.assertEqual(inspect(db.engine).get_table_names(), ['alembic_version'])
+
+
+if __name__ == '__main__':
+    unittest.main()
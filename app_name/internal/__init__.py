@@ -0,0 +1,9 @@
+"""
+Internal endpoints, e.g. for the metrics scraper, served whichever subsystems are enabled
+"""
+
+# pylint: disable=invalid-name
+
+from flask import Blueprint
+
+blueprint = Blueprint('internal', __name__)
@@ -0,0 +1,50 @@
+"""
+Routes for monitoring
+"""
+
+from flask import current_app
+from flask_jwt_extended import jwt_required
+
+from . import blueprint
+
+from app_name.database import db
+from app_name.database.pool import get_pool_stats, read_pool_stats
+from app_name.users.loaders import get_current_api_user
+from app_name.util import metrics, responses
+from app_name.util.exceptions import protect_500
+
+
+@blueprint.route('/internal/db-pool', methods=['GET'])
+@protect_500
+@jwt_required
+def get_db_pool_stats():
+    """
+    Returns the connection pool stats of the worker answering, and the last ones written by
+    every other worker
+    Admins only
+    :return:
+    """
+    user = get_current_api_user()
+
+    if not user or not user.is_admin:
+        return responses.action_forbidden()
+
+    return responses.json_response({
+        'current': get_pool_stats(db.engine),
+        'workers': read_pool_stats(current_app.config.get('DB_POOL_STATS_DIR'))
+    })
+
+
+@blueprint.route('/internal/metrics', methods=['GET'])
+@protect_500
+def get_metrics():
+    """
+    Returns the request metrics of every worker in the Prometheus text format
+    Only for the scraper, see METRICS_TOKEN
+    :return:
+    """
+    if not metrics.is_scrape_allowed():
+        return responses.action_forbidden()
+
+    return responses.metrics_response(
+        metrics.render(metrics.collect(current_app.config.get('METRICS_DIR'))))
@@ -0,0 +1,4 @@
+"""
+Email outbox module -- emails are written to the database in the caller's transaction and
+delivered later by a background sender
+"""
@@ -0,0 +1,22 @@
+"""
+CLI commands for the outbox sender
+"""
+import click
+
+from flask.cli import with_appcontext
+
+from .helpers import send_pending, run_sender
+
+
+@click.command('outbox-send')
+@click.option('--loop', is_flag=True, help='Keep polling the outbox instead of sending one batch')
+@click.option('--batch-size', type=int, default=None, help='Emails sent per SMTP connection')
+@with_appcontext
+def outbox_send(loop, batch_size):
+    """
+    Delivers pending outbox emails
+    """
+    if loop:
+        run_sender(batch_size=batch_size)
+    else:
+        click.echo('Sent {} emails'.format(send_pending(batch_size=batch_size)))
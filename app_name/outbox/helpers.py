@@ -0,0 +1,129 @@
+"""
+Outbox helper functions
+"""
+
+# pylint: disable=no-member,invalid-name
+
+import smtplib
+import time
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_mail import Message
+
+from .models import OutboxEmail, OutboxEmailStatus
+
+from app_name import mail
+
+from app_name.database import db
+
+
+def enqueue_email(subject, recipients, body=None, html=None, sender=None):
+    """
+    Adds an email to the outbox in the current transaction
+    The email is only delivered once the caller commits, and no mail I/O happens here
+    :param subject: str
+    :param recipients: list of str
+    :param body: str
+    :param html: str
+    :param sender: str -- defaults to MAIL_DEFAULT_SENDER at delivery time
+    :return: OutboxEmail
+    """
+    email = OutboxEmail(subject=subject, recipients=recipients, body=body, html=html,
+                        sender=sender)
+
+    db.session.add(email)
+
+    return email
+
+
+def get_retry_delay(attempts):
+    """
+    Exponential backoff between delivery attempts
+    :param attempts: int -- attempts made so far
+    :return: timedelta
+    """
+    delay = current_app.config.get('OUTBOX_RETRY_BACKOFF') * 2 ** (attempts - 1)
+
+    return timedelta(seconds=min(delay, current_app.config.get('OUTBOX_RETRY_BACKOFF_MAX')))
+
+
+def mark_failed_attempt(email, error, now):
+    """
+    Records a failed delivery and schedules the next attempt, or gives up after
+    OUTBOX_MAX_ATTEMPTS
+    :param email: OutboxEmail
+    :param error: Exception
+    :param now: datetime
+    :return:
+    """
+    email.attempts += 1
+    email.last_error = str(error)
+
+    if email.attempts >= current_app.config.get('OUTBOX_MAX_ATTEMPTS'):
+        email.status = OutboxEmailStatus.FAILED
+    else:
+        email.next_attempt_at = now + get_retry_delay(email.attempts)
+
+
+def send_pending(batch_size=None):
+    """
+    Delivers one batch of due outbox emails over a single SMTP connection
+    Rows are locked with SKIP LOCKED where supported so several senders can run at once
+    :param batch_size: int
+    :return: number of emails sent (int)
+    """
+    now = datetime.now()
+
+    emails = OutboxEmail.query \
+        .filter(OutboxEmail.status == OutboxEmailStatus.PENDING,
+                OutboxEmail.next_attempt_at <= now) \
+        .order_by(OutboxEmail.next_attempt_at, OutboxEmail.id) \
+        .limit(batch_size or current_app.config.get('OUTBOX_BATCH_SIZE')) \
+        .with_for_update(skip_locked=True) \
+        .all()
+
+    if not emails:
+        db.session.commit()
+        return 0
+
+    sent = 0
+
+    try:
+        with mail.connect() as connection:
+            for email in emails:
+                msg = Message(subject=email.subject, body=email.body, html=email.html,
+                              recipients=email.recipient_list(),
+                              sender=email.sender or None)
+                try:
+                    connection.send(msg)
+                except (smtplib.SMTPException, OSError) as e:
+                    mark_failed_attempt(email, e, now)
+                else:
+                    email.status = OutboxEmailStatus.SENT
+                    email.sent_at = datetime.now()
+                    sent += 1
+    except (smtplib.SMTPException, OSError) as e:
+        # The connection couldn't be opened or was lost -- retry whatever wasn't sent
+        for email in emails:
+            if email.status == OutboxEmailStatus.PENDING and email.next_attempt_at <= now:
+                mark_failed_attempt(email, e, now)
+
+    db.session.commit()
+
+    return sent
+
+
+def run_sender(poll_interval=None, batch_size=None):
+    """
+    Drains the outbox forever, sleeping for OUTBOX_POLL_INTERVAL seconds when it's empty
+    :param poll_interval: float
+    :param batch_size: int
+    :return:
+    """
+    poll_interval = poll_interval or current_app.config.get('OUTBOX_POLL_INTERVAL')
+
+    while True:
+        if not send_pending(batch_size=batch_size):
+            time.sleep(poll_interval)
@@ -0,0 +1,70 @@
+"""
+Outbox models
+"""
+
+# pylint: disable=no-member,too-few-public-methods
+
+from enum import Enum
+
+from datetime import datetime
+
+from app_name.database import db
+
+
+class OutboxEmailStatus(Enum):
+    """
+    Delivery states of an outbox email
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+
+class OutboxEmail(db.Model):
+    """
+    Email waiting to be delivered by the outbox sender
+    """
+    __tablename__ = 'outbox_email'
+    __table_args__ = (
+        # The sender polls for due pending emails in next_attempt_at order
+        db.Index('ix_outbox_email_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    subject = db.Column(db.Text, nullable=False)
+    sender = db.Column(db.Text)
+    recipients = db.Column(db.Text, nullable=False)
+    body = db.Column(db.Text)
+    html = db.Column(db.Text)
+
+    status = db.Column(db.Enum(OutboxEmailStatus), nullable=False)
+    attempts = db.Column(db.Integer, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, nullable=False)
+    last_error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, nullable=False)
+    sent_at = db.Column(db.DateTime)
+
+    def __init__(self, **data):
+        self.subject = data.get('subject')
+        self.sender = data.get('sender')
+        self.recipients = '\n'.join(data.get('recipients', []))
+        self.body = data.get('body')
+        self.html = data.get('html')
+
+        self.status = OutboxEmailStatus.PENDING
+        self.attempts = 0
+
+        self.created_at = datetime.now()
+        self.next_attempt_at = self.created_at
+
+    def __str__(self):
+        return 'Outbox email: {subject}'.format(subject=self.subject)
+
+    def recipient_list(self):
+        """
+        Returns the recipients as a list
+        :return: list of str
+        """
+        return self.recipients.split('\n')
@@ -0,0 +1,109 @@
+"""
+Tests for the email outbox
+"""
+
+# pylint: disable=missing-docstring,invalid-name,no-member,attribute-defined-outside-init
+
+import json
+import unittest
+
+from datetime import datetime, timedelta
+
+from .helpers import enqueue_email, send_pending
+from .models import OutboxEmail, OutboxEmailStatus
+
+from app_name import mail
+from app_name.testing import AppTest
+from app_name.testing.smtp import SMTPSink
+
+
+class OutboxTest(AppTest):
+    def setUp(self):
+        super().setUp()
+
+        self.sink = SMTPSink().__enter__()
+
+        self.app.config.update(
+            MAIL_SERVER=self.sink.host,
+            MAIL_PORT=self.sink.port,
+            MAIL_USE_TLS=False,
+            MAIL_SUPPRESS_SEND=False,
+            MAIL_DEFAULT_SENDER='noreply@example.com'
+        )
+        mail.init_app(self.app)
+
+    def tearDown(self):
+        self.sink.__exit__(None, None, None)
+        mail.init_app(self.app)
+
+        super().tearDown()
+
+    def test_signup_queues_confirmation_email(self):
+        response = self.client.post('/auth/signup/email', data=json.dumps({
+            'email': 'me@johndoe.com',
+            'password': 'pass12345',
+            'first_name': 'John',
+            'last_name': 'Doe'
+        }), content_type='application/json')
+
+        self.assertStatus(response, 201)
+        self.assertEqual(self.sink.messages, [])
+
+        email = OutboxEmail.query.one()
+        self.assertEqual(email.recipient_list(), ['me@johndoe.com'])
+        self.assertEqual(email.status, OutboxEmailStatus.PENDING)
+
+        self.assertEqual(send_pending(), 1)
+        self.assertEqual(email.status, OutboxEmailStatus.SENT)
+        self.assertIn(b'Confirmation Email for John', self.sink.messages[0][2])
+        self.assertIn(b'/auth/confirm/', self.sink.messages[0][2])
+
+    def test_batch_uses_one_connection(self):
+        for i in range(5):
+            enqueue_email(subject='Email {}'.format(i), body='Hi',
+                          recipients=['{}@example.com'.format(i)])
+        self.db.session.commit()
+
+        self.assertEqual(send_pending(batch_size=3), 3)
+        self.assertEqual(send_pending(batch_size=3), 2)
+        self.assertEqual(send_pending(batch_size=3), 0)
+
+        self.assertEqual(len(self.sink.messages), 5)
+        self.assertEqual(self.sink.connections, 2)
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        email = enqueue_email(subject='Hello', body='Hi', recipients=['me@example.com'])
+        self.db.session.commit()
+
+        self.sink.fail_data = True
+        self.assertEqual(send_pending(), 0)
+
+        self.assertEqual(email.status, OutboxEmailStatus.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt_at, datetime.now())
+
+        # Not due yet
+        self.sink.fail_data = False
+        self.assertEqual(send_pending(), 0)
+
+        email.next_attempt_at = datetime.now() - timedelta(seconds=1)
+        self.db.session.commit()
+
+        self.assertEqual(send_pending(), 1)
+        self.assertEqual(email.status, OutboxEmailStatus.SENT)
+
+    def test_gives_up_after_max_attempts(self):
+        self.app.config['OUTBOX_MAX_ATTEMPTS'] = 1
+        self.app.config['MAIL_PORT'] = 1
+        mail.init_app(self.app)
+
+        email = enqueue_email(subject='Hello', body='Hi', recipients=['me@example.com'])
+        self.db.session.commit()
+
+        self.assertEqual(send_pending(), 0)
+        self.assertEqual(email.status, OutboxEmailStatus.FAILED)
+        self.assertIsNotNone(email.last_error)
+
+
+if __name__ == '__main__':
+    unittest.main()
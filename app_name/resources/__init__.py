@@ -0,0 +1,9 @@
+"""
+Resource group module
+"""
+
+# pylint: disable=invalid-name
+
+from flask import Blueprint
+
+blueprint = Blueprint('resources', __name__)
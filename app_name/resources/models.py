@@ -5,15 +5,22 @@ Example models for an example resource group
 from datetime import datetime
 
 from app_name.database import db
+from app_name.database.mixins import AttrFilterMixin, VersionMixin
 
 
-class ResourceA(db.Model):
+class ResourceA(db.Model, AttrFilterMixin, VersionMixin):
     """
     Example resource to build model and routes around
     Owns many Resource B's while a Resource B is only associated with 1 Resource A
     All Resource A's can be viewed by anyone -- signed-in user or not
     Only resources you own can be edited by you, however
     """
+    __table_args__ = (
+        # Keyset pagination of GET /resource-a walks this index
+        db.Index('ix_resource_a_created_at_id', 'created_at', 'id'),
+        db.Index('ix_resource_a_owner_id', 'owner_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.Text, nullable=False)
 
@@ -21,6 +28,9 @@ class ResourceA(db.Model):
 
     resource_b_set = db.relationship('ResourceB', backref='resourceA')
 
+    # Names accepted by ?expand= mapped to the relationship each one embeds
+    EXPANDABLE = {'resource_b': 'resource_b_set'}
+
     created_at = db.Column(db.DateTime)
     updated_at = db.Column(db.DateTime)
 
@@ -32,22 +42,33 @@ class ResourceA(db.Model):
     def __str__(self):
         return 'Resource A: {name}'.format(name=self.name)
 
-    def to_dict(self):
+    def to_dict(self, expand=()):
         """
         Serialize data into publicly exposable dictionary
+        :param expand: names of relationships to embed, see EXPANDABLE
         :return:
         """
-        return {
+        data = {
             'id': self.id,
             'name': self.name
         }
 
+        if 'resource_b' in expand:
+            data['resource_b_set'] = [resource_b.to_dict() for resource_b in self.resource_b_set]
+
+        return data
 
-class ResourceB(db.Model):
+
+class ResourceB(db.Model, AttrFilterMixin, VersionMixin):
     """
     Example resource used to demonstrate one-to-many relationships
     Associated with one Resource A and does not own any resources
     """
+    __table_args__ = (
+        # ?expand=resource_b loads children by parent id
+        db.Index('ix_resource_b_resource_a_id', 'resource_a_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.Text, nullable=False)
 
@@ -63,3 +84,13 @@ class ResourceB(db.Model):
 
     def __str__(self):
         return 'Resource B: {name}'.format(name=self.name)
+
+    def to_dict(self):
+        """
+        Serialize data into publicly exposable dictionary
+        :return:
+        """
+        return {
+            'id': self.id,
+            'name': self.name
+        }
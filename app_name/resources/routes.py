@@ -2,22 +2,25 @@
 Routes for this resource group module
 """
 
-from flask import request, jsonify
+from flask import request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
+from . import blueprint
 from .models import ResourceA
 
-from app_name import app
 
 from app_name.database import db
 
-from app_name.users.models import User
+from app_name.users.loaders import get_current_api_user
 
-from app_name.util import status, responses
-from app_name.util.exceptions import protect_500
+from app_name.util import etags, responses
+from app_name.util.exceptions import protect_500, InvalidExpandParams, InvalidPageParams
+from app_name.util.expand import parse_expand, expand_options
+from app_name.util.pagination import get_page, keyset_query
+from app_name.util.streaming import stream_query
 
 
-@app.route('/resource-a', methods=['POST'])
+@blueprint.route('/resource-a', methods=['POST'])
 @protect_500
 @jwt_required
 def create_resource_a():
@@ -25,17 +28,14 @@ def create_resource_a():
     Creates a resource A
     :return:
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_api_user()
 
     if not user:
         return responses.user_not_found()
 
     data = request.get_json()
     resource_a = ResourceA(**data)
-    resource_a.owner_id = user_id
-
-    user.resource_a_set.append(resource_a)
+    resource_a.owner_id = user.id
 
     db.session.add(resource_a)
     db.session.commit()
@@ -43,36 +43,95 @@ def create_resource_a():
     return responses.resource_created(ResourceA.__name__)
 
 
-@app.route('/resource-a', methods=['GET'])
+@blueprint.route('/resource-a', methods=['GET'])
 @protect_500
 def get_all_resource_a():
     """
-    Returns all resource A's
+    Returns a page of resource A's ordered by creation
+    Takes optional `limit` and `after` (cursor from the previous page's `next_cursor`) args
+    With `stream=true` every row after the cursor is streamed instead, in constant memory
+    With `expand=resource_b` each resource A embeds its resource B's
     :return:
     """
-    resource_a_set = ResourceA.query.all()
+    try:
+        expand = parse_expand(ResourceA, request.args.get('expand'))
+    except InvalidExpandParams as e:
+        return responses.invalid_expand(e.args[0])
+
+    query = ResourceA.query.options(*expand_options(ResourceA, expand))
+
+    def serialize(resource_a):
+        return resource_a.to_dict(expand=expand)
+
+    try:
+        if request.args.get('stream') == 'true':
+            return stream_query(keyset_query(query, ResourceA, after=request.args.get('after')),
+                                serialize)
+
+        if etags.is_conditional():
+            versions, next_cursor = get_page(
+                ResourceA.query.with_entities(ResourceA.id, ResourceA.created_at,
+                                              ResourceA.version),
+                ResourceA, limit=request.args.get('limit'), after=request.args.get('after'))
+            etag = etags.rows_etag(ResourceA, versions, expand, extra=(next_cursor,))
+
+            if etags.is_not_modified(etag):
+                return responses.not_modified(etag)
+
+        resource_a_set, next_cursor = get_page(query, ResourceA,
+                                               limit=request.args.get('limit'),
+                                               after=request.args.get('after'))
+    except InvalidPageParams as e:
+        return responses.invalid_page_params(e)
 
-    return jsonify({
-        'items': [resource_a.to_dict() for resource_a in resource_a_set]
-    }), status.OK
+    etag = etags.rows_etag(
+        ResourceA, resource_a_set, expand,
+        related=etags.loaded_related_versions(ResourceA, expand, resource_a_set),
+        extra=(next_cursor,))
 
+    return responses.json_response({
+        'items': [serialize(resource_a) for resource_a in resource_a_set],
+        'next_cursor': next_cursor
+    }, etag=etag)
 
-@app.route('/resource-a/<resource_a_id>', methods=['GET'])
+
+@blueprint.route('/resource-a/<resource_a_id>', methods=['GET'])
 @protect_500
 def get_resource_a(resource_a_id):
     """
     Returns resource's information
+    With `expand=resource_b` the resource A embeds its resource B's
     :return:
     """
-    resource_a = ResourceA.query.get(resource_a_id)
+    try:
+        expand = parse_expand(ResourceA, request.args.get('expand'))
+    except InvalidExpandParams as e:
+        return responses.invalid_expand(e.args[0])
+
+    if etags.is_conditional():
+        versions = ResourceA.query.with_entities(ResourceA.id, ResourceA.version) \
+            .filter(ResourceA.id == resource_a_id) \
+            .all()
+
+        if versions:
+            etag = etags.rows_etag(ResourceA, versions, expand)
+
+            if etags.is_not_modified(etag):
+                return responses.not_modified(etag)
+
+    resource_a = ResourceA.query.options(*expand_options(ResourceA, expand)).get(resource_a_id)
 
     if not resource_a:
         return responses.resource_not_found(ResourceA.__name__)
 
-    return jsonify(resource_a.to_dict()), status.OK
+    etag = etags.rows_etag(
+        ResourceA, [resource_a], expand,
+        related=etags.loaded_related_versions(ResourceA, expand, [resource_a]))
+
+    return responses.json_response(resource_a.to_dict(expand=expand), etag=etag)
 
 
-@app.route('/resource-a/<resource_a_id>', methods=['PUT'])
+@blueprint.route('/resource-a/<resource_a_id>', methods=['PUT'])
 @protect_500
 @jwt_required
 def update_resource_a(resource_a_id):
@@ -108,7 +167,7 @@ def update_resource_a(resource_a_id):
     return responses.resource_updated(ResourceA.__name__)
 
 
-@app.route('/resource-a/<resource_a_id>', methods=['DELETE'])
+@blueprint.route('/resource-a/<resource_a_id>', methods=['DELETE'])
 @protect_500
 @jwt_required
 def delete_resource_a(resource_a_id):
@@ -0,0 +1,239 @@
+"""
+Tests for resource routes
+"""
+
+# pylint: disable=missing-docstring,invalid-name,no-member,attribute-defined-outside-init
+
+import unittest
+
+from datetime import datetime, timedelta
+
+from .models import ResourceA, ResourceB
+
+from app_name.testing import AppTest
+from app_name.users.models import User
+from app_name.util.queries import record_queries
+
+
+class ResourceATest(AppTest):
+    def setUp(self):
+        super().setUp()
+
+        self.owner = User(email='owner@example.com', password='pass12345')
+        self.db.session.add(self.owner)
+        self.db.session.commit()
+
+        # Two rows share each timestamp so the id tie-breaker is exercised
+        start = datetime(2020, 1, 1)
+        for i in range(10):
+            resource_a = ResourceA(name='Resource {}'.format(i))
+            resource_a.owner_id = self.owner.id
+            resource_a.created_at = start + timedelta(seconds=i // 2)
+            self.db.session.add(resource_a)
+
+        self.db.session.commit()
+
+    def add_resource_b_set(self):
+        for resource_a in ResourceA.query.all():
+            for i in range(3):
+                resource_b = ResourceB(name='{} child {}'.format(resource_a.name, i))
+                resource_b.resource_a_id = resource_a.id
+                self.db.session.add(resource_b)
+
+        self.db.session.commit()
+        self.db.session.expire_all()
+
+
+class ResourceAPaginationTest(ResourceATest):
+    def get_all_pages(self, limit):
+        names, after = [], None
+        while True:
+            url = '/resource-a?limit={}'.format(limit) + ('&after=' + after if after else '')
+            response = self.client.get(url)
+            self.assert200(response)
+
+            names.extend(item['name'] for item in response.json['items'])
+            after = response.json['next_cursor']
+
+            if not after:
+                return names
+
+    def test_pages_cover_all_rows_once(self):
+        for limit in (1, 3, 4, 10):
+            self.assertEqual(self.get_all_pages(limit),
+                             ['Resource {}'.format(i) for i in range(10)])
+
+    def test_last_page_has_no_cursor(self):
+        response = self.client.get('/resource-a?limit=10')
+
+        self.assertEqual(len(response.json['items']), 10)
+        self.assertIsNone(response.json['next_cursor'])
+
+    def test_page_size_is_capped(self):
+        self.app.config['API_MAX_PAGE_SIZE'] = 4
+
+        response = self.client.get('/resource-a?limit=1000')
+
+        self.assertEqual(len(response.json['items']), 4)
+        self.assertIsNotNone(response.json['next_cursor'])
+
+    def test_invalid_params(self):
+        self.assert400(self.client.get('/resource-a?limit=0'))
+        self.assert400(self.client.get('/resource-a?limit=abc'))
+        self.assert400(self.client.get('/resource-a?after=not-a-cursor'))
+
+
+class ResourceAStreamingTest(ResourceATest):
+    def test_stream_returns_every_row(self):
+        self.app.config['STREAM_BATCH_SIZE'] = 3
+        self.app.config['STREAM_CHUNK_SIZE'] = 10
+
+        response = self.client.get('/resource-a?stream=true')
+
+        self.assert200(response)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual([item['name'] for item in response.json['items']],
+                         ['Resource {}'.format(i) for i in range(10)])
+
+    def test_stream_after_cursor(self):
+        after = self.client.get('/resource-a?limit=4').json['next_cursor']
+
+        response = self.client.get('/resource-a?stream=true&after=' + after)
+
+        self.assertEqual([item['name'] for item in response.json['items']],
+                         ['Resource {}'.format(i) for i in range(4, 10)])
+
+    def test_stream_empty_table(self):
+        self.db.session.query(ResourceA).delete()
+        self.db.session.commit()
+
+        response = self.client.get('/resource-a?stream=true')
+
+        self.assertEqual(response.json, {'items': []})
+
+
+class ResourceAExpandTest(ResourceATest):
+    def setUp(self):
+        super().setUp()
+        self.add_resource_b_set()
+
+    def test_expand_single(self):
+        resource_a = ResourceA.query.first()
+
+        response = self.client.get('/resource-a/{}?expand=resource_b'.format(resource_a.id))
+
+        self.assert200(response)
+        self.assertEqual([child['name'] for child in response.json['resource_b_set']],
+                         ['Resource 0 child {}'.format(i) for i in range(3)])
+
+    def test_not_expanded_by_default(self):
+        response = self.client.get('/resource-a')
+
+        self.assertNotIn('resource_b_set', response.json['items'][0])
+
+    def test_expand_list_query_count_is_constant(self):
+        counts = []
+        for limit in (1, 5, 10):
+            self.db.session.expire_all()
+
+            with record_queries() as log:
+                response = self.client.get('/resource-a?expand=resource_b&limit={}'.format(limit))
+
+            self.assertEqual(len(response.json['items']), limit)
+            self.assertTrue(all(len(item['resource_b_set']) == 3
+                                for item in response.json['items']))
+            counts.append(log.count)
+
+        self.assertEqual(counts, [2, 2, 2])
+
+    def test_expand_stream(self):
+        self.app.config['STREAM_BATCH_SIZE'] = 4
+
+        response = self.client.get('/resource-a?stream=true&expand=resource_b')
+
+        self.assertEqual(len(response.json['items']), 10)
+        self.assertTrue(all(len(item['resource_b_set']) == 3 for item in response.json['items']))
+
+    def test_invalid_expand(self):
+        self.assert400(self.client.get('/resource-a?expand=owner'))
+        self.assert400(self.client.get('/resource-a/1?expand=owner'))
+
+
+class ResourceAETagTest(ResourceATest):
+    def setUp(self):
+        super().setUp()
+        self.add_resource_b_set()
+
+        self.resource_a = ResourceA.query.first()
+        self.url = '/resource-a/{}?expand=resource_b'.format(self.resource_a.id)
+
+    def get(self, url, etag):
+        return self.client.get(url, headers={'If-None-Match': '"{}"'.format(etag)})
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        etag, _ = response.get_etag()
+
+        with record_queries() as log:
+            not_modified = self.get(self.url, etag)
+
+        self.assertStatus(not_modified, 304)
+        self.assertEqual(not_modified.get_data(), b'')
+        self.assertEqual(not_modified.get_etag()[0], etag)
+        # Only ids and versions are selected
+        self.assertEqual(log.count, 2)
+        self.assertTrue(all('name' not in statement for statement in log.statements))
+
+    def test_not_modified_sends_the_validator_of_the_compressed_response(self):
+        headers = {'Accept-Encoding': 'gzip'}
+        response = self.client.get(self.url, headers=headers)
+        etag, weak = response.get_etag()
+
+        self.assertTrue(weak)
+
+        not_modified = self.client.get(self.url, headers=dict(
+            headers, **{'If-None-Match': 'W/"{}"'.format(etag)}))
+
+        self.assertStatus(not_modified, 304)
+        self.assertEqual(not_modified.get_etag(), (etag, True))
+
+    def test_update_changes_etag(self):
+        etag, _ = self.client.get(self.url).get_etag()
+
+        self.resource_a.name = 'Renamed'
+        self.db.session.commit()
+
+        response = self.get(self.url, etag)
+
+        self.assert200(response)
+        self.assertEqual(response.json['name'], 'Renamed')
+        self.assertNotEqual(response.get_etag()[0], etag)
+        self.assertEqual(self.resource_a.version, 2)
+
+    def test_expanded_child_changes_etag(self):
+        etag, _ = self.client.get(self.url).get_etag()
+        plain_etag, _ = self.client.get('/resource-a/{}'.format(self.resource_a.id)).get_etag()
+
+        self.assertNotEqual(etag, plain_etag)
+
+        self.resource_a.resource_b_set[0].name = 'Renamed child'
+        self.db.session.commit()
+
+        self.assert200(self.get(self.url, etag))
+        self.assertStatus(self.get('/resource-a/{}'.format(self.resource_a.id), plain_etag), 304)
+
+    def test_list_not_modified(self):
+        url = '/resource-a?limit=4&expand=resource_b'
+        etag, _ = self.client.get(url).get_etag()
+
+        self.assertStatus(self.get(url, etag), 304)
+        self.assert200(self.get('/resource-a?limit=5&expand=resource_b', etag))
+
+        ResourceA.query.order_by(ResourceA.created_at, ResourceA.id).first().name = 'Renamed'
+        self.db.session.commit()
+
+        self.assert200(self.get(url, etag))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,37 +2,37 @@
 Flask security variables and functions
 """
 
-# pylint: disable=invalid-name,wrong-import-position
+# pylint: disable=invalid-name
 
-from flask import url_for
-from flask_admin import helpers as admin_helpers
 from flask_bcrypt import Bcrypt
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_security import Security
 
-from app_name import app
-from app_name.admin import admin
 from app_name.users import datastore
 
-security = Security(app, datastore)
+# Flask-Security's views are the login pages of the admin panel, they extend its templates
+SECURITY_VIEWS_BLUEPRINT = 'admin'
 
-bcrypt = Bcrypt(app)
+security = Security()
 
-jwt = JWTManager(app)
+bcrypt = Bcrypt()
 
-cors = CORS(app, resources={r'*': {'origins': '*'}})
+jwt = JWTManager()
 
+cors = CORS()
 
-@security.context_processor
-def security_context_processor():
+
+def init_app(app):
     """
-    Processes context of admin panel access
+    :param app: Flask
     :return:
     """
-    return dict(
-        admin_base_template=admin.base_template,
-        admin_view=admin.index_view,
-        h=admin_helpers,
-        get_url=url_for
-    )
+    security.init_app(app, datastore, register_blueprint=(
+        SECURITY_VIEWS_BLUEPRINT in app.config.get('BLUEPRINTS')))
+
+    bcrypt.init_app(app)
+
+    jwt.init_app(app)
+
+    cors.init_app(app, resources={r'*': {'origins': '*'}})
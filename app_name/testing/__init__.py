@@ -2,18 +2,39 @@
 Superclass for tests
 """
 
+# pylint: disable=invalid-name,global-statement
+
+from contextlib import contextmanager
+
 from flask_testing import TestCase
 
-from app_name import app
+from app_name import create_app
 from app_name.database import db
+from app_name.util.queries import record_queries
+
+# Shared by every test of the process, created on first use
+_app = None
+
+
+def get_app():
+    """
+    :return: Flask -- the app under test, with TestingConfig
+    """
+    global _app
+
+    if _app is None:
+        _app = create_app('TESTING')
+        _app.testing = True
+
+    return _app
 
 
 class AppTest(TestCase):
     def create_app(self):
-        self.app = app
+        self.app = get_app()
+        # Undoes whatever settings the previous test changed
         self.app.config.from_object('app_name.config.TestingConfig')
-        self.app.testing = True
-        self.client = app.test_client()
+        self.client = self.app.test_client()
 
         return self.app
 
@@ -23,4 +44,30 @@ class AppTest(TestCase):
 
     def tearDown(self):
         self.db.session.remove()
-        self.db.drop_all()
\ No newline at end of file
+        self.db.drop_all()
+
+    @contextmanager
+    def assertMaxQueries(self, n, repeat_threshold=None):
+        """
+        Fails if the block runs more than n statements, or an N+1: a statement run
+        repeat_threshold times or more with different parameters
+        :param n: int
+        :param repeat_threshold: int -- defaults to QUERY_REPEAT_THRESHOLD, 0 skips the check
+        :return: QueryLog
+        """
+        if repeat_threshold is None:
+            repeat_threshold = self.app.config.get('QUERY_REPEAT_THRESHOLD')
+
+        with record_queries() as log:
+            yield log
+
+        self.assertLessEqual(log.count, n, '{} queries run, expected at most {}:\n{}'.format(
+            log.count, n, log.describe()))
+
+        if repeat_threshold:
+            repeated = log.repeated(repeat_threshold)
+
+            if repeated:
+                self.fail('N+1 queries:\n' + '\n'.join(
+                    '{}x {}'.format(times, ' '.join(statement.split()))
+                    for statement, times in repeated))
@@ -0,0 +1,111 @@
+"""
+Query plan checks: records the SELECTs run by a block of code and reports those the database
+can only answer by reading a whole table
+"""
+import re
+
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# SQLite: "SCAN user" (or "SCAN TABLE user" before 3.36), unless followed by an index
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(?P<table>\S+)(?P<rest>.*)$')
+
+# Postgres: "Seq Scan on user"
+POSTGRES_SCAN = re.compile(r'Seq Scan on (?P<table>\S+)')
+
+
+@contextmanager
+def record_selects(engine):
+    """
+    Records the SELECT statements executed on engine inside the block
+    :param engine: Engine
+    :return: list of (statement, parameters), filled as statements run
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def explain(engine, statement, parameters):
+    """
+    Returns the plan of a statement, one line per step
+    On Postgres sequential scans are disabled first, so a Seq Scan in the plan means no index
+    can answer the query at all, rather than the table being too small to bother
+    :param engine: Engine
+    :param statement: str
+    :param parameters: DBAPI parameters
+    :return: list of str
+    """
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+
+        if engine.dialect.name == 'postgresql':
+            cursor.execute('SET enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + statement, parameters)
+            plan = [row[0] for row in cursor.fetchall()]
+            cursor.execute('RESET enable_seqscan')
+        else:
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            plan = [row[-1] for row in cursor.fetchall()]
+
+        cursor.close()
+    finally:
+        connection.close()
+
+    return plan
+
+
+def full_scans(engine, plan):
+    """
+    Returns the tables a plan reads in full
+    SQLite walks of an index (e.g. ORDER BY an indexed column) don't count
+    :param engine: Engine
+    :param plan: list of str returned by explain
+    :return: list of str
+    """
+    tables = []
+
+    for line in plan:
+        line = line.strip()
+
+        if engine.dialect.name == 'postgresql':
+            match = POSTGRES_SCAN.search(line)
+            if match:
+                tables.append(match.group('table'))
+            continue
+
+        match = SQLITE_SCAN.match(line)
+        if match and 'INDEX' not in match.group('rest') and \
+                match.group('table') not in ('CONSTANT', 'SUBQUERY'):
+            tables.append(match.group('table'))
+
+    return tables
+
+
+def find_full_scans(engine, statements):
+    """
+    Explains every recorded statement
+    :param engine: Engine
+    :param statements: list of (statement, parameters) from record_selects
+    :return: list of (statement, tables scanned in full, plan) for the offending statements
+    """
+    offenders = []
+
+    for statement, parameters in statements:
+        plan = explain(engine, statement, parameters)
+        tables = full_scans(engine, plan)
+
+        if tables:
+            offenders.append((statement, tables, plan))
+
+    return offenders
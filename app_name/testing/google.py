@@ -0,0 +1,55 @@
+"""
+Local stand-in for Google's ID token signing keys
+"""
+import json
+import time
+
+import jwt
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+
+class GoogleKeySet(object):
+    """
+    RSA key pair published as a JWKS, used to sign ID tokens the way Google would
+    """
+    def __init__(self, kid='test-key'):
+        self.kid = kid
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048,
+                                                    backend=default_backend())
+
+    def jwks(self):
+        """
+        Returns the public key as a JSON Web Key Set
+        :return: dict
+        """
+        jwk = json.loads(RSAAlgorithm.to_jwk(self.private_key.public_key()))
+        jwk.update(kid=self.kid, alg='RS256', use='sig')
+
+        return {'keys': [jwk]}
+
+    def sign(self, client_id, **claims):
+        """
+        Returns an ID token for client_id signed with this key set
+        :param client_id: str -- audience of the token
+        :param claims: overrides of the default claims
+        :return: str
+        """
+        now = int(time.time())
+
+        payload = {
+            'iss': 'https://accounts.google.com',
+            'aud': client_id,
+            'sub': '1234567890',
+            'email': 'me@johndoe.com',
+            'email_verified': True,
+            'iat': now,
+            'exp': now + 3600
+        }
+        payload.update(claims)
+
+        token = jwt.encode(payload, self.private_key, algorithm='RS256', headers={'kid': self.kid})
+
+        return token.decode('ascii') if isinstance(token, bytes) else token
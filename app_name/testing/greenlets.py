@@ -0,0 +1,165 @@
+"""
+Runs logins, Flask-Mail and SQLAlchemy sessions in concurrent greenlets, as a gevent worker would
+Meant for a fresh interpreter that gevent patched before importing the app, see RUN. Each
+scenario prints whether every greenlet got its own result and how long they took together, to
+compare with the GREENLETS * LATENCY they would take one after the other
+"""
+
+# pylint: disable=no-member,invalid-name
+
+import json
+import time
+
+import gevent
+
+from flask_mail import Message
+
+from app_name import create_app, mail
+from app_name.database import clean_db, db
+from app_name.testing.providers import FakeProviders, facebook_email
+from app_name.testing.smtp import SMTPSink
+from app_name.users.models import OAuthConnection, OAuthConnectionType, User
+
+# Run with python -c: patches the standard library before anything else is imported
+RUN = 'from gevent import monkey; monkey.patch_all(); ' \
+      'from app_name.testing import greenlets; greenlets.main()'
+
+GREENLETS = 20
+LATENCY = 0.2
+
+PASSWORD = 'pass12345'
+
+
+def google_email(i):
+    return 'google-{}@example.com'.format(i)
+
+
+def facebook_id(i):
+    return 'fb-{}'.format(i)
+
+
+def email_address(i):
+    return 'email-{}@example.com'.format(i)
+
+
+def in_greenlets(call, count):
+    """
+    Runs call(i) for i in range(count), each in its own greenlet
+    :return: list of results in order, seconds they took together
+    """
+    start = time.perf_counter()
+    greenlets = [gevent.spawn(call, i) for i in range(count)]
+    gevent.joinall(greenlets, raise_error=True)
+
+    return [greenlet.value for greenlet in greenlets], time.perf_counter() - start
+
+
+def create_users(app, count):
+    """
+    :return: dict of email -> user id
+    """
+    with app.app_context():
+        clean_db(app)
+
+        for i in range(count):
+            db.session.add(User(email=google_email(i)))
+            db.session.add(User(email=email_address(i), password=PASSWORD))
+
+            user = User(email=facebook_email(facebook_id(i)))
+            user.oauth_connections.append(OAuthConnection(
+                type=OAuthConnectionType.FACEBOOK, email_address=user.email,
+                ext_user_id=facebook_id(i), ext_access_token='token'))
+            db.session.add(user)
+
+        db.session.commit()
+
+        return dict(db.session.query(User.email, User.id))
+
+
+def login(app, url, data):
+    """
+    :return: id of the user logged in, or the status code if the login failed
+    """
+    with app.test_client() as client:
+        response = client.post(url, data=json.dumps(data), content_type='application/json')
+
+    return response.json['user_id'] if response.status_code == 200 else response.status_code
+
+
+def hold_session(app, i):
+    """
+    Writes a user through the greenlet's session, yielding to the others in the middle
+    :return: id of the session used
+    """
+    with app.app_context():
+        session = db.session()
+
+        db.session.query(User).count()
+        gevent.sleep(LATENCY)
+
+        db.session.add(User(email='session-{}@example.com'.format(i)))
+        db.session.commit()
+
+        assert db.session() is session
+        session_id = id(session)
+
+        db.session.remove()
+
+        return session_id
+
+
+def send_mail(app, i):
+    with app.app_context():
+        mail.send(Message('Hello', recipients=[email_address(i)], body=str(i)))
+
+
+def report(name, correct, elapsed):
+    print(json.dumps({'scenario': name, 'correct': correct, 'seconds': elapsed}))
+
+
+def main():
+    """
+    Runs every scenario with GREENLETS greenlets and prints one JSON line per scenario
+    :return:
+    """
+    app = create_app('TESTING')
+    app.config.update(GOOGLE_CLIENT_ID='fake.apps.googleusercontent.com',
+                      PASSWORD_HASH_POOL_SIZE=2, PASSWORD_HASH_QUEUE_DEPTH=GREENLETS,
+                      MAIL_DEBUG=False)
+
+    users = create_users(app, GREENLETS)
+
+    with FakeProviders(latency=LATENCY, google_client_id=app.config['GOOGLE_CLIENT_ID']) \
+            as providers:
+        providers.patch()
+
+        results, elapsed = in_greenlets(lambda i: login(
+            app, '/auth/google/login', {'code': google_email(i)}), GREENLETS)
+        report('google', results == [users[google_email(i)] for i in range(GREENLETS)],
+               elapsed)
+
+        results, elapsed = in_greenlets(lambda i: login(
+            app, '/auth/login/facebook', {'user_token': facebook_id(i)}), GREENLETS)
+        report('facebook', results == [users[facebook_email(facebook_id(i))]
+                                       for i in range(GREENLETS)], elapsed)
+
+    # Hashed by the pool processes, waited on by each greenlet
+    results, elapsed = in_greenlets(lambda i: login(
+        app, '/auth/login/email', {'email': email_address(i), 'password': PASSWORD}), GREENLETS)
+    report('email', results == [users[email_address(i)] for i in range(GREENLETS)], elapsed)
+
+    results, elapsed = in_greenlets(lambda i: hold_session(app, i), GREENLETS)
+
+    with app.app_context():
+        written = User.query.filter(User.email.like('session-%')).count()
+
+    report('sessions', len(set(results)) == written == GREENLETS, elapsed)
+
+    with SMTPSink() as sink:
+        app.config.update(MAIL_SERVER=sink.host, MAIL_PORT=sink.port, MAIL_USE_TLS=False,
+                          MAIL_SUPPRESS_SEND=False, MAIL_DEFAULT_SENDER='noreply@example.com')
+        mail.init_app(app)
+
+        _, elapsed = in_greenlets(lambda i: send_mail(app, i), GREENLETS)
+        report('mail', sorted(rcpt_tos[0] for _, rcpt_tos, _ in sink.messages) ==
+               sorted('<{}>'.format(email_address(i)) for i in range(GREENLETS)), elapsed)
@@ -0,0 +1,150 @@
+"""
+Local stand-in for Google's and Facebook's OAuth endpoints
+"""
+
+# pylint: disable=invalid-name
+
+import json
+import socketserver
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import mock
+
+from app_name.auth.google import helpers as google, keys
+from app_name.testing.google import GoogleKeySet
+from app_name.util import constants
+
+
+def facebook_email(user_id):
+    """
+    :param user_id: str -- Facebook user id, which is also the user's token
+    :return: str -- email address Facebook has for the user
+    """
+    return '{}@facebook.example.com'.format(user_id)
+
+
+def patch_endpoints(url):
+    """
+    Points the provider endpoints of the login flows at a FakeProviders server
+    :param url: str -- e.g. 'http://127.0.0.1:8000', of a server possibly in another process
+    :return: list of started patchers, for the caller to stop
+    """
+    patchers = [
+        mock.patch.object(google, 'GOOGLE_OAUTH2_ENDPOINT', url + '/google/token'),
+        mock.patch.object(keys.key_cache, 'url', url + '/google/certs'),
+        mock.patch.object(constants, 'FB_GRAPH_API_URL', url + '/facebook'),
+    ]
+
+    for patcher in patchers:
+        patcher.start()
+
+    return patchers
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    """
+    Answers the calls of the Google and Facebook logins after the provider's latency
+    """
+    # Keeps connections alive, as the providers do
+    protocol_version = 'HTTP/1.1'
+
+    def reply(self, data, headers=None):
+        body = json.dumps(data).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def answer(self, path, params):
+        provider = self.server.provider
+        provider.calls += 1
+
+        time.sleep(provider.latency)
+
+        # Google codes are the emails of the users they log in
+        if path == '/google/token':
+            return self.reply({'access_token': 'access', 'refresh_token': 'refresh',
+                               'id_token': provider.key_set.sign(
+                                   provider.google_client_id, email=params['code'],
+                                   sub=params['code'])})
+
+        if path == '/google/certs':
+            return self.reply(provider.key_set.jwks(), {'Cache-Control': 'max-age=3600'})
+
+        # Facebook user tokens are the ids of the users they belong to
+        if path == '/facebook/oauth/access_token':
+            return self.reply({'access_token': params.get('fb_exchange_token', 'app-token')})
+
+        if path == '/facebook/debug_token':
+            return self.reply({'data': {'is_valid': True, 'user_id': params['input_token']}})
+
+        if path.startswith('/facebook/v2.11/'):
+            user_id = self.headers['Authorization'].split()[-1]
+            return self.reply({'id': user_id, 'first_name': 'Fake', 'last_name': 'Facebook',
+                               'email': facebook_email(user_id)})
+
+        return self.send_error(404)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.answer(url.path, {key: values[0] for key, values in parse_qs(url.query).items()})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        self.answer(self.path, {key: values[0] for key, values in parse_qs(body).items()})
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    HTTPServer answering each connection in its own thread
+    """
+    daemon_threads = True
+    # Every login of a benchmark may connect at once, see SMTPSinkServer
+    request_queue_size = 128
+
+
+class FakeProviders(object):
+    """
+    Threaded HTTP server on a free localhost port answering as Google and Facebook would, each
+    call after latency seconds. Use as a context manager; patch() points the app at it
+    """
+    def __init__(self, latency=0.0, google_client_id='fake.apps.googleusercontent.com'):
+        self.latency = latency
+        self.google_client_id = google_client_id
+        self.key_set = GoogleKeySet()
+        self.calls = 0
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeProviderHandler)
+        self.server.provider = self
+
+        self.host, self.port = self.server.server_address
+        self.url = 'http://{}:{}'.format(self.host, self.port)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def patch(self):
+        """
+        Points the provider endpoints of the login flows at this server
+        :return: list of started patchers, for the caller to stop
+        """
+        return patch_endpoints(self.url)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.server.shutdown()
+        self.server.server_close()
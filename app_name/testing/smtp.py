@@ -0,0 +1,93 @@
+"""
+Local SMTP sink standing in for the mail server in tests
+"""
+
+# pylint: disable=invalid-name
+
+import socketserver
+import threading
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """
+    Speaks just enough SMTP for smtplib: one connection can carry any number of messages
+    """
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode('ascii'))
+
+    def handle(self):
+        sink = self.server.sink
+        sink.connections += 1
+
+        self.reply('220 localhost SMTP sink')
+
+        mail_from, rcpt_tos = None, []
+
+        for raw_line in self.rfile:
+            line = raw_line.decode('utf-8').rstrip('\r\n')
+            command = line[:4].upper()
+
+            if command in ('HELO', 'EHLO'):
+                self.reply('250 localhost')
+            elif command == 'MAIL':
+                mail_from, rcpt_tos = line[10:], []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                rcpt_tos.append(line[8:])
+                self.reply('250 OK')
+            elif command == 'DATA':
+                if sink.fail_data:
+                    self.reply('451 Requested action aborted: local error')
+                    continue
+
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+
+                data = []
+                for data_line in self.rfile:
+                    if data_line.rstrip(b'\r\n') == b'.':
+                        break
+                    data.append(data_line)
+
+                sink.messages.append((mail_from, rcpt_tos, b''.join(data)))
+                self.reply('250 OK')
+            elif command in ('RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPSinkServer(socketserver.ThreadingTCPServer):
+    """
+    Accepts as many connections at once as a test opens, instead of socketserver's 5: a client
+    whose connection overflows the backlog waits forever for the greeting
+    """
+    request_queue_size = 128
+
+
+class SMTPSink(object):
+    """
+    Threaded SMTP server on a free localhost port that records every message it receives
+    Use as a context manager; set fail_data to reject messages with a transient error
+    """
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+        self.fail_data = False
+
+        self.server = SMTPSinkServer(('127.0.0.1', 0), SMTPSinkHandler)
+        self.server.daemon_threads = True
+        self.server.sink = self
+
+        self.host, self.port = self.server.server_address
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.server.shutdown()
+        self.server.server_close()
@@ -4,10 +4,16 @@ Initialize user module
 
 # pylint: disable=invalid-name
 
+from flask import Blueprint
 from flask_security import SQLAlchemyUserDatastore
 
+from .cache import listen_for_user_changes
 from .models import User, Role
 
 from app_name.database import db
 
+blueprint = Blueprint('users', __name__)
+
 datastore = SQLAlchemyUserDatastore(db, User, Role)
+
+listen_for_user_changes(User)
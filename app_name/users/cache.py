@@ -0,0 +1,112 @@
+"""
+Per-process cache of user rows backing profile reads, see load_api_user
+Entries are dropped once a transaction that updated or deleted the user commits, in this process
+only: other workers keep serving theirs until USER_CACHE_TTL expires them
+"""
+
+# pylint: disable=invalid-name,global-statement,unused-argument
+
+import os
+import threading
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app_name.util.cache import TTLCache
+
+# Per process state -- reset whenever the pid changes, i.e. after a fork
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+# session.info key of the user ids to invalidate when the session commits
+PENDING_INVALIDATIONS = 'invalidated_user_ids'
+
+
+def get_user_cache():
+    """
+    Returns this process' user cache, creating it on first use
+    :return: TTLCache or None if USER_CACHE_SIZE is 0
+    """
+    global _cache, _cache_pid
+
+    if not current_app.config.get('USER_CACHE_SIZE'):
+        return None
+
+    if _cache is None or _cache_pid != os.getpid():
+        with _cache_lock:
+            if _cache is None or _cache_pid != os.getpid():
+                _cache = TTLCache(current_app.config.get('USER_CACHE_SIZE'),
+                                  current_app.config.get('USER_CACHE_TTL'))
+                _cache_pid = os.getpid()
+
+    return _cache
+
+
+def invalidate_user(user_id):
+    """
+    Drops a user's cached row
+    :param user_id: int
+    :return:
+    """
+    cache = get_user_cache()
+
+    if cache is not None:
+        cache.delete(user_id)
+
+
+def clear_user_cache():
+    """
+    Drops every cached user row
+    :return:
+    """
+    cache = get_user_cache()
+
+    if cache is not None:
+        cache.clear()
+
+
+def mark_user_changed(mapper, connection, user):
+    """
+    Mapper event: remembers a flushed update/delete of a user until the session commits
+    Also drops the entry right away so this process doesn't serve it while the commit is pending
+    """
+    session = Session.object_session(user)
+
+    if session is not None:
+        session.info.setdefault(PENDING_INVALIDATIONS, set()).add(user.id)
+
+    invalidate_user(user.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_committed_users(session):
+    """
+    Drops the cached rows of users updated or deleted by the committed transaction
+    :param session: Session
+    :return:
+    """
+    for user_id in session.info.pop(PENDING_INVALIDATIONS, ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def forget_rolled_back_users(session, previous_transaction):
+    """
+    Rolled back changes never reached the database, so there's nothing to invalidate
+    :param session: Session
+    :param previous_transaction: SessionTransaction
+    :return:
+    """
+    session.info.pop(PENDING_INVALIDATIONS, None)
+
+
+def listen_for_user_changes(user_class):
+    """
+    Registers the update/delete mapper events of the User model
+    :param user_class: User
+    :return:
+    """
+    event.listen(user_class, 'after_update', mark_user_changed)
+    event.listen(user_class, 'after_delete', mark_user_changed)
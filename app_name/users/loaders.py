@@ -0,0 +1,86 @@
+"""
+Loading of the user making the current API request
+"""
+
+# pylint: disable=invalid-name
+
+from flask import _request_ctx_stack
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .cache import get_user_cache
+from .models import User
+
+from app_name.database import db
+from app_name.database.routing import use_primary
+
+
+def snapshot_user(user):
+    """
+    Copies a user's column values, which is what gets cached
+    :param user: User
+    :return: dict
+    """
+    return {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+
+
+def restore_user(row):
+    """
+    Adds a cached user row to the session as a persistent User, without querying for it
+    :param row: dict returned by snapshot_user
+    :return: User
+    """
+    user = inspect(User).class_manager.new_instance()
+
+    for key, value in row.items():
+        set_committed_value(user, key, value)
+
+    make_transient_to_detached(user)
+
+    return db.session.merge(user, load=False)
+
+
+def load_api_user(user_id, cached=False):
+    """
+    Loads a user by id from the primary, or from the per-process cache when cached
+    Only profile reads may use the cache: its rows can be USER_CACHE_TTL seconds behind a change
+    made through another worker, e.g. a new password or a deactivation
+    :param user_id: int
+    :param cached: bool
+    :return: User or None
+    """
+    cache = get_user_cache()
+
+    row = cache.get(user_id) if cache is not None and cached else None
+
+    if row is not None:
+        return restore_user(row)
+
+    # Cached rows must never be behind the primary, whatever the request reads from
+    with use_primary(db.session):
+        user = User.query.get(user_id)
+
+    if user is not None and cache is not None:
+        cache.set(user_id, snapshot_user(user))
+
+    return user
+
+
+def get_current_api_user(cached=False):
+    """
+    Returns the user identified by the request's JWT, loaded at most once per request
+    Kept on the request context rather than g, which outlives the request when an app context
+    was already pushed
+    :param cached: bool -- may come from the user cache, for profile reads only, see load_api_user
+    :return: User or None
+    """
+    ctx = _request_ctx_stack.top
+    loaded = getattr(ctx, 'current_api_user', None)
+
+    # A possibly stale cached row can't stand in for a fresh one
+    if loaded is None or (loaded[1] and not cached):
+        loaded = ctx.current_api_user = load_api_user(get_jwt_identity(), cached), cached
+
+    return loaded[0]
@@ -9,17 +9,19 @@ from enum import Enum
 
 from datetime import datetime
 
-from sqlalchemy.sql.expression import and_
-
 from flask_security import UserMixin, RoleMixin
-from flask_security.utils import hash_password, verify_password
 
 from app_name.database import db
+from app_name.database.mixins import AttrFilterMixin, VersionMixin
+from app_name.util.passwords import hash_password, verify_password
 
 roles_users = db.Table(
     'roles_users',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
-    db.Column('role_id', db.Integer, db.ForeignKey('role.id'))
+    db.Column('role_id', db.Integer, db.ForeignKey('role.id')),
+    # A user's roles are loaded on every admin request, a role's users when it's deleted
+    db.Index('ix_roles_users_user_id_role_id', 'user_id', 'role_id'),
+    db.Index('ix_roles_users_role_id', 'role_id')
 )
 
 
@@ -35,7 +37,7 @@ class Role(db.Model, RoleMixin):
         return self.name
 
 
-class User(db.Model, UserMixin):
+class User(db.Model, UserMixin, AttrFilterMixin, VersionMixin):
     """
     User superclass to inherit auth token function
     """
@@ -45,7 +47,8 @@ class User(db.Model, UserMixin):
     first_name = db.Column(db.Text)
     last_name = db.Column(db.Text)
     email = db.Column(db.Text, unique=True, nullable=False)
-    password = db.Column(db.Text, nullable=False)
+    # NULL for passwordless accounts, which Flask-Security's and passlib's checks reject
+    password = db.Column(db.Text)
     phone_number = db.Column(db.Text, unique=True)
     image_url = db.Column(db.Text)
 
@@ -72,8 +75,10 @@ class User(db.Model, UserMixin):
         self.first_name = data.get('first_name', '')
         self.last_name = data.get('last_name', '')
         self.email = data.get('email', '')
-        self.password = hash_password(data.get('password', ''))
-        self.phone_number = data.get('phone_number', '')
+        # Passwordless accounts (e.g. Google signups) skip hashing and can never log in by password
+        self.password = hash_password(data['password']) if data.get('password') else None
+        # Unique, so a missing number must be NULL rather than ''
+        self.phone_number = data.get('phone_number') or None
         self.image_url = data.get('image_url', '')
 
         self.active = data.get('is_active', True)
@@ -143,24 +148,17 @@ class User(db.Model, UserMixin):
         return [connection for connection in self.oauth_connections if connection.type == provider]
 
     @classmethod
-    def get_user_by_attrs(cls, get_all=False, **attrs):
+    def get_user_by_attrs(cls, get_all=False, limit=None, offset=None, **attrs):
         """
         Filters users by provided attributes
         Provided attributes must be in User class
         :param get_all: bool
+        :param limit: int
+        :param offset: int
         :param attrs: dict
         :return: user
         """
-        if not all(attr in cls.__dict__ for attr in attrs):
-            return None
-
-        filters = []
-        for attr, value in attrs.items():
-            filters.append(eval('{}.{}'.format(cls.__name__, attr)) == value)
-
-        query = cls.query.filter(and_(*filters))
-
-        return query.all() if get_all else query.first()
+        return cls.filter_by_attrs(get_all=get_all, limit=limit, offset=offset, **attrs)
 
 
 class OAuthConnectionType(Enum):
@@ -171,11 +169,17 @@ class OAuthConnectionType(Enum):
     GOOGLE = 'google'
 
 
-class OAuthConnection(db.Model):
+class OAuthConnection(db.Model, AttrFilterMixin):
     """
     Class to create various connected accounts
     """
     __tablename__ = 'oauth_connection'
+    __table_args__ = (
+        db.Index('ix_oauth_connection_owner_id', 'owner_id'),
+        # Google logins look connections up by email, Facebook logins by Facebook user id
+        db.Index('ix_oauth_connection_type_email_address', 'type', 'email_address'),
+        db.Index('ix_oauth_connection_type_ext_user_id', 'type', 'ext_user_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -1,53 +1,98 @@
 """
 Endpoints for user CRUD excluding signup
 """
-from flask import request, jsonify
+from flask import current_app, request
 
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 
+from . import blueprint
+from .loaders import get_current_api_user
 from .models import User
 
-from app_name import app
 
 from app_name.database import db
+from app_name.database.routing import reads_from_primary
 
-from app_name.util import status, responses
+from app_name.util import etags, responses
 from app_name.util.exceptions import protect_500
 
 
-@app.route('/users/<user_id>', methods=['GET'])
+@blueprint.route('/users', methods=['GET'])
+@protect_500
+def get_public_profiles():
+    """
+    Returns the public profiles of several users with one query
+    Takes a comma separated `ids` arg, e.g. /users?ids=1,2,3
+    :return: profiles keyed by user id and the list of ids that weren't found
+    """
+    ids = request.args.get('ids')
+
+    if not ids:
+        return responses.missing_params()
+
+    try:
+        user_ids = {int(user_id) for user_id in ids.split(',')}
+    except ValueError:
+        return responses.invalid_ids('ids must be integers')
+
+    max_ids = current_app.config.get('USERS_BATCH_MAX_IDS')
+
+    if len(user_ids) > max_ids:
+        return responses.invalid_ids('at most {} ids can be requested'.format(max_ids))
+
+    users = User.query.filter(User.id.in_(user_ids)).all()
+    found_ids = {user.id for user in users}
+
+    return responses.json_response({
+        'items': {str(user.id): user.public_dict() for user in users},
+        'missing': sorted(user_ids - found_ids)
+    })
+
+
+@blueprint.route('/users/<user_id>', methods=['GET'])
 @protect_500
 def get_public_profile(user_id):
     """
     Returns user's profile information based on user_id provided
     :return:
     """
+    if etags.is_conditional():
+        versions = User.query.with_entities(User.id, User.version) \
+            .filter(User.id == user_id) \
+            .all()
+
+        if versions:
+            etag = etags.rows_etag(User, versions)
+
+            if etags.is_not_modified(etag):
+                return responses.not_modified(etag)
+
     user = User.query.get(user_id)
 
     if not user:
         return responses.user_not_found()
 
-    return jsonify(user.public_dict()), status.OK
+    return responses.json_response(user.public_dict(), etag=etags.rows_etag(User, [user]))
 
 
-@app.route('/users/me', methods=['GET'])
+@blueprint.route('/users/me', methods=['GET'])
 @protect_500
 @jwt_required
+@reads_from_primary
 def get_my_profile():
     """
     Returns current user's profile information
     :return:
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_api_user(cached=True)
 
     if not user:
         return responses.user_not_found()
 
-    return jsonify(user.to_dict()), status.OK
+    return responses.json_response(user.to_dict())
 
 
-@app.route('/users/me', methods=['PUT'])
+@blueprint.route('/users/me', methods=['PUT'])
 @protect_500
 @jwt_required
 def update_profile():
@@ -67,8 +112,7 @@ def update_profile():
     if not all(attr in valid_attrs for attr in update_attrs):
         return responses.invalid_request_keys(set(update_attrs) - valid_attrs)
 
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_api_user()
 
     if not user:
         return responses.user_not_found()
@@ -91,7 +135,7 @@ def update_profile():
     return responses.user_updated(password_changed=changed)
 
 
-@app.route('/users/me', methods=['DELETE'])
+@blueprint.route('/users/me', methods=['DELETE'])
 @protect_500
 @jwt_required
 def delete_profile():
@@ -99,9 +143,7 @@ def delete_profile():
     Deletes requester's account
     :return:
     """
-    user_id = get_jwt_identity()
-
-    user = User.query.get(user_id)
+    user = get_current_api_user()
 
     if not user:
         return responses.user_not_found()
@@ -7,9 +7,17 @@ Tests for User classes
 import json
 import unittest
 
-from .models import User
+import mock
+
+from flask_jwt_extended import create_access_token
+
+from .cache import clear_user_cache, get_user_cache
+from .models import User, OAuthConnection, OAuthConnectionType
 
 from app_name.testing import AppTest
+from app_name.util import passwords
+from app_name.util.queries import record_queries
+from app_name.util.exceptions import HashingPoolSaturated
 
 
 class UserTest(AppTest):
@@ -29,9 +37,138 @@ class UserTest(AppTest):
         self.assertEqual(user, q_user)
 
 
+class UserFilterTest(AppTest):
+    def setUp(self):
+        super().setUp()
+
+        self.users = [User(first_name='John' if i < 3 else 'Jane', last_name=str(i),
+                           email='{}@example.com'.format(i), phone_number=str(i),
+                           password='pass12345') for i in range(5)]
+
+        self.db.session.add_all(self.users)
+        self.db.session.commit()
+
+    def test_get_user_by_attrs(self):
+        self.assertEqual(User.get_user_by_attrs(email='3@example.com'), self.users[3])
+        self.assertEqual(User.get_user_by_attrs(first_name='John', last_name='1'), self.users[1])
+        self.assertIsNone(User.get_user_by_attrs(email='nobody@example.com'))
+
+    def test_get_all_with_limit_and_offset(self):
+        johns = User.get_user_by_attrs(get_all=True, first_name='John')
+        self.assertEqual(johns, self.users[:3])
+
+        self.assertEqual(User.get_user_by_attrs(get_all=True, limit=2, first_name='John'),
+                         johns[:2])
+        self.assertEqual(User.get_user_by_attrs(get_all=True, limit=1, offset=1,
+                                                first_name='John'), johns[1:2])
+
+    def test_null_values(self):
+        self.users[4].image_url = None
+        self.db.session.commit()
+
+        self.assertEqual(User.get_user_by_attrs(image_url=None), self.users[4])
+
+    def test_unknown_attrs(self):
+        self.assertIsNone(User.get_user_by_attrs(oauth_connections=[]))
+        self.assertIsNone(User.get_user_by_attrs(__class__=User))
+
+    def test_registry_shared_by_models(self):
+        connection = OAuthConnection(owner_id=self.users[0].id, type=OAuthConnectionType.GOOGLE,
+                                     email_address='0@example.com')
+        self.db.session.add(connection)
+        self.db.session.commit()
+
+        self.assertEqual(OAuthConnection.filter_by_attrs(type=OAuthConnectionType.GOOGLE,
+                                                         email_address='0@example.com'),
+                         connection)
+        self.assertEqual(len(User.filter_columns()), len(User.__table__.columns))
+
+
+class PasswordHashingTest(AppTest):
+    def setUp(self):
+        super().setUp()
+
+        self.app.config['PASSWORD_HASH_POOL_SIZE'] = 1
+        self.app.config['PASSWORD_HASH_QUEUE_DEPTH'] = 0
+
+    def tearDown(self):
+        passwords.shutdown_pool()
+
+        super().tearDown()
+
+    def test_hash_in_pool(self):
+        password_hash = passwords.hash_password('pass12345')
+
+        self.assertTrue(password_hash.startswith('$pbkdf2-sha512$'))
+        self.assertTrue(passwords.verify_password('pass12345', password_hash))
+        self.assertFalse(passwords.verify_password('wrong', password_hash))
+
+    def test_passwordless_user_skips_hashing(self):
+        user = User(email='google@example.com')
+
+        self.assertIsNone(user.password)
+        self.assertFalse(passwords.verify_password('', user.password))
+        self.assertFalse(user.change_password('', 'new password'))
+
+    def test_passwordless_user_rejected_by_admin_login(self):
+        self.db.session.add(User(email='google@example.com'))
+        self.db.session.commit()
+
+        with mock.patch.dict(self.app.config, {'WTF_CSRF_ENABLED': False}):
+            response = self.client.post('/admin/login/', data={
+                'email': 'google@example.com',
+                'password': 'pass12345'
+            })
+
+        self.assert200(response)
+        self.assertIn(b'No password is set for this user', response.data)
+
+    def test_slow_hash_rejected(self):
+        self.app.config['PASSWORD_HASH_TIMEOUT'] = 0
+
+        with self.assertRaises(HashingPoolSaturated):
+            passwords.hash_password('pass12345')
+
+    def test_broken_pool_replaced(self):
+        pool, _ = passwords.get_pool()
+        passwords.hash_password('pass12345')
+
+        for process in list(pool._processes.values()):
+            process.kill()
+            process.join()
+
+        self.assertTrue(passwords.verify_password(
+            'pass12345', passwords.hash_password('pass12345')))
+        self.assertIsNot(passwords.get_pool()[0], pool)
+
+    def test_saturated_pool_rejects_login(self):
+        user = User(email='me@johndoe.com', password='pass12345')
+        self.db.session.add(user)
+        self.db.session.commit()
+
+        _, slots = passwords.get_pool()
+        slots.acquire()
+        try:
+            response = self.client.post('/auth/login/email', data=json.dumps({
+                'email': 'me@johndoe.com',
+                'password': 'pass12345'
+            }), content_type='application/json')
+        finally:
+            slots.release()
+
+        self.assertStatus(response, 503)
+
+        response = self.client.post('/auth/login/email', data=json.dumps({
+            'email': 'me@johndoe.com',
+            'password': 'pass12345'
+        }), content_type='application/json')
+
+        self.assert200(response)
+
+
 class UserAPITest(AppTest):
     def test_signup(self):
-        response = self.client.post('/signup/email', data=json.dumps({
+        response = self.client.post('/auth/signup/email', data=json.dumps({
             'email': 'me@johndoe.com',
             'password': 'pass12345',
             'first_name': 'John',
@@ -41,7 +178,7 @@ class UserAPITest(AppTest):
         self.assert_status(response, 201)
 
     def test_delete(self):
-        signup_response = self.client.post('/signup/email', data=json.dumps({
+        signup_response = self.client.post('/auth/signup/email', data=json.dumps({
             'email': 'me@johndoe.com',
             'password': 'pass12345',
             'first_name': 'John',
@@ -60,7 +197,7 @@ class UserAPITest(AppTest):
         self.assert_status(delete_response, 200)
 
     def test_update(self):
-        signup_response = self.client.post('/signup/email', data=json.dumps({
+        signup_response = self.client.post('/auth/signup/email', data=json.dumps({
             'email': 'me@johndoe.com',
             'password': 'pass12345',
             'first_name': 'John',
@@ -81,10 +218,10 @@ class UserAPITest(AppTest):
             headers={'Authorization': 'Bearer {}'.format(signup_response.json['app_access_token'])}
         )
 
-        self.assert_status(update_response, 201)
+        self.assert_status(update_response, 200)
 
     def test_login(self):
-        signup_response = self.client.post('/signup/email', data=json.dumps({
+        signup_response = self.client.post('/auth/signup/email', data=json.dumps({
             'email': 'me@johndoe.com',
             'password': 'pass12345',
             'first_name': 'John',
@@ -93,7 +230,7 @@ class UserAPITest(AppTest):
 
         self.assert_status(signup_response, 201)
 
-        login_response = self.client.post('/login/email', data=json.dumps({
+        login_response = self.client.post('/auth/login/email', data=json.dumps({
             'email': 'me@johndoe.com',
             'password': 'pass12345'
         }), content_type='application/json', follow_redirects=True)
@@ -101,5 +238,136 @@ class UserAPITest(AppTest):
         self.assertStatus(login_response, 200)
 
 
+class UserBatchLookupTest(AppTest):
+    def setUp(self):
+        super().setUp()
+
+        self.users = [User(first_name='User', last_name=str(i), email='{}@example.com'.format(i),
+                           phone_number=str(i), password='pass12345') for i in range(3)]
+
+        self.db.session.add_all(self.users)
+        self.db.session.commit()
+
+    def test_batch_lookup(self):
+        ids = [user.id for user in self.users]
+        self.db.session.remove()
+
+        with self.assertMaxQueries(1):
+            response = self.client.get('/users?ids={},{},{},9999'.format(*ids))
+
+        self.assert200(response)
+        self.assertEqual(set(response.json['items']), {str(user_id) for user_id in ids})
+        self.assertEqual(response.json['items'][str(ids[0])], User.query.get(ids[0]).public_dict())
+        self.assertEqual(response.json['missing'], [9999])
+
+    def test_batch_lookup_invalid_ids(self):
+        self.assert400(self.client.get('/users'))
+        self.assert400(self.client.get('/users?ids=1,a'))
+
+        self.app.config['USERS_BATCH_MAX_IDS'] = 2
+        self.assert400(self.client.get('/users?ids=1,2,3'))
+
+    def test_public_profile_not_modified(self):
+        url = '/users/{}'.format(self.users[0].id)
+        etag, _ = self.client.get(url).get_etag()
+        headers = {'If-None-Match': '"{}"'.format(etag)}
+
+        self.assertStatus(self.client.get(url, headers=headers), 304)
+
+        self.users[0].first_name = 'Renamed'
+        self.db.session.commit()
+
+        response = self.client.get(url, headers=headers)
+
+        self.assert200(response)
+        self.assertEqual(response.json['first_name'], 'Renamed')
+
+
+class UserCacheTest(AppTest):
+    def setUp(self):
+        super().setUp()
+
+        self.app.config['USER_CACHE_SIZE'] = 10
+        clear_user_cache()
+
+        self.user = User(first_name='John', last_name='Doe', email='me@johndoe.com',
+                         password='pass12345')
+        self.db.session.add(self.user)
+        self.db.session.commit()
+
+        self.user_id = self.user.id
+        self.headers = {'Authorization': 'Bearer {}'.format(create_access_token(self.user_id))}
+
+        recorder = record_queries()
+        self.log = recorder.__enter__()
+        self.addCleanup(recorder.__exit__, None, None, None)
+
+    def tearDown(self):
+        clear_user_cache()
+        self.app.config['USER_CACHE_SIZE'] = 0
+
+        super().tearDown()
+
+    def user_selects(self):
+        return sum(len(runs) for statement, runs in self.log.statements.items()
+                   if 'FROM user' in statement)
+
+    def request(self, method, **kwargs):
+        # Each request starts with an empty session, as it does outside of tests
+        self.db.session.remove()
+
+        return getattr(self.client, method)('/users/me', headers=self.headers, **kwargs)
+
+    def test_cached_user_skips_query(self):
+        self.assert200(self.request('get'))
+        self.assertEqual(self.user_selects(), 1)
+
+        response = self.request('get')
+
+        self.assert200(response)
+        self.assertEqual(response.json['first_name'], 'John')
+        self.assertEqual(self.user_selects(), 1)
+
+    def test_writes_load_user_from_database(self):
+        self.assert200(self.request('get'))
+
+        # As another worker would, leaving this one's cached row behind
+        self.db.session.execute(User.__table__.update().values(first_name='Jim'))
+        self.db.session.commit()
+        selects = self.user_selects()
+
+        self.assert200(self.request('put', data=json.dumps({'last_name': 'Smith'}),
+                                    content_type='application/json'))
+
+        self.assertEqual(self.user_selects(), selects + 1)
+        self.assertEqual(self.request('get').json['first_name'], 'Jim')
+
+    def test_update_invalidates(self):
+        self.assert200(self.request('get'))
+        self.assert200(self.request('put', data=json.dumps({'first_name': 'Johnny'}),
+                                    content_type='application/json'))
+
+        self.assertEqual(self.request('get').json['first_name'], 'Johnny')
+        self.assertEqual(User.query.get(self.user_id).first_name, 'Johnny')
+
+    def test_delete_invalidates(self):
+        self.assert200(self.request('get'))
+        self.assert200(self.request('delete'))
+
+        self.assertIsNone(get_user_cache().get(self.user_id))
+        self.assert404(self.request('get'))
+
+    def test_rollback_keeps_nothing_pending(self):
+        self.assert200(self.request('get'))
+
+        user = User.query.get(self.user_id)
+        user.first_name = 'Jim'
+        self.db.session.flush()
+        self.db.session.rollback()
+
+        self.assertNotIn('invalidated_user_ids', self.db.session().info)
+        self.assertEqual(self.request('get').json['first_name'], 'John')
+
+
 if __name__ == '__main__':
     unittest.main()
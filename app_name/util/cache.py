@@ -0,0 +1,127 @@
+"""
+In-process caches
+"""
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class ExpiringValue(object):
+    """
+    Process-wide value fetched on demand and kept for ttl seconds
+    Concurrent callers of an expired value wait on a single fetch instead of each making one
+    """
+    def __init__(self, fetch, ttl):
+        """
+        :param fetch: function returning a fresh value
+        :param ttl: float -- seconds a fetched value is kept, or a function returning it
+        """
+        self.fetch = fetch
+        self.ttl = ttl
+
+        self.value = None
+        self.expires_at = 0
+
+        self.lock = threading.Lock()
+
+    def get(self):
+        """
+        Returns the cached value, fetching it if it's missing or expired
+        :return:
+        """
+        if self.value is not None and time.time() < self.expires_at:
+            return self.value
+
+        with self.lock:
+            # Another caller may have fetched it while we waited for the lock
+            if self.value is not None and time.time() < self.expires_at:
+                return self.value
+
+            value = self.fetch()
+
+            if value is not None:
+                ttl = self.ttl() if callable(self.ttl) else self.ttl
+                self.value, self.expires_at = value, time.time() + ttl
+
+            return value
+
+    def invalidate(self, stale=None):
+        """
+        Drops the cached value
+        :param stale: only drop the value if it's still this one, so a value that another
+                      caller already refreshed isn't thrown away
+        :return:
+        """
+        with self.lock:
+            if stale is None or self.value == stale:
+                self.value, self.expires_at = None, 0
+
+
+class TTLCache(object):
+    """
+    Bounded LRU cache whose entries expire ttl seconds after being set
+    """
+    def __init__(self, max_size, ttl):
+        """
+        :param max_size: int -- least recently used entries are evicted beyond this
+        :param ttl: float -- seconds an entry is kept
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the cached value or None if it's missing or expired
+        :param key:
+        :return:
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+
+            if time.time() >= expires_at:
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+
+            return value
+
+    def set(self, key, value):
+        """
+        Caches a value, evicting the least recently used entry if the cache is full
+        :param key:
+        :param value:
+        :return:
+        """
+        with self.lock:
+            self.entries[key] = (value, time.time() + self.ttl)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Drops a cached value if there is one
+        :param key:
+        :return:
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        """
+        Drops every cached value
+        :return:
+        """
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,223 @@
+"""
+Response compression negotiated with Accept-Encoding
+Bodies of compressible types above COMPRESS_MIN_SIZE are gzipped, or brotli-compressed when the
+brotli package is installed and the client prefers it. Streamed responses are compressed chunk
+by chunk, and static files are served from a precompressed .gz sibling when there is one
+"""
+
+# pylint: disable=invalid-name
+
+import gzip
+import mimetypes
+import os
+import zlib
+
+import click
+
+from flask import current_app, request, send_from_directory
+from flask.cli import with_appcontext
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Offered to clients in order of preference
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding():
+    """
+    Picks the best encoding the client accepts
+    :return: str or None
+    """
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def weakens_etags():
+    """
+    Whether the request negotiated an encoding, in which case the ETags of compressible
+    responses are weak, see compress_response
+    :return: bool
+    """
+    return bool(current_app.config.get('COMPRESS_ENABLED') and negotiate_encoding())
+
+
+def compress_body(data, encoding):
+    """
+    Compresses a whole body
+    :param data: bytes
+    :param encoding: str -- 'gzip' or 'br'
+    :return: bytes
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=current_app.config.get('COMPRESS_BR_LEVEL'))
+
+    return gzip.compress(data, compresslevel=current_app.config.get('COMPRESS_LEVEL'))
+
+
+def compress_chunks(chunks, encoding, close=None):
+    """
+    Compresses a streamed body, flushing after every chunk so the client gets each one right away
+    The compressor is set up right away, since the body is only streamed once the request, and
+    the app context giving its settings, are gone
+    :param chunks: iterable of bytes
+    :param encoding: str -- 'gzip' or 'br'
+    :param close: function closing the original body, called once streaming stops
+    :return: generator of bytes
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=current_app.config.get('COMPRESS_BR_LEVEL'))
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        # wbits 31 writes a gzip header and trailer around the deflate stream
+        compressor = zlib.compressobj(current_app.config.get('COMPRESS_LEVEL'), zlib.DEFLATED,
+                                      31)
+        process, finish = compressor.compress, compressor.flush
+
+        def flush():
+            return compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    return stream_compressed(chunks, process, flush, finish, close)
+
+
+def stream_compressed(chunks, process, flush, finish, close):
+    """
+    :param chunks: iterable of bytes
+    :param process: function compressing a chunk
+    :param flush: function returning what the compressor holds back
+    :param finish: function ending the stream
+    :param close: function closing the original body, or None
+    :return: generator of bytes
+    """
+    try:
+        for chunk in chunks:
+            if chunk:
+                yield process(chunk) + flush()
+
+        yield finish()
+    finally:
+        if close is not None:
+            close()
+
+
+def is_compressible(response):
+    """
+    Whether a response's type and status allow compressing it at all
+    :param response: Response
+    :return: bool
+    """
+    return (current_app.config.get('COMPRESS_ENABLED') and
+            200 <= response.status_code < 300 and response.status_code != 204 and
+            response.mimetype in current_app.config.get('COMPRESS_MIMETYPES') and
+            not response.direct_passthrough and
+            'Content-Encoding' not in response.headers)
+
+
+def compress_response(response):
+    """
+    Compresses the response if the client accepts it and it's worth it
+    :param response: Response
+    :return: Response
+    """
+    if not is_compressible(response):
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    encoding = negotiate_encoding()
+
+    if encoding is None:
+        return response
+
+    # The compressed bytes differ from the identity ones, so a strong validator no longer holds.
+    # Weakened even when the body is too small to compress, so a 304 can send the same one
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    if response.is_streamed:
+        if not current_app.config.get('COMPRESS_STREAMS'):
+            return response
+
+        body = response.response
+        response.response = compress_chunks(response.iter_encoded(), encoding,
+                                            close=getattr(body, 'close', None))
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+
+        if len(data) < current_app.config.get('COMPRESS_MIN_SIZE'):
+            return response
+
+        response.set_data(compress_body(data, encoding))
+
+    response.headers['Content-Encoding'] = encoding
+
+    return response
+
+
+def send_static_file(filename):
+    """
+    Serves a static file, from its .gz sibling when there is one and the client accepts gzip
+    Replaces Flask's view of the static endpoint
+    :param filename: str
+    :return: Response
+    """
+    static_folder = current_app.static_folder
+    cache_timeout = current_app.get_send_file_max_age(filename)
+
+    compressed_path = safe_join(static_folder, filename + '.gz')
+
+    if request.accept_encodings['gzip'] and compressed_path and os.path.isfile(compressed_path):
+        response = send_from_directory(static_folder, filename + '.gz',
+                                       mimetype=mimetypes.guess_type(filename)[0],
+                                       cache_timeout=cache_timeout)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_from_directory(static_folder, filename, cache_timeout=cache_timeout)
+
+    response.vary.add('Accept-Encoding')
+
+    return response
+
+
+@click.command('compress-static')
+@click.option('--min-size', type=int, default=None, help='Skip files smaller than this')
+@with_appcontext
+def compress_static(min_size):
+    """
+    Writes a .gz sibling next to every compressible static file
+    """
+    min_size = current_app.config.get('COMPRESS_MIN_SIZE') if min_size is None else min_size
+    extensions = current_app.config.get('COMPRESS_STATIC_EXTENSIONS')
+    written = 0
+
+    for root, _, filenames in os.walk(current_app.static_folder):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+
+            if filename.endswith('.gz') or os.path.getsize(path) < min_size:
+                continue
+
+            if os.path.splitext(filename)[1] not in extensions:
+                continue
+
+            with open(path, 'rb') as source, open(path + '.gz', 'wb') as target:
+                target.write(gzip.compress(source.read(), compresslevel=9))
+
+            written += 1
+
+    click.echo('Compressed {} static files'.format(written))
+
+
+def init_app(app):
+    """
+    Compresses responses and replaces Flask's view of the static endpoint
+    :param app: Flask
+    :return:
+    """
+    app.after_request(compress_response)
+
+    app.view_functions['static'] = send_static_file
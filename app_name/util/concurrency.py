@@ -0,0 +1,97 @@
+"""
+Runs independent blocking calls (e.g. to OAuth providers) concurrently
+"""
+
+# pylint: disable=invalid-name,global-statement
+
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from flask import current_app
+
+from app_name.util.cooperative import is_cooperative
+from app_name.util.exceptions import ProviderTimeout
+from app_name.util.metrics import get_request_timer, use_request_timer
+
+# Per process state -- reset whenever the pid changes, i.e. after a fork
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns this process' shared executor, creating it on first use
+    :return: ThreadPoolExecutor
+    """
+    global _executor, _executor_pid
+
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=current_app.config.get(
+                        'CONCURRENT_CALLS_MAX_GREENLETS' if is_cooperative()
+                        else 'CONCURRENT_CALLS_MAX_WORKERS'),
+                    thread_name_prefix='concurrent-calls')
+                _executor_pid = os.getpid()
+
+    return _executor
+
+
+def shutdown_executor():
+    """
+    Stops this process' executor
+    :return:
+    """
+    global _executor, _executor_pid
+
+    with _executor_lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=False)
+
+        _executor, _executor_pid = None, None
+
+
+def run_in_app_context(app, call, timer=None):
+    """
+    Runs a call from the executor's thread in a context of the caller's app, so it can read
+    its config
+    :param app: Flask
+    :param call: zero-argument callable
+    :param timer: dict -- timings of the caller's request, its outbound time is added to them
+    :return: what call returns
+    """
+    with app.app_context(), use_request_timer(timer):
+        return call()
+
+
+def run_concurrently(*calls, **kwargs):
+    """
+    Runs zero-argument callables concurrently and returns their results in order
+    If calls raise, the exception of the first of them in the order given is re-raised, not
+    necessarily the one raised first
+    :param calls: callables
+    :param timeout: float -- overall deadline in seconds for all calls, defaults to
+                    CONCURRENT_CALLS_TIMEOUT
+    :return: list of results
+    :raises ProviderTimeout: if the calls didn't all finish before the deadline
+    """
+    timeout = kwargs.get('timeout') or current_app.config.get('CONCURRENT_CALLS_TIMEOUT')
+    deadline = time.monotonic() + timeout
+
+    app = current_app._get_current_object()         # pylint: disable=protected-access
+    timer = get_request_timer()
+    futures = [get_executor().submit(run_in_app_context, app, call, timer) for call in calls]
+
+    try:
+        return [future.result(timeout=max(deadline - time.monotonic(), 0))
+                for future in futures]
+    except FutureTimeoutError:
+        raise ProviderTimeout('Calls did not finish within {} seconds'.format(timeout))
+    finally:
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,31 @@
+"""
+Cooperative (gevent) workers
+gunicorn.conf.py patches the standard library with gevent when GUNICORN_WORKER_CLASS=gevent, so
+a request waiting on an OAuth provider, the database or the mail server lets the worker's other
+requests run instead of holding the whole process. What can't be patched, e.g. the Postgres
+driver, or is sized for a handful of threads, e.g. the connection pool, is adapted here
+"""
+
+import sys
+
+
+def is_cooperative():
+    """
+    Whether gevent patched this process' sockets, i.e. it runs in a gevent worker
+    gevent isn't imported unless it already was
+    :return: bool
+    """
+    monkey = sys.modules.get('gevent.monkey')
+
+    return monkey is not None and monkey.is_module_patched('socket')
+
+
+def patch_psycopg():
+    """
+    Has psycopg2 wait for the server through gevent's hub, so a query yields to the other
+    greenlets instead of blocking the worker. Must run before the first connection is opened
+    :return:
+    """
+    from psycogreen.gevent import patch_psycopg as patch
+
+    patch()
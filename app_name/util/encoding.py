@@ -0,0 +1,123 @@
+"""
+JSON encoding used by every API response
+orjson is used when it's installed and JSON_BACKEND allows it, otherwise the stdlib encoder.
+Both produce compact output and hand anything they can't encode natively (datetimes, UUIDs...)
+to Flask's JSONEncoder, so responses are encoded the same way jsonify encodes them
+"""
+
+# pylint: disable=invalid-name,global-statement
+
+import json
+import os
+
+from flask import current_app, has_app_context, json as flask_json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+JSON_MIMETYPE = 'application/json'
+
+_flask_encoder = flask_json.JSONEncoder()
+
+# Name of the backend in use, resolved from the config on first use
+_backend = None
+
+
+def _default(obj):
+    """
+    Encodes what the backends can't, the way jsonify would
+    :param obj:
+    :return: JSON serializable object
+    """
+    return _flask_encoder.default(obj)
+
+
+def _dumps_stdlib(obj, sort_keys):
+    """
+    :return: bytes
+    """
+    return json.dumps(obj, default=_default, separators=(',', ':'),
+                      sort_keys=sort_keys).encode('utf-8')
+
+
+def _dumps_orjson(obj, sort_keys):
+    """
+    :return: bytes
+    """
+    option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+
+    return orjson.dumps(obj, default=_default, option=option)
+
+
+BACKENDS = {
+    'json': _dumps_stdlib,
+    'orjson': _dumps_orjson,
+}
+
+
+def get_setting(name, default):
+    """
+    Reads a setting of the current app
+    Constant bodies, e.g. in responses, are encoded at import, before any app exists
+    :param name: str
+    :param default: value used outside of an app context
+    :return:
+    """
+    return current_app.config.get(name, default) if has_app_context() else default
+
+
+def get_backend():
+    """
+    Returns the name of the backend selected by JSON_BACKEND
+    'auto' picks orjson if it's installed
+    :return: str
+    """
+    global _backend
+
+    if _backend is not None:
+        return _backend
+
+    backend = get_setting('JSON_BACKEND', os.environ.get('JSON_BACKEND', 'auto'))
+
+    if backend == 'auto':
+        backend = 'orjson' if orjson is not None else 'json'
+    elif backend == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_BACKEND is orjson but orjson is not installed')
+
+    # Only an app's setting is kept, the environment's may be overridden by its config
+    if has_app_context():
+        _backend = backend
+
+    return backend
+
+
+def set_backend(backend):
+    """
+    Switches the backend, e.g. to compare them in benchmarks
+    :param backend: str -- a key of BACKENDS or None to resolve JSON_BACKEND again
+    :return:
+    """
+    global _backend
+
+    if backend is not None and backend not in BACKENDS:
+        raise ValueError('Unknown JSON backend: {}'.format(backend))
+
+    _backend = backend
+
+
+def dumps(obj, sort_keys=None):
+    """
+    Encodes obj as compact JSON
+    :param obj: JSON serializable object
+    :param sort_keys: bool -- defaults to JSON_SORT_KEYS
+    :return: bytes
+    """
+    if sort_keys is None:
+        sort_keys = get_setting('JSON_SORT_KEYS', True)
+
+    return BACKENDS[get_backend()](obj, sort_keys)
@@ -0,0 +1,114 @@
+"""
+Strong ETags for read endpoints, derived from the version column of the rows a response shows
+A conditional GET (If-None-Match) is answered from a query selecting only ids and versions, so
+a 304 never loads or serializes the rows themselves
+"""
+import hashlib
+
+from flask import request
+
+from app_name.database import db
+
+
+def make_etag(*parts):
+    """
+    Hashes the parts describing a response into an ETag value
+    :param parts: JSON-like values, e.g. names and (id, version) pairs
+    :return: str
+    """
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def is_conditional():
+    """
+    Whether the request carries If-None-Match, i.e. whether a 304 is possible at all
+    :return: bool
+    """
+    return bool(request.if_none_match)
+
+
+def is_not_modified(etag):
+    """
+    Whether the client already has the representation identified by etag
+    :param etag: str
+    :return: bool
+    """
+    return request.if_none_match.contains_weak(etag)
+
+
+def _related_class_and_key(model, name):
+    """
+    Returns the class of an expandable relationship and its column pointing back at model
+    :param model: db.Model with an EXPANDABLE dict
+    :param name: str
+    :return: db.Model, Column
+    """
+    relationship = getattr(model, model.EXPANDABLE[name]).property
+
+    return relationship.mapper.class_, next(iter(relationship.remote_side))
+
+
+def query_related_versions(model, expand, parent_ids):
+    """
+    Selects the (parent id, id, version) of every expanded related row
+    :param model: db.Model with an EXPANDABLE dict
+    :param expand: tuple of str returned by parse_expand
+    :param parent_ids: list of int
+    :return: list of (name, list of tuple)
+    """
+    related = []
+
+    for name in sorted(expand):
+        related_class, key = _related_class_and_key(model, name)
+
+        if parent_ids:
+            rows = db.session.query(key, related_class.id, related_class.version) \
+                .filter(key.in_(parent_ids)) \
+                .order_by(key, related_class.id) \
+                .all()
+        else:
+            rows = []
+
+        related.append((name, [tuple(row) for row in rows]))
+
+    return related
+
+
+def loaded_related_versions(model, expand, parents):
+    """
+    Same as query_related_versions, read from already loaded parents
+    :param model: db.Model with an EXPANDABLE dict
+    :param expand: tuple of str returned by parse_expand
+    :param parents: list of model instances with the expanded relationships loaded
+    :return: list of (name, list of tuple)
+    """
+    related = []
+
+    for name in sorted(expand):
+        related_class, key = _related_class_and_key(model, name)
+
+        rows = sorted((getattr(child, key.key), child.id, child.version)
+                      for parent in parents
+                      for child in getattr(parent, model.EXPANDABLE[name]))
+
+        related.append((name, rows))
+
+    return related
+
+
+def rows_etag(model, rows, expand=(), related=None, extra=()):
+    """
+    ETag of a response showing rows (and their expanded relationships)
+    :param model: db.Model with a version column
+    :param rows: model instances, or rows with id and version attributes
+    :param expand: tuple of str returned by parse_expand
+    :param related: result of loaded_related_versions, queried when None
+    :param extra: tuple of anything else the response depends on, e.g. the next page's cursor
+    :return: str
+    """
+    versions = [(row.id, row.version) for row in rows]
+
+    if related is None:
+        related = query_related_versions(model, expand, [row.id for row in rows])
+
+    return make_etag(model.__name__, versions, related, *extra)
@@ -12,6 +12,36 @@ class FBAuthException(Exception):
     """
     Exception to raise when Facebook auth fails
     """
+    def __init__(self, message, code=None):
+        super(FBAuthException, self).__init__(message)
+        self.code = code
+
+
+class InvalidPageParams(Exception):
+    """
+    Exception to raise when the limit or cursor of a page request can't be used
+    """
+    pass
+
+
+class InvalidExpandParams(Exception):
+    """
+    Exception to raise when ?expand= names a relationship that can't be embedded
+    """
+    pass
+
+
+class HashingPoolSaturated(Exception):
+    """
+    Exception to raise when the password hashing pool can't take more work
+    """
+    pass
+
+
+class ProviderTimeout(Exception):
+    """
+    Exception to raise when calls to an external provider miss their deadline
+    """
     pass
 
 
@@ -25,6 +55,10 @@ def protect_500(func):
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
+        except HashingPoolSaturated:
+            return responses.server_busy()
+        except ProviderTimeout:
+            return responses.provider_timeout()
         except Exception as e:
             print(traceback.format_exc())
             return responses.server_error(e)
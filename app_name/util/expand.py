@@ -0,0 +1,37 @@
+"""
+Helpers for embedding related resources via ?expand=
+"""
+from sqlalchemy.orm import selectinload
+
+from app_name.util.exceptions import InvalidExpandParams
+
+
+def parse_expand(model, expand):
+    """
+    Parses a comma separated ?expand= arg against the model's EXPANDABLE relationships
+    :param model: db.Model with an EXPANDABLE dict
+    :param expand: str or None
+    :return: tuple of str
+    """
+    if not expand:
+        return ()
+
+    names = tuple(name for name in expand.split(',') if name)
+    invalid_names = set(names) - set(model.EXPANDABLE)
+
+    if invalid_names:
+        raise InvalidExpandParams(invalid_names)
+
+    return names
+
+
+def expand_options(model, names):
+    """
+    Query options eager loading the expanded relationships
+    selectinload issues one extra `IN` query per relationship for the whole result, never one
+    query per parent row
+    :param model: db.Model with an EXPANDABLE dict
+    :param names: tuple of str returned by parse_expand
+    :return: list of loader options
+    """
+    return [selectinload(getattr(model, model.EXPANDABLE[name])) for name in names]
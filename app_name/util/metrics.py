@@ -0,0 +1,472 @@
+"""
+Request metrics in the Prometheus text format
+Every request records its latency, status and the time it spent in database queries and outbound
+HTTP calls, labelled with its endpoint. Each worker keeps its own samples and writes them to
+METRICS_DIR, so whichever worker is scraped can add up those of the whole server. Counters of
+workers that exited are folded into an archive file, so totals never go backwards
+"""
+
+# pylint: disable=invalid-name,global-statement,unused-argument
+
+import fcntl
+import hmac
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+from flask import _request_ctx_stack, current_app, request
+
+from app_name.util.queries import get_request_log
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# name -> (type, help, label names)
+METRICS = {
+    'http_requests_total': (
+        COUNTER, 'Requests answered', ('method', 'endpoint', 'status')),
+    'http_requests_in_progress': (
+        GAUGE, 'Requests being answered', ('method', 'endpoint')),
+    'http_request_duration_seconds': (
+        HISTOGRAM, 'Time to answer a request', ('method', 'endpoint')),
+    'http_request_db_seconds': (
+        HISTOGRAM, 'Time a request spent in database queries', ('method', 'endpoint')),
+    'http_request_outbound_seconds': (
+        HISTOGRAM, 'Time a request spent in outbound HTTP calls', ('method', 'endpoint')),
+}
+
+# Label of requests that didn't match any route
+UNMATCHED = 'unmatched'
+
+ARCHIVE_FILE = 'archived.json'
+LOCK_FILE = '.lock'
+
+# Per process state -- reset whenever the pid changes, i.e. after a fork
+_samples = {}
+_samples_pid = None
+_samples_lock = threading.Lock()
+
+# When this process last wrote its samples
+_written_at = 0
+
+# Timer of the request a thread outside of it works for, see use_request_timer
+_local = threading.local()
+_timer_lock = threading.Lock()
+
+
+def get_samples():
+    """
+    Returns this process' samples: name -> {label values (tuple): value}
+    Counters and gauges are floats, histograms a list of per bucket counts, then the +Inf
+    count and the sum of observations
+    :return: dict
+    """
+    global _samples, _samples_pid
+
+    if _samples_pid != os.getpid():
+        _samples, _samples_pid = {name: {} for name in METRICS}, os.getpid()
+
+    return _samples
+
+
+def inc(name, labels, amount=1):
+    """
+    Adds to a counter or gauge
+    :param name: str
+    :param labels: tuple of str, in the order of the metric's label names
+    :param amount: int or float
+    :return:
+    """
+    with _samples_lock:
+        values = get_samples()[name]
+        values[labels] = values.get(labels, 0) + amount
+
+
+def observe(name, labels, value):
+    """
+    Adds an observation to a histogram
+    :param name: str
+    :param labels: tuple of str
+    :param value: float
+    :return:
+    """
+    buckets = current_app.config.get('METRICS_BUCKETS')
+
+    with _samples_lock:
+        values = get_samples()[name]
+        counts = values.setdefault(labels, [0] * (len(buckets) + 2))
+
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[len(buckets)] += 1
+
+        counts[-1] += value
+
+
+def snapshot():
+    """
+    Copies this process' samples in a JSON serializable form
+    :return: dict of name -> list of [label values, value]
+    """
+    with _samples_lock:
+        return {name: [[list(labels), value if not isinstance(value, list) else list(value)]
+                       for labels, value in values.items()]
+                for name, values in get_samples().items()}
+
+
+def merge(snapshots, gauges=True):
+    """
+    Adds up snapshots of several processes
+    :param snapshots: list of dict returned by snapshot
+    :param gauges: bool -- False leaves out gauges, which only make sense for live processes
+    :return: dict of name -> {label values (tuple): value}
+    """
+    merged = {name: {} for name in METRICS}
+
+    for samples in snapshots:
+        for name, values in samples.items():
+            if name not in METRICS or (not gauges and METRICS[name][0] == GAUGE):
+                continue
+
+            for labels, value in values:
+                labels = tuple(labels)
+                current = merged[name].get(labels)
+
+                if current is None:
+                    merged[name][labels] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    # Bucket bounds changed in between, the old observations can't be added up
+                    if len(value) == len(current):
+                        merged[name][labels] = [a + b for a, b in zip(current, value)]
+                else:
+                    merged[name][labels] = current + value
+
+    return merged
+
+
+def to_snapshot(merged):
+    """
+    Inverse of merge, for writing merged samples back to a file
+    :param merged: dict returned by merge
+    :return: dict
+    """
+    return {name: [[list(labels), value] for labels, value in values.items()]
+            for name, values in merged.items()}
+
+
+def write_json(path, data):
+    """
+    Writes a file readers never see half written
+    :param path: str
+    :param data: JSON serializable object
+    :return:
+    """
+    tmp_path = path + '.tmp'
+
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    """
+    :param path: str
+    :return: the file's content, or None if it's missing or half written
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_samples(directory):
+    """
+    Saves this process' samples as <directory>/<pid>.json
+    :param directory: str
+    :return:
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    write_json(os.path.join(directory, '{}.json'.format(os.getpid())),
+               {'pid': os.getpid(), 'time': time.time(), 'samples': snapshot()})
+
+
+def collect(directory):
+    """
+    Adds up the samples of every worker, folding those of exited workers into the archive
+    :param directory: str
+    :return: dict returned by merge
+    """
+    from app_name.database.pool import is_running        # pylint: disable=cyclic-import
+
+    write_samples(directory)
+
+    live = []
+    dead = []
+
+    with open(os.path.join(directory, LOCK_FILE), 'w') as lock:
+        # Two scrapes at once would both fold the same exited worker into the archive
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        archive_path = os.path.join(directory, ARCHIVE_FILE)
+        archive = read_json(archive_path) or {}
+
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json') or filename == ARCHIVE_FILE:
+                continue
+
+            path = os.path.join(directory, filename)
+            data = read_json(path)
+
+            if data is None:
+                continue
+
+            if is_running(data['pid']):
+                live.append(data['samples'])
+                continue
+
+            dead.append(data['samples'])
+            os.remove(path)
+
+        if dead:
+            archive = to_snapshot(merge([archive] + dead, gauges=False))
+            write_json(archive_path, archive)
+
+    return merge(live + [archive])
+
+
+def format_labels(names, values, extra=()):
+    """
+    :param names: tuple of str
+    :param values: tuple of str
+    :param extra: tuple of (name, value) appended after the metric's own labels
+    :return: str, e.g. '{method="GET",endpoint="index"}'
+    """
+    pairs = list(zip(names, values)) + list(extra)
+
+    if not pairs:
+        return ''
+
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                                          .replace('"', '\\"').replace('\n', '\\n'))
+                          for name, value in pairs) + '}'
+
+
+def format_number(value):
+    """
+    :param value: int or float
+    :return: str
+    """
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(merged):
+    """
+    Formats samples in the Prometheus text exposition format
+    :param merged: dict returned by merge
+    :return: str
+    """
+    buckets = current_app.config.get('METRICS_BUCKETS')
+    lines = []
+
+    for name in sorted(METRICS):
+        metric_type, help_text, label_names = METRICS[name]
+
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} {}'.format(name, metric_type))
+
+        for labels, value in sorted(merged.get(name, {}).items()):
+            if metric_type != HISTOGRAM:
+                lines.append('{}{} {}'.format(name, format_labels(label_names, labels),
+                                              format_number(value)))
+                continue
+
+            if len(value) != len(buckets) + 2:
+                continue
+
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], value[:-1]):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    name, format_labels(label_names, labels, [('le', bound)]), cumulative))
+
+            lines.append('{}_sum{} {}'.format(name, format_labels(label_names, labels),
+                                              format_number(value[-1])))
+            lines.append('{}_count{} {}'.format(name, format_labels(label_names, labels),
+                                                cumulative))
+
+    return '\n'.join(lines) + '\n'
+
+
+def is_scrape_allowed():
+    """
+    Whether the current request may read the metrics: it must carry METRICS_TOKEN as a bearer
+    token. Without one they're only served under TESTING and LOCAL, whoever asks: behind a proxy
+    every request looks local
+    :return: bool
+    """
+    token = current_app.config.get('METRICS_TOKEN')
+
+    if not token:
+        return bool(current_app.config.get('TESTING') or current_app.config.get('LOCAL'))
+
+    return hmac.compare_digest(request.headers.get('Authorization', ''),
+                               'Bearer {}'.format(token))
+
+
+def get_request_timer():
+    """
+    Returns the timings of the current request, None outside of one or when metrics are off
+    Kept on the request context rather than g, which outlives the request when an app context
+    was already pushed. A thread working for a request, e.g. an executor thread of
+    run_concurrently, has no request context and gets the timer it was given instead
+    :return: dict or None
+    """
+    ctx = _request_ctx_stack.top
+
+    if ctx is None:
+        return getattr(_local, 'timer', None)
+
+    return getattr(ctx, 'metrics_timer', None)
+
+
+@contextmanager
+def use_request_timer(timer):
+    """
+    Adds the times of the block, run outside of the request, to the request's timings
+    :param timer: dict returned by get_request_timer in the request's thread, or None
+    :return:
+    """
+    previous = getattr(_local, 'timer', None)
+    _local.timer = timer
+
+    try:
+        yield
+    finally:
+        _local.timer = previous
+
+
+def add_request_time(kind, elapsed):
+    """
+    Adds time spent waiting on something to the current request's timings
+    :param kind: str -- 'outbound'
+    :param elapsed: float -- seconds
+    :return:
+    """
+    timer = get_request_timer()
+
+    if timer is not None:
+        # Concurrent calls of the same request add to it from their own threads
+        with _timer_lock:
+            timer[kind] += elapsed
+
+
+def request_labels():
+    """
+    :return: (method, endpoint) of the current request
+    """
+    return request.method, request.endpoint or UNMATCHED
+
+
+def start_request_timer():
+    """
+    Starts timing the request
+    Registered before every other hook, so the time they take is measured too
+    :return:
+    """
+    if not current_app.config.get('METRICS_ENABLED'):
+        return
+
+    _request_ctx_stack.top.metrics_timer = {'start': time.perf_counter(), 'outbound': 0.0,
+                                            'recorded': False}
+
+    inc('http_requests_in_progress', request_labels())
+
+
+def record_request(timer, status_code):
+    """
+    Records a finished request, once
+    :param timer: dict returned by get_request_timer
+    :param status_code: int
+    :return:
+    """
+    if timer['recorded']:
+        return
+
+    timer['recorded'] = True
+
+    method, endpoint = request_labels()
+    query_log = get_request_log()
+
+    inc('http_requests_total', (method, endpoint, str(status_code)))
+    observe('http_request_duration_seconds', (method, endpoint),
+            time.perf_counter() - timer['start'])
+    observe('http_request_db_seconds', (method, endpoint),
+            query_log.time if query_log is not None else 0.0)
+    observe('http_request_outbound_seconds', (method, endpoint), timer['outbound'])
+
+
+def stop_request_timer(response):
+    """
+    Records the request
+    Runs after every other after_request hook, since those run in reverse order of registration
+    :param response: Response
+    :return: Response
+    """
+    timer = get_request_timer()
+
+    if timer is not None:
+        record_request(timer, response.status_code)
+
+    return response
+
+
+def finish_request_timer(exc):
+    """
+    Takes the request off the in progress gauge, records it as a 500 if an exception kept
+    after_request hooks from running, and writes this worker's samples at most every
+    METRICS_WRITE_INTERVAL seconds. Written once the gauge is lowered, so the samples of an
+    idle worker show nothing in progress
+    :param exc: Exception or None
+    :return:
+    """
+    global _written_at
+
+    timer = get_request_timer()
+
+    if timer is None:
+        return
+
+    record_request(timer, 500)
+
+    inc('http_requests_in_progress', request_labels(), -1)
+
+    now = time.time()
+
+    if now - _written_at >= current_app.config.get('METRICS_WRITE_INTERVAL'):
+        _written_at = now
+
+        try:
+            write_samples(current_app.config.get('METRICS_DIR'))
+        except OSError:
+            current_app.logger.exception('Could not write the request metrics')
+
+
+def init_app(app):
+    """
+    Registers the request hooks, before any other so the time the others take is measured too
+    :param app: Flask
+    :return:
+    """
+    app.before_request(start_request_timer)
+    app.after_request(stop_request_timer)
+    app.teardown_request(finish_request_timer)
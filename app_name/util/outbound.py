@@ -0,0 +1,164 @@
+"""
+Shared HTTP client for every outbound call to OAuth providers
+One requests.Session per process keeps connections alive per host, every call gets the connect
+and read timeouts configured for its endpoint, idempotent calls are retried a bounded number
+of times and the latency of each call is recorded per endpoint
+"""
+
+# pylint: disable=invalid-name,global-statement
+
+import os
+import threading
+import time
+
+import requests
+
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app_name.util.cooperative import is_cooperative
+from app_name.util.metrics import add_request_time
+
+# Only these are retried -- e.g. an OAuth code exchange (POST) must never be sent twice
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+# Per process state -- reset whenever the pid changes, i.e. after a fork
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def create_session():
+    """
+    Creates a Session pooling connections per host with bounded retries of idempotent calls
+    :return: requests.Session
+    """
+    retries = Retry(
+        total=current_app.config.get('OUTBOUND_HTTP_RETRIES'),
+        backoff_factor=current_app.config.get('OUTBOUND_HTTP_RETRY_BACKOFF'),
+        status_forcelist=(502, 503, 504),
+        method_whitelist=IDEMPOTENT_METHODS,
+        raise_on_status=False
+    )
+
+    adapter = HTTPAdapter(pool_connections=current_app.config.get('OUTBOUND_HTTP_POOL_HOSTS'),
+                          pool_maxsize=current_app.config.get(
+                              'OUTBOUND_HTTP_GREENLET_POOL_SIZE' if is_cooperative()
+                              else 'OUTBOUND_HTTP_POOL_SIZE'),
+                          max_retries=retries)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+def get_session():
+    """
+    Returns this process' shared Session, creating it on first use
+    :return: requests.Session
+    """
+    global _session, _session_pid
+
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                _session = create_session()
+                _session_pid = os.getpid()
+
+    return _session
+
+
+def reset_session():
+    """
+    Drops this process' Session and its pooled connections
+    :return:
+    """
+    global _session, _session_pid
+
+    with _session_lock:
+        if _session is not None and _session_pid == os.getpid():
+            _session.close()
+
+        _session, _session_pid = None, None
+
+
+def get_timeout(endpoint):
+    """
+    Returns the (connect, read) timeout configured for an endpoint
+    :param endpoint: str
+    :return: tuple of float
+    """
+    return current_app.config.get('OUTBOUND_HTTP_TIMEOUTS', {}).get(
+        endpoint, current_app.config.get('OUTBOUND_HTTP_TIMEOUT'))
+
+
+def record_call(endpoint, elapsed, failed):
+    """
+    Adds one call to the endpoint's latency stats
+    :param endpoint: str
+    :param elapsed: float -- seconds
+    :param failed: bool
+    :return:
+    """
+    with _stats_lock:
+        stats = _stats.setdefault(endpoint, {'count': 0, 'errors': 0, 'total_time': 0.0,
+                                             'max_time': 0.0})
+        stats['count'] += 1
+        stats['errors'] += int(failed)
+        stats['total_time'] += elapsed
+        stats['max_time'] = max(stats['max_time'], elapsed)
+
+
+def get_stats():
+    """
+    Returns a copy of the per endpoint latency stats of this process
+    :return: dict of endpoint -> dict
+    """
+    with _stats_lock:
+        return {endpoint: dict(stats) for endpoint, stats in _stats.items()}
+
+
+def request(method, url, endpoint, **kwargs):
+    """
+    Sends a request through the shared Session
+    :param method: str
+    :param url: str
+    :param endpoint: str -- name used for timeouts and stats, e.g. 'google.token'
+    :param kwargs: passed to requests
+    :return: requests.Response
+    """
+    kwargs.setdefault('timeout', get_timeout(endpoint))
+
+    start = time.perf_counter()
+    failed = True
+    try:
+        response = get_session().request(method, url, **kwargs)
+        failed = response.status_code >= 500
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+
+        record_call(endpoint, elapsed, failed)
+        add_request_time('outbound', elapsed)
+
+
+def get(url, endpoint, **kwargs):
+    """
+    Sends a GET request through the shared Session
+    :return: requests.Response
+    """
+    return request('GET', url, endpoint, **kwargs)
+
+
+def post(url, endpoint, **kwargs):
+    """
+    Sends a POST request through the shared Session
+    :return: requests.Response
+    """
+    return request('POST', url, endpoint, **kwargs)
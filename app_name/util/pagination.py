@@ -0,0 +1,113 @@
+"""
+Keyset (cursor) pagination helpers for list endpoints
+"""
+import base64
+import binascii
+import json
+
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.sql.expression import and_, or_
+
+from app_name.util.exceptions import InvalidPageParams
+
+CURSOR_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def encode_cursor(created_at, row_id):
+    """
+    Encodes the sort key of the last row of a page into an opaque cursor
+    :param created_at: datetime
+    :param row_id: int
+    :return: str
+    """
+    key = [created_at.strftime(CURSOR_DATETIME_FORMAT), row_id]
+
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor created by encode_cursor back into its sort key
+    :param cursor: str
+    :return: created_at (datetime), row_id (int)
+    """
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+
+        return datetime.strptime(created_at, CURSOR_DATETIME_FORMAT), int(row_id)
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        raise InvalidPageParams('Invalid cursor')
+
+
+def get_page_size(limit):
+    """
+    Parses the requested page size, capped to API_MAX_PAGE_SIZE
+    :param limit: str or None
+    :return: int
+    """
+    if limit is None:
+        return current_app.config.get('API_DEFAULT_PAGE_SIZE')
+
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise InvalidPageParams('Invalid limit: {}'.format(limit))
+
+    if limit < 1:
+        raise InvalidPageParams('Invalid limit: {}'.format(limit))
+
+    return min(limit, current_app.config.get('API_MAX_PAGE_SIZE'))
+
+
+def keyset_filter(model, cursor):
+    """
+    Filter selecting the rows that come after the cursor in (created_at, id) order
+    :param model: db.Model with created_at and id columns
+    :param cursor: str
+    :return: SQL expression
+    """
+    created_at, row_id = decode_cursor(cursor)
+
+    return or_(
+        model.created_at > created_at,
+        and_(model.created_at == created_at, model.id > row_id)
+    )
+
+
+def keyset_query(query, model, after=None):
+    """
+    Orders a query by (created_at, id) and starts it after the given cursor
+    :param query: Query
+    :param model: db.Model with created_at and id columns
+    :param after: str or None
+    :return: Query
+    """
+    if after:
+        query = query.filter(keyset_filter(model, after))
+
+    return query.order_by(model.created_at, model.id)
+
+
+def get_page(query, model, limit=None, after=None):
+    """
+    Fetches one page of rows ordered by (created_at, id)
+    Only limit + 1 rows are ever loaded, whatever the size of the table
+    :param query: Query
+    :param model: db.Model with created_at and id columns
+    :param limit: str or None -- raw limit request arg
+    :param after: str or None -- cursor returned with the previous page
+    :return: rows (list), next_cursor (str or None)
+    """
+    page_size = get_page_size(limit)
+
+    rows = keyset_query(query, model, after).limit(page_size + 1).all()
+
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    last = rows[-1]
+
+    return rows, encode_cursor(last.created_at, last.id)
@@ -0,0 +1,187 @@
+"""
+Password hashing and verification off the request thread
+pbkdf2/bcrypt are CPU-bound, so they run in a bounded pool of worker processes. When the pool
+and its queue are full new work is rejected right away instead of stalling every worker, and so
+is work the pool doesn't finish in time. A pool whose process died is replaced
+"""
+
+# pylint: disable=invalid-name,global-statement
+
+import multiprocessing
+import os
+import threading
+
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+from flask_security.utils import config_value, get_hmac, use_double_hash
+from passlib.context import CryptContext
+
+from app_name.util.exceptions import HashingPoolSaturated
+
+# Per process state -- reset whenever the pid changes, i.e. after a fork
+_pool = None
+_pool_pid = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+# Passlib contexts rebuilt from their serialized config, cached in each pool process
+_contexts = {}
+
+
+def _get_context(context_config):
+    """
+    Returns the CryptContext described by context_config, building it once per process
+    :param context_config: str -- CryptContext.to_string()
+    :return: CryptContext
+    """
+    context = _contexts.get(context_config)
+
+    if context is None:
+        context = _contexts[context_config] = CryptContext.from_string(context_config)
+
+    return context
+
+
+def _hash(context_config, secret, options):
+    """
+    Runs in a pool process
+    :return: str
+    """
+    return _get_context(context_config).hash(secret, **options)
+
+
+def _verify(context_config, secret, password_hash):
+    """
+    Runs in a pool process
+    :return: bool
+    """
+    return _get_context(context_config).verify(secret, password_hash)
+
+
+def get_pool():
+    """
+    Returns this process' hashing pool and the semaphore bounding its queue, creating them on
+    first use. PASSWORD_HASH_POOL_SIZE = 0 disables the pool
+    :return: ProcessPoolExecutor or None, BoundedSemaphore or None
+    """
+    global _pool, _pool_pid, _pool_slots
+
+    pool_size = current_app.config.get('PASSWORD_HASH_POOL_SIZE')
+
+    if not pool_size:
+        return None, None
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=pool_size,
+                                        mp_context=multiprocessing.get_context('fork'))
+            _pool_pid = os.getpid()
+            _pool_slots = threading.BoundedSemaphore(
+                pool_size + current_app.config.get('PASSWORD_HASH_QUEUE_DEPTH'))
+
+    return _pool, _pool_slots
+
+
+def shutdown_pool():
+    """
+    Stops this process' hashing pool, e.g. before forking or in tests
+    :return:
+    """
+    global _pool, _pool_pid, _pool_slots
+
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown()
+
+        _pool, _pool_pid, _pool_slots = None, None, None
+
+
+def _discard_pool(pool):
+    """
+    Drops a broken pool, e.g. one of whose processes was killed, so the next call creates another
+    :param pool: ProcessPoolExecutor
+    :return:
+    """
+    global _pool, _pool_pid, _pool_slots
+
+    with _pool_lock:
+        if _pool is pool:
+            _pool, _pool_pid, _pool_slots = None, None, None
+
+    pool.shutdown(wait=False)
+
+
+def _run(func, *args, retry=True):
+    """
+    Runs func in the hashing pool, or inline if the pool is disabled
+    Work lost with a broken pool is run once more in a new one
+    :raises HashingPoolSaturated: when PASSWORD_HASH_QUEUE_DEPTH jobs are already waiting, the
+    work didn't finish within PASSWORD_HASH_TIMEOUT or the pool broke again
+    """
+    pool, slots = get_pool()
+
+    if pool is None:
+        return func(*args)
+
+    if not slots.acquire(blocking=False):
+        raise HashingPoolSaturated('Password hashing pool is saturated')
+
+    timeout = current_app.config.get('PASSWORD_HASH_TIMEOUT')
+
+    try:
+        try:
+            future = pool.submit(func, *args)
+        except Exception:
+            slots.release()
+            raise
+
+        # The slot is freed when the work is done, even if this request stopped waiting for it
+        future.add_done_callback(lambda _: slots.release())
+
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        raise HashingPoolSaturated('Password hashing took over {} seconds'.format(timeout))
+    except BrokenProcessPool:
+        _discard_pool(pool)
+
+        if not retry:
+            raise HashingPoolSaturated('Password hashing pool is broken')
+
+        return _run(func, *args, retry=False)
+
+
+def hash_password(password):
+    """
+    Hashes a password with Flask-Security's configured scheme and salt
+    :param password: str
+    :return: str
+    """
+    security = current_app.extensions['security']
+
+    if use_double_hash():
+        password = get_hmac(password).decode('ascii')
+
+    options = config_value('PASSWORD_HASH_OPTIONS', default={}).get(security.password_hash, {})
+
+    return _run(_hash, security.pwd_context.to_string(), password, options)
+
+
+def verify_password(password, password_hash):
+    """
+    Checks a password against a hash created by hash_password
+    Passwordless accounts (no hash) never verify
+    :param password: str
+    :param password_hash: str or None
+    :return: bool
+    """
+    if not password or not password_hash:
+        return False
+
+    security = current_app.extensions['security']
+
+    if use_double_hash(password_hash):
+        password = get_hmac(password)
+
+    return _run(_verify, security.pwd_context.to_string(), password, password_hash)
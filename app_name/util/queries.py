@@ -0,0 +1,168 @@
+"""
+Per-request SQL query counting and N+1 detection
+Every statement run on any engine is counted and timed in the log of the current request, and in
+those opened with record_queries. A statement run again and again with different parameters,
+e.g. a lazy load of resource_b_set for each resource A of a page, is what an N+1 looks like
+"""
+
+# pylint: disable=invalid-name,unused-argument
+
+import threading
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from flask import _request_ctx_stack, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Logs opened with record_queries, per thread
+_local = threading.local()
+
+
+class QueryLog(object):
+    """
+    Statements run during a request or a block of code
+    Only their count and time are kept unless keep_statements, which N+1 detection needs
+    """
+    def __init__(self, keep_statements=True):
+        self.count = 0
+        self.time = 0.0
+        self.keep_statements = keep_statements
+        # statement -> list of parameters it ran with, in order of first run
+        self.statements = OrderedDict()
+
+    def add(self, statement, parameters, elapsed):
+        """
+        :param statement: str
+        :param parameters: DBAPI parameters
+        :param elapsed: float -- seconds
+        :return:
+        """
+        self.count += 1
+        self.time += elapsed
+
+        if self.keep_statements:
+            self.statements.setdefault(statement, []).append(parameters)
+
+    def repeated(self, threshold):
+        """
+        Returns the statements run at least threshold times with different parameters
+        The same statement with the same parameters is a redundant query, not an N+1
+        :param threshold: int
+        :return: list of (statement, times run)
+        """
+        return [(statement, len(runs)) for statement, runs in self.statements.items()
+                if len(runs) >= threshold and len(set(repr(run) for run in runs)) > 1]
+
+    def describe(self):
+        """
+        :return: str -- every statement with the number of times it ran
+        """
+        return '\n'.join('{}x {}'.format(len(runs), ' '.join(statement.split()))
+                         for statement, runs in self.statements.items())
+
+
+def get_request_log(create=False):
+    """
+    Returns the query log of the current request
+    Kept on the request context rather than g, which outlives the request when an app context
+    was already pushed
+    :param create: bool -- create it if the request hasn't run any statement yet
+    :return: QueryLog or None, always None outside of a request
+    """
+    ctx = _request_ctx_stack.top
+
+    if ctx is None:
+        return None
+
+    if create and not hasattr(ctx, 'query_log'):
+        # Metrics only need the count and time, the debug headers look for N+1's too
+        ctx.query_log = QueryLog(keep_statements=current_app.config.get('QUERY_DEBUG_HEADERS'))
+
+    return getattr(ctx, 'query_log', None)
+
+
+def get_open_logs():
+    """
+    :return: list of QueryLog opened with record_queries in this thread
+    """
+    if not hasattr(_local, 'logs'):
+        _local.logs = []
+
+    return _local.logs
+
+
+@contextmanager
+def record_queries():
+    """
+    Logs the statements run by the block, including those of the requests it makes
+    :return: QueryLog
+    """
+    log = QueryLog()
+    logs = get_open_logs()
+
+    logs.append(log)
+    try:
+        yield log
+    finally:
+        logs.remove(log)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    """
+    Engine event: times every statement, whatever the engine or bind
+    :return:
+    """
+    conn.info['query_start'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def log_query(conn, cursor, statement, parameters, context, executemany):
+    """
+    Engine event: adds the statement to the current request's log and the open ones
+    :return:
+    """
+    start = conn.info.pop('query_start', None)
+    elapsed = time.perf_counter() - start if start is not None else 0.0
+
+    logs = list(get_open_logs())
+
+    request_log = get_request_log(create=True)
+    if request_log is not None:
+        logs.append(request_log)
+
+    for log in logs:
+        log.add(statement, parameters, elapsed)
+
+
+def add_query_headers(response):
+    """
+    Outside of production, tells how many queries the request ran and warns about N+1's
+    :param response: Response
+    :return: Response
+    """
+    if not current_app.config.get('QUERY_DEBUG_HEADERS'):
+        return response
+
+    log = get_request_log() or QueryLog()
+
+    response.headers['X-Query-Count'] = str(log.count)
+    response.headers['Server-Timing'] = 'db;dur={:.2f};desc="{} queries"'.format(
+        log.time * 1000, log.count)
+
+    for statement, times in log.repeated(current_app.config.get('QUERY_REPEAT_THRESHOLD')):
+        current_app.logger.warning('Possible N+1: statement ran %s times: %s', times,
+                                   ' '.join(statement.split()))
+
+    return response
+
+
+def init_app(app):
+    """
+    :param app: Flask
+    :return:
+    """
+    app.after_request(add_query_headers)
@@ -1,9 +1,78 @@
 """
 Commonly used responses
+Bodies that never change are encoded once at import time
 """
-from flask import jsonify
+from flask import Response
 
-from . import status
+from . import compression, encoding, status
+
+
+def json_response(data, status_code=status.OK, etag=None):
+    """
+    Encodes data with the configured JSON backend, used in place of jsonify
+    :param data: JSON serializable object
+    :param status_code: int
+    :param etag: str -- strong ETag of the representation, see util/etags.py
+    :return: Response, status_code (int)
+    """
+    response = Response(encoding.dumps(data), mimetype=encoding.JSON_MIMETYPE)
+
+    if etag is not None:
+        response.set_etag(etag)
+
+    return response, status_code
+
+
+def encoded_response(body, status_code):
+    """
+    Wraps an already encoded JSON body
+    :param body: bytes
+    :param status_code: int
+    :return: Response, status_code (int)
+    """
+    return Response(body, mimetype=encoding.JSON_MIMETYPE), status_code
+
+
+def metrics_response(body):
+    """
+    Wraps metrics in the Prometheus text format
+    :param body: str
+    :return: Response, status_code (int)
+    """
+    return Response(body, mimetype='text/plain; version=0.0.4'), status.OK
+
+
+def not_modified(etag):
+    """
+    Handles conditional GETs of a representation the client already has
+    The ETag is the one the 200 carried: weak when the request negotiated compression
+    :param etag: str
+    :return: an empty body with the ETag, and a Not modified (304) status
+    """
+    response = Response(status=status.NOT_MODIFIED)
+    response.set_etag(etag, weak=compression.weakens_etags())
+
+    return response, status.NOT_MODIFIED
+
+
+MISSING_PARAMS = encoding.dumps({'error': 'Missing required parameters'})
+ACTION_FORBIDDEN = encoding.dumps({'error': 'Action is forbidden'})
+UNAUTHORIZED = encoding.dumps({'error': 'Not authorized'})
+INVALID_FB_TOKEN = encoding.dumps({'error': 'Invalid Facebook user token'})
+INVALID_GOOGLE_TOKEN = encoding.dumps({'error': 'Invalid Google user token'})
+GOOGLE_AUTH_FAILED = encoding.dumps({'error': 'Google Auth failed...'})
+INVALID_PASSWORD = encoding.dumps({'error': 'Invalid password'})
+USER_UPDATED = encoding.dumps({'message': 'User updated successfully'})
+USER_UPDATED_PASSWORD_CHANGED = encoding.dumps(
+    {'message': 'User updated successfully and password changed'})
+USER_ALREADY_EXISTS = encoding.dumps({'error': 'A user with that email already exists!'})
+USER_NOT_FOUND = encoding.dumps({'error': 'User was not found'})
+SERVER_BUSY = encoding.dumps({'error': 'Server is busy, please retry shortly'})
+PROVIDER_TIMEOUT = encoding.dumps({'error': 'External provider timed out'})
+EMAIL_CONFIRMED = encoding.dumps({'message': 'Email confirmed'})
+INVALID_CONFIRMATION_LINK = encoding.dumps({'error': 'Invalid confirmation link'})
+CONFIRMATION_LINK_EXPIRED = encoding.dumps(
+    {'error': 'Confirmation link expired, a new one was sent'})
 
 
 def invalid_request_keys(invalid_keys):
@@ -12,9 +81,9 @@ def invalid_request_keys(invalid_keys):
     request json
     :return:
     """
-    return jsonify({
+    return json_response({
         'error': 'Invalid request keys: {}'.format(', '.join(invalid_keys))
-    }), status.BAD_REQUEST
+    }, status.BAD_REQUEST)
 
 
 def missing_params():
@@ -22,9 +91,40 @@ def missing_params():
     Handles missing parameters in requests
     :return:
     """
-    return jsonify({
-        'error': 'Missing required parameters'
-    }), status.BAD_REQUEST
+    return encoded_response(MISSING_PARAMS, status.BAD_REQUEST)
+
+
+def invalid_page_params(reason):
+    """
+    Handles invalid limit or cursor params on paginated endpoints
+    :param reason: str
+    :return:
+    """
+    return json_response({
+        'error': 'Invalid page params: {}'.format(reason)
+    }, status.BAD_REQUEST)
+
+
+def invalid_expand(invalid_names):
+    """
+    Handles unknown relationship names passed in ?expand=
+    :param invalid_names: iterable of str
+    :return:
+    """
+    return json_response({
+        'error': 'Invalid expand params: {}'.format(', '.join(sorted(invalid_names)))
+    }, status.BAD_REQUEST)
+
+
+def invalid_ids(reason):
+    """
+    Handles invalid id lists on batch lookup endpoints
+    :param reason: str
+    :return:
+    """
+    return json_response({
+        'error': 'Invalid ids: {}'.format(reason)
+    }, status.BAD_REQUEST)
 
 
 def action_forbidden():
@@ -32,9 +132,7 @@ def action_forbidden():
     Handles cases where the action is forbidden
     :return:
     """
-    return jsonify({
-        'error': 'Action is forbidden'
-    }), status.FORBIDDEN
+    return encoded_response(ACTION_FORBIDDEN, status.FORBIDDEN)
 
 
 def unauthorized():
@@ -42,9 +140,7 @@ def unauthorized():
     Handles case when user is unauthorized to complete action
     :return:
     """
-    return jsonify({
-        'error': 'Not authorized'
-    }), status.UNAUTHORIZED
+    return encoded_response(UNAUTHORIZED, status.UNAUTHORIZED)
 
 
 def invalid_user_type(user_type):
@@ -53,9 +149,9 @@ def invalid_user_type(user_type):
     :param user_type:
     :return:
     """
-    return jsonify({
+    return json_response({
         'error': 'Invalid user type: {}'.format(user_type)
-    }), status.BAD_REQUEST
+    }, status.BAD_REQUEST)
 
 
 def invalid_fb_token():
@@ -63,9 +159,7 @@ def invalid_fb_token():
     Handles case when user's FB token doesn't validate
     :return:
     """
-    return jsonify({
-        'error': 'Invalid Facebook user token'
-    }), status.BAD_REQUEST
+    return encoded_response(INVALID_FB_TOKEN, status.BAD_REQUEST)
 
 
 def invalid_google_token():
@@ -73,9 +167,7 @@ def invalid_google_token():
     Handles case when user's FB token doesn't validate
     :return:
     """
-    return jsonify({
-        'error': 'Invalid Google user token'
-    }), status.BAD_REQUEST
+    return encoded_response(INVALID_GOOGLE_TOKEN, status.BAD_REQUEST)
 
 
 def async_task_started(task_name):
@@ -83,9 +175,9 @@ def async_task_started(task_name):
     What to return when you've started an async task
     :return:
     """
-    return jsonify({
+    return json_response({
         'message': '{} task started'.format(task_name)
-    }), status.OK
+    }, status.OK)
 
 
 def invalid_password():
@@ -93,9 +185,7 @@ def invalid_password():
     Handles case when invalid password is used
     :return:
     """
-    return jsonify({
-        'error': 'Invalid password'
-    }), status.BAD_REQUEST
+    return encoded_response(INVALID_PASSWORD, status.BAD_REQUEST)
 
 
 def user_created(jwt_token, refresh_token):
@@ -103,11 +193,11 @@ def user_created(jwt_token, refresh_token):
     Handles case when user is created
     :return:
     """
-    return jsonify({
+    return json_response({
         'app_access_token': jwt_token,
         'app_refresh_token': refresh_token,
         'message': 'User created successfully!'
-    }), status.CREATED
+    }, status.CREATED)
 
 
 def user_updated(password_changed=False):
@@ -116,10 +206,8 @@ def user_updated(password_changed=False):
     :return: a json with one key value pair of message and success string message, and a
     created (201) status
     """
-    return jsonify({
-        'message': 'User updated successfully' +
-                   (' and password changed' if password_changed else '')
-    }), status.OK
+    return encoded_response(USER_UPDATED_PASSWORD_CHANGED if password_changed else USER_UPDATED,
+                            status.OK)
 
 
 def user_logged_in(jwt_token, refresh_token, user_id, user_info=None):
@@ -127,13 +215,13 @@ def user_logged_in(jwt_token, refresh_token, user_id, user_info=None):
     Handles case when user logs in
     :return:
     """
-    return jsonify({
+    return json_response({
         'app_access_token': jwt_token,
         'app_refresh_token': refresh_token,
         'user_id': user_id,
         'user_info': user_info,
         'message': 'User logged in successfully!'
-    }), status.OK
+    }, status.OK)
 
 
 def user_already_exists():
@@ -141,9 +229,7 @@ def user_already_exists():
     Handles case when user who already exists tries to sign up
     :return:
     """
-    return jsonify({
-        'error': 'A user with that email already exists!'
-    }), status.CONFLICT
+    return encoded_response(USER_ALREADY_EXISTS, status.CONFLICT)
 
 
 def user_not_found():
@@ -151,9 +237,31 @@ def user_not_found():
     Handles case when user is not found
     :return:
     """
-    return jsonify({
-        "error": "User was not found"
-    }), status.NOT_FOUND
+    return encoded_response(USER_NOT_FOUND, status.NOT_FOUND)
+
+
+def email_confirmed():
+    """
+    Handles case when user follows the link of the confirmation email
+    :return:
+    """
+    return encoded_response(EMAIL_CONFIRMED, status.OK)
+
+
+def invalid_confirmation_link():
+    """
+    Handles case when the confirmation link is not one that was sent
+    :return:
+    """
+    return encoded_response(INVALID_CONFIRMATION_LINK, status.NOT_FOUND)
+
+
+def confirmation_link_expired():
+    """
+    Handles case when an unconfirmed user follows an expired confirmation link
+    :return:
+    """
+    return encoded_response(CONFIRMATION_LINK_EXPIRED, status.GONE)
 
 
 def user_token_refreshed(jwt_token):
@@ -162,10 +270,10 @@ def user_token_refreshed(jwt_token):
     :param jwt_token:
     :return:
     """
-    return jsonify({
+    return json_response({
         'app_access_token': jwt_token,
         'message': 'Token refreshed!'
-    }), status.OK
+    }, status.OK)
 
 
 def resource_created(resource_name):
@@ -174,9 +282,9 @@ def resource_created(resource_name):
     :return: a json with one key value pair of message and success string message, and a
     created (201) status
     """
-    return jsonify({
+    return json_response({
         'message': '{} created successfully'.format(resource_name)
-    }), status.CREATED
+    }, status.CREATED)
 
 
 def resource_updated(resource_name):
@@ -185,9 +293,9 @@ def resource_updated(resource_name):
     :return: a json with one key value pair of message and success string message, and a
     created (201) status
     """
-    return jsonify({
+    return json_response({
         'message': '{} updated successfully'.format(resource_name)
-    }), status.OK
+    }, status.OK)
 
 
 def resource_deleted(resource_name):
@@ -196,9 +304,9 @@ def resource_deleted(resource_name):
     :return: a json with one key value pair of message and success message string, and a
     OK (200) status
     """
-    return jsonify({
+    return json_response({
         'message': '{} deleted successfully!'.format(resource_name)
-    }), status.OK
+    }, status.OK)
 
 
 def resource_not_found(resource_name):
@@ -207,9 +315,9 @@ def resource_not_found(resource_name):
     :return: a json with one key value pair of message and error message string, and a
     (404) status
     """
-    return jsonify({
+    return json_response({
         'message': '{} not found!'.format(resource_name)
-    }), status.NOT_FOUND
+    }, status.NOT_FOUND)
 
 
 def server_error(e):
@@ -218,6 +326,33 @@ def server_error(e):
     :return: a json with one key value pair of message and error message string, and a
     Internal server error (500) status
     """
-    return jsonify({
+    return json_response({
         'error': 'Internal server error: {}'.format(e)
-    }), status.INTERNAL_SERVER_ERROR
+    }, status.INTERNAL_SERVER_ERROR)
+
+
+def server_busy():
+    """
+    Handles case when the server is too busy to take the request, e.g. the password hashing
+    pool is saturated
+    :return: a json with one key value pair of message and error message string, and a
+    Service unavailable (503) status
+    """
+    return encoded_response(SERVER_BUSY, status.SERVICE_UNAVAILABLE)
+
+
+def google_auth_failed():
+    """
+    Handles case when the Google OAuth flow fails, e.g. the code exchange is rejected
+    :return:
+    """
+    return encoded_response(GOOGLE_AUTH_FAILED, status.UNPROCESSABLE_ENTITY)
+
+
+def provider_timeout():
+    """
+    Handles case when an external provider (e.g. Google or Facebook) doesn't answer in time
+    :return: a json with one key value pair of message and error message string, and a
+    Gateway timeout (504) status
+    """
+    return encoded_response(PROVIDER_TIMEOUT, status.GATEWAY_TIMEOUT)
@@ -5,12 +5,17 @@ HTTP status codes reused throughout the project
 OK = 200
 CREATED = 201
 
+NOT_MODIFIED = 304
+
 BAD_REQUEST = 400
 UNAUTHORIZED = 401
 FORBIDDEN = 403
 NOT_FOUND = 404
 CONFLICT = 409
+GONE = 410
 UNPROCESSABLE_ENTITY = 422
 EMPTY_RESPONSE = 204
 
 INTERNAL_SERVER_ERROR = 500
+SERVICE_UNAVAILABLE = 503
+GATEWAY_TIMEOUT = 504
@@ -0,0 +1,54 @@
+"""
+Streaming JSON responses for list endpoints
+"""
+from flask import Response, current_app, stream_with_context
+
+from . import encoding, status
+
+
+def iter_json_list(rows, serialize, key='items', chunk_size=None):
+    """
+    Encodes rows into a JSON object of the form {"<key>": [...]} one row at a time
+    Encoded rows are buffered into chunks of roughly chunk_size bytes so the server
+    isn't asked to write once per row
+    :param rows: iterable of rows
+    :param serialize: function turning a row into a JSON serializable object
+    :param key: str
+    :param chunk_size: int
+    :return: generator of bytes chunks
+    """
+    chunk_size = chunk_size or current_app.config.get('STREAM_CHUNK_SIZE')
+
+    buffer = [b'{' + encoding.dumps(key) + b':[']
+    buffered = 0
+
+    for i, row in enumerate(rows):
+        encoded = encoding.dumps(serialize(row))
+        buffer.append(b',' + encoded if i else encoded)
+        buffered += len(encoded)
+
+        if buffered >= chunk_size:
+            yield b''.join(buffer)
+            buffer, buffered = [], 0
+
+    buffer.append(b']}')
+
+    yield b''.join(buffer)
+
+
+def stream_query(query, serialize, key='items', batch_size=None):
+    """
+    Streams every row of a query as a chunked JSON response
+    Rows are pulled from the database in batches of STREAM_BATCH_SIZE via yield_per, so
+    neither the ORM nor the encoder ever holds more than one batch in memory
+    :param query: Query -- should be ordered
+    :param serialize: function turning a row into a JSON serializable object
+    :param key: str
+    :param batch_size: int
+    :return: Response, status_code (int)
+    """
+    rows = query.yield_per(batch_size or current_app.config.get('STREAM_BATCH_SIZE'))
+
+    chunks = stream_with_context(iter_json_list(rows, serialize, key=key))
+
+    return Response(chunks, mimetype=encoding.JSON_MIMETYPE), status.OK
@@ -0,0 +1,525 @@
+"""
+Tests for util helpers
+"""
+
+# pylint: disable=missing-docstring,invalid-name,no-member,attribute-defined-outside-init
+
+import gzip
+import importlib.util
+import json
+import mimetypes
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from datetime import datetime
+
+import mock
+import requests
+
+from flask import Response, jsonify
+from sqlalchemy.engine import Engine
+
+from app_name import after_fork, before_fork, create_app
+from app_name.database import db
+from app_name.resources.models import ResourceA, ResourceB
+from app_name.testing import AppTest
+from app_name.users.models import OAuthConnection, OAuthConnectionType, User
+from app_name.util import (compression, concurrency, cooperative, encoding, metrics, outbound,
+                           queries, responses)
+from app_name.util.cache import TTLCache
+
+
+class OutboundHTTPTest(AppTest):
+    def tearDown(self):
+        outbound.reset_session()
+
+        super().tearDown()
+
+    def test_session_is_shared(self):
+        self.assertIs(outbound.get_session(), outbound.get_session())
+
+    def test_session_recreated_after_fork(self):
+        session = outbound.get_session()
+
+        with mock.patch('os.getpid', return_value=-1):
+            self.assertIsNot(outbound.get_session(), session)
+
+    def test_only_idempotent_methods_are_retried(self):
+        retries = outbound.get_session().get_adapter('https://example.com').max_retries
+
+        self.assertTrue(retries.is_retry('GET', 503))
+        self.assertFalse(retries.is_retry('POST', 503))
+
+    def test_endpoint_timeout_and_stats(self):
+        self.app.config['OUTBOUND_HTTP_TIMEOUTS'] = {'test.endpoint': (1, 2)}
+
+        with mock.patch.object(requests.Session, 'request',
+                               return_value=mock.Mock(status_code=200)) as send:
+            outbound.get('https://example.com', 'test.endpoint')
+            outbound.get('https://example.com', 'test.other')
+
+        self.assertEqual(send.call_args_list[0][1]['timeout'], (1, 2))
+        self.assertEqual(send.call_args_list[1][1]['timeout'],
+                         self.app.config['OUTBOUND_HTTP_TIMEOUT'])
+
+        stats = outbound.get_stats()['test.endpoint']
+        self.assertGreaterEqual(stats['count'], 1)
+        self.assertEqual(stats['errors'], 0)
+
+    def test_failures_are_counted(self):
+        with mock.patch.object(requests.Session, 'request',
+                               side_effect=requests.ConnectionError()):
+            with self.assertRaises(requests.ConnectionError):
+                outbound.get('https://example.com', 'test.failing')
+
+        self.assertEqual(outbound.get_stats()['test.failing']['errors'], 1)
+
+
+class TTLCacheTest(unittest.TestCase):
+    def test_least_recently_used_is_evicted(self):
+        cache = TTLCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_entries_expire(self):
+        cache = TTLCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+
+        with mock.patch('app_name.util.cache.time.time', return_value=cache.entries['a'][1]):
+            self.assertIsNone(cache.get('a'))
+
+        self.assertNotIn('a', cache.entries)
+
+
+class EncodingTest(AppTest):
+    def tearDown(self):
+        encoding.set_backend(None)
+        super().tearDown()
+
+    def test_backends_match_jsonify(self):
+        data = {'b': [1, 2.5, None], 'a': 'caf\u00e9', 'at': datetime(2020, 1, 2, 3, 4, 5)}
+        expected = jsonify(data).json
+
+        for backend in encoding.BACKENDS:
+            encoding.set_backend(backend)
+            response, status_code = responses.json_response(data)
+
+            self.assertEqual(status_code, 200)
+            self.assertEqual(response.mimetype, 'application/json')
+            self.assertEqual(response.json, expected)
+
+    def test_sort_keys(self):
+        for backend in encoding.BACKENDS:
+            encoding.set_backend(backend)
+            self.assertEqual(encoding.dumps({'b': 1, 'a': 2}, sort_keys=True), b'{"a":2,"b":1}')
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            encoding.set_backend('simplejson')
+
+    def test_precomputed_responses(self):
+        first, status_code = responses.user_not_found()
+        second, _ = responses.user_not_found()
+
+        self.assertEqual(status_code, 404)
+        self.assertEqual(first.json, {'error': 'User was not found'})
+        self.assertIsNot(first, second)
+
+        first.headers['X-Test'] = '1'
+        self.assertNotIn('X-Test', second.headers)
+
+
+class CompressionTest(AppTest):
+    def compress(self, response, accept_encoding='gzip'):
+        with self.app.test_request_context(headers={'Accept-Encoding': accept_encoding}):
+            return compression.compress_response(response)
+
+    def test_large_json_is_gzipped(self):
+        data = {'items': [{'id': i, 'name': 'Resource {}'.format(i)} for i in range(100)]}
+        response, _ = responses.json_response(data, etag='abc')
+        identity = response.get_data()
+
+        response = self.compress(response)
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.vary)
+        self.assertEqual(gzip.decompress(response.get_data()), identity)
+        self.assertEqual(int(response.headers['Content-Length']), len(response.get_data()))
+        self.assertEqual(response.get_etag(), ('abc', True))
+
+    def test_skipped_responses(self):
+        small, _ = responses.json_response({'id': 1}, etag='abc')
+        self.assertNotIn('Content-Encoding', self.compress(small).headers)
+        self.assertIn('Accept-Encoding', small.vary)
+        self.assertEqual(small.get_etag(), ('abc', True))
+
+        refused, _ = responses.json_response({'items': list(range(1000))})
+        self.assertNotIn('Content-Encoding', self.compress(refused, 'gzip;q=0').headers)
+
+        image = Response(b'x' * 1000, mimetype='image/png')
+        self.assertNotIn('Content-Encoding', self.compress(image).headers)
+
+    def test_stream_is_compressed_per_chunk(self):
+        self.app.config['STREAM_CHUNK_SIZE'] = 1
+
+        response = self.client.get('/resource-a?stream=true', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.get_data()), b'{"items":[]}')
+
+    def test_precompressed_static_file(self):
+        static_folder = self.app.static_folder
+        self.app.static_folder = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(self.app.static_folder, 'app.js'), 'w') as f:
+                f.write('console.log(1);' * 100)
+
+            self.assertIn('1 static files', self.app.test_cli_runner().invoke(
+                args=['compress-static']).output)
+
+            response = self.client.get('/static/app.js', headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(response.mimetype, mimetypes.guess_type('app.js')[0])
+            self.assertEqual(gzip.decompress(response.get_data()), b'console.log(1);' * 100)
+            response.close()
+
+            response = self.client.get('/static/app.js')
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.assertEqual(response.get_data(), b'console.log(1);' * 100)
+            response.close()
+        finally:
+            shutil.rmtree(self.app.static_folder)
+            self.app.static_folder = static_folder
+
+
+class MetricsTest(AppTest):
+    def setUp(self):
+        super().setUp()
+
+        self.metrics_dir = tempfile.mkdtemp()
+        self.app.config['METRICS_DIR'] = self.metrics_dir
+
+        # Starts from empty samples, as a freshly forked worker would
+        metrics._samples_pid = None
+
+    def tearDown(self):
+        shutil.rmtree(self.metrics_dir)
+        self.app.config['METRICS_TOKEN'] = None
+
+        super().tearDown()
+
+    def scrape(self):
+        response = self.client.get('/internal/metrics')
+        self.assertEqual(response.status_code, 200)
+
+        return response.get_data(as_text=True)
+
+    def test_requests_are_recorded(self):
+        self.client.get('/resource-a')
+        self.client.get('/resource-a')
+        self.client.get('/not-a-route')
+
+        text = self.scrape()
+
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertIn('http_requests_total{method="GET",endpoint="resources.get_all_resource_a",'
+                      'status="200"} 2', text)
+        self.assertIn('http_requests_total{method="GET",endpoint="unmatched",status="404"} 1',
+                      text)
+        self.assertIn('http_request_duration_seconds_count{method="GET",'
+                      'endpoint="resources.get_all_resource_a"} 2', text)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",'
+                      'endpoint="resources.get_all_resource_a",le="+Inf"} 2', text)
+        self.assertIn('http_requests_in_progress{method="GET",'
+                      'endpoint="resources.get_all_resource_a"} 0', text)
+
+    def test_db_and_outbound_time(self):
+        def slow_call(*args, **kwargs):
+            time.sleep(0.01)
+            return mock.Mock(status_code=200)
+
+        with mock.patch.object(requests.Session, 'request', side_effect=slow_call), \
+                self.app.test_request_context('/resource-a'):
+            metrics.start_request_timer()
+
+            outbound.get('https://example.com', 'test.endpoint')
+            ResourceA.query.count()
+
+            metrics.stop_request_timer(Response())
+            metrics.finish_request_timer(None)
+
+        samples = metrics.get_samples()
+        labels = ('GET', 'resources.get_all_resource_a')
+
+        self.assertGreater(samples['http_request_db_seconds'][labels][-1], 0)
+        self.assertGreaterEqual(samples['http_request_outbound_seconds'][labels][-1], 0.01)
+        self.assertGreaterEqual(samples['http_request_duration_seconds'][labels][-1], 0.01)
+
+    def test_outbound_time_of_concurrent_calls(self):
+        def slow_call(*args, **kwargs):
+            time.sleep(0.01)
+            return mock.Mock(status_code=200)
+
+        with mock.patch.object(requests.Session, 'request', side_effect=slow_call), \
+                self.app.test_request_context('/resource-a'):
+            metrics.start_request_timer()
+
+            # Each call is made from an executor thread, outside of the request context
+            concurrency.run_concurrently(
+                lambda: outbound.get('https://example.com', 'test.endpoint'),
+                lambda: outbound.get('https://example.com', 'test.other'))
+
+            self.assertGreaterEqual(metrics.get_request_timer()['outbound'], 0.02)
+
+            metrics.finish_request_timer(None)
+
+    def test_samples_written_once_request_is_done(self):
+        metrics._written_at = 0
+
+        self.client.get('/resource-a')
+
+        with open(os.path.join(self.metrics_dir, '{}.json'.format(os.getpid()))) as f:
+            samples = json.load(f)['samples']
+
+        self.assertEqual(samples['http_requests_in_progress'],
+                         [[['GET', 'resources.get_all_resource_a'], 0]])
+
+    def test_workers_are_added_up(self):
+        self.client.get('/resource-a')
+
+        labels = ['GET', 'resources.get_all_resource_a']
+        other_worker = {
+            'http_requests_total': [[labels + ['200'], 3]],
+            'http_requests_in_progress': [[labels, 1]],
+        }
+
+        for pid in (101, 102):
+            with open(os.path.join(self.metrics_dir, '{}.json'.format(pid)), 'w') as f:
+                json.dump({'pid': pid, 'time': time.time(), 'samples': other_worker}, f)
+
+        # Worker 102 exited: its counters are kept, its in progress requests aren't
+        with mock.patch('app_name.database.pool.is_running', side_effect=lambda pid: pid != 102):
+            merged = metrics.collect(self.metrics_dir)
+
+        self.assertEqual(merged['http_requests_total'][tuple(labels + ['200'])], 7)
+        self.assertEqual(merged['http_requests_in_progress'][tuple(labels)], 1)
+        self.assertFalse(os.path.exists(os.path.join(self.metrics_dir, '102.json')))
+
+        # Later scrapes still count it, from the archive
+        with mock.patch('app_name.database.pool.is_running', side_effect=lambda pid: pid != 102):
+            merged = metrics.collect(self.metrics_dir)
+
+        self.assertEqual(merged['http_requests_total'][tuple(labels + ['200'])], 7)
+
+    def test_scrape_requires_token(self):
+        self.app.config['METRICS_TOKEN'] = 'secret'
+
+        self.assertEqual(self.client.get('/internal/metrics').status_code, 403)
+
+        response = self.client.get('/internal/metrics',
+                                   headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+
+        self.assertEqual(self.client.get('/internal/metrics', environ_base={
+            'REMOTE_ADDR': '10.0.0.1'}).status_code, 403)
+
+    def test_scrape_without_token_fails_closed(self):
+        # Served under TESTING, see scrape
+        with mock.patch.dict(self.app.config, {'TESTING': False}):
+            self.assertEqual(self.client.get('/internal/metrics').status_code, 403)
+
+
+class QueryCountTest(AppTest):
+    def setUp(self):
+        super().setUp()
+
+        for i in range(3):
+            user = User(email='{}@example.com'.format(i), phone_number=str(i))
+            user.oauth_connections = [OAuthConnection(type=OAuthConnectionType.GOOGLE,
+                                                      email_address=user.email)]
+            self.db.session.add(user)
+            self.db.session.commit()
+
+            resource_a = ResourceA(name='Resource {}'.format(i))
+            resource_a.owner_id = user.id
+            resource_a.resource_b_set = [ResourceB(name='Child {}'.format(j)) for j in range(2)]
+            self.db.session.add(resource_a)
+
+        self.db.session.commit()
+        self.db.session.remove()
+
+    def tearDown(self):
+        self.app.config['QUERY_DEBUG_HEADERS'] = True
+
+        super().tearDown()
+
+    def test_debug_headers(self):
+        response = self.client.get('/resource-a?expand=resource_b')
+
+        self.assertEqual(response.headers['X-Query-Count'], '2')
+        self.assertTrue(response.headers['Server-Timing'].startswith('db;dur='))
+
+        self.app.config['QUERY_DEBUG_HEADERS'] = False
+
+        self.assertNotIn('X-Query-Count', self.client.get('/resource-a').headers)
+
+    def test_request_log_keeps_statements_for_debug_headers_only(self):
+        with self.app.test_request_context('/resource-a'):
+            ResourceA.query.all()
+
+            log = queries.get_request_log()
+            self.assertEqual(log.count, 1)
+            self.assertEqual(len(log.statements), 1)
+
+        self.app.config['QUERY_DEBUG_HEADERS'] = False
+
+        with self.app.test_request_context('/resource-a'):
+            ResourceA.query.all()
+
+            log = queries.get_request_log()
+            self.assertEqual(log.count, 1)
+            self.assertGreater(log.time, 0)
+            self.assertEqual(log.statements, {})
+
+    def test_request_queries_are_counted(self):
+        with self.assertMaxQueries(2) as log:
+            self.client.get('/resource-a?expand=resource_b')
+
+        self.assertEqual(log.count, 2)
+
+        with self.assertRaises(AssertionError):
+            with self.assertMaxQueries(1):
+                self.client.get('/resource-a?expand=resource_b')
+
+    def test_lazy_loads_are_flagged(self):
+        with self.assertRaisesRegex(AssertionError, 'N\\+1 queries:\n3x SELECT'):
+            with self.assertMaxQueries(10):
+                for resource_a in ResourceA.query.all():
+                    list(resource_a.resource_b_set)
+
+        self.db.session.remove()
+
+        with self.assertRaisesRegex(AssertionError, 'N\\+1 queries:\n3x SELECT oauth_connection'):
+            with self.assertMaxQueries(10):
+                for user in User.query.all():
+                    list(user.oauth_connections)
+
+    def test_same_parameters_are_not_an_n_plus_one(self):
+        log = queries.QueryLog()
+
+        for _ in range(5):
+            log.add('SELECT * FROM user WHERE id = ?', (1,), 0.001)
+        for i in range(2):
+            log.add('SELECT * FROM role WHERE id = ?', (i,), 0.001)
+
+        self.assertEqual(log.repeated(3), [])
+        self.assertEqual(log.repeated(2), [('SELECT * FROM role WHERE id = ?', 2)])
+
+
+class AppFactoryTest(unittest.TestCase):
+    def rules(self, app):
+        return {rule.rule for rule in app.url_map.iter_rules()}
+
+    def test_only_enabled_blueprints_are_served(self):
+        app = create_app('TESTING', blueprints=['users'])
+        rules = self.rules(app)
+
+        self.assertIn('/users/me', rules)
+        self.assertIn('/internal/metrics', rules)
+        self.assertNotIn('/resource-a', rules)
+        self.assertNotIn('/auth/login/email', rules)
+        self.assertNotIn('/admin/', rules)
+
+    def test_unknown_blueprint(self):
+        with self.assertRaises(ValueError):
+            create_app('TESTING', blueprints=['users', 'billing'])
+
+    def test_api_only_app_does_not_serve_admin_login_pages(self):
+        client = create_app('TESTING', blueprints=['auth', 'users', 'resources']).test_client()
+
+        for path in ('/admin/login/', '/admin/register', '/admin/confirm'):
+            self.assertEqual(client.get(path).status_code, 404, path)
+
+    def test_api_only_app_does_not_load_admin(self):
+        # This process already imported everything, only a fresh one can tell
+        output = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys; from app_name import create_app; '
+            'create_app("TESTING", blueprints=["auth", "users", "resources"]); '
+            'print("flask_admin" in sys.modules)'
+        ], universal_newlines=True)
+
+        self.assertEqual(output.strip(), 'False')
+
+    def test_before_fork_closes_what_the_master_opened(self):
+        app = create_app('TESTING')
+        app.config['SQLALCHEMY_BINDS'] = {'replica': 'sqlite://'}
+
+        with app.app_context():
+            outbound.get_session()
+
+            with mock.patch.object(Engine, 'dispose', autospec=True) as dispose:
+                before_fork(app)
+
+            self.assertEqual({call[0][0] for call in dispose.call_args_list},
+                             {db.get_engine(app), db.get_engine(app, bind='replica')})
+            self.assertIsNone(outbound._session)
+
+    def test_forked_worker_gets_its_own_clients(self):
+        app = create_app('TESTING')
+
+        with app.app_context():
+            pool = db.engine.pool
+            session = outbound.get_session()
+
+            pid = os.fork()
+
+            if pid == 0:
+                after_fork(app)
+                os._exit(0 if db.engine.pool is not pool and
+                         outbound.get_session() is not session else 1)
+
+            _, status = os.waitpid(pid, 0)
+
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+
+
+@unittest.skipUnless(importlib.util.find_spec('gevent'), 'gevent is not installed')
+class CooperativeTest(unittest.TestCase):
+    def test_concurrent_greenlets(self):
+        from app_name.testing import greenlets
+
+        # gevent has to patch a fresh interpreter, before the app is imported
+        output = subprocess.check_output([sys.executable, '-c', greenlets.RUN],
+                                         universal_newlines=True, timeout=120)
+        results = {result['scenario']: result for result in
+                   (json.loads(line) for line in output.splitlines() if line.startswith('{'))}
+
+        self.assertEqual(set(results), {'google', 'facebook', 'email', 'sessions', 'mail'})
+
+        for name, result in results.items():
+            self.assertTrue(result['correct'], name)
+
+        # One after the other, they'd wait on the provider for GREENLETS * LATENCY at least
+        for name in ('google', 'facebook', 'sessions'):
+            self.assertLess(results[name]['seconds'], greenlets.GREENLETS * greenlets.LATENCY / 2,
+                            name)
+
+    def test_not_cooperative_unless_patched(self):
+        self.assertFalse(cooperative.is_cooperative())
+
+
+if __name__ == '__main__':
+    unittest.main()
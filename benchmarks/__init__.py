@@ -0,0 +1,4 @@
+"""
+Benchmarks for the app_name API
+Run each module with `python -m benchmarks.<module>`
+"""
@@ -0,0 +1,89 @@
+"""
+Benchmarks CPU cost against bytes saved when compressing typical JSON payloads
+Payloads are GET /resource-a pages of growing size, with and without ?expand=resource_b
+
+Usage: ENVIRONMENT=TESTING python -m benchmarks.compression
+"""
+
+# pylint: disable=invalid-name
+
+import time
+
+from datetime import datetime
+
+from app_name import create_app
+from app_name.util import compression, encoding
+
+app = create_app()
+
+PAGE_SIZES = (1, 10, 50, 200)
+GZIP_LEVELS = (1, 6, 9)
+BR_LEVELS = (1, 4, 11)
+REPEATS = 200
+
+
+def page(size, expand):
+    """
+    Builds an encoded page of size resource A's
+    :param size: int
+    :param expand: bool -- embed 5 resource B's per row
+    :return: bytes
+    """
+    items = []
+    for i in range(size):
+        item = {'id': i, 'name': 'Resource {}'.format(i), 'owner_id': 1 + i % 7,
+                'created_at': datetime(2020, 1, 1, 0, 0, i % 60)}
+
+        if expand:
+            item['resource_b_set'] = [{'id': i * 5 + j, 'name': 'Child {} of {}'.format(j, i)}
+                                      for j in range(5)]
+
+        items.append(item)
+
+    return encoding.dumps({'items': items, 'next_cursor': 'WyIyMDIwLTAxLTAxIiwgNTBd'})
+
+
+def measure(data, encoding_name, level):
+    """
+    Compresses data REPEATS times at the given level
+    :return: compressed size (int), mean CPU time in ms (float)
+    """
+    config_key = 'COMPRESS_BR_LEVEL' if encoding_name == 'br' else 'COMPRESS_LEVEL'
+    app.config[config_key] = level
+
+    start = time.process_time()
+    for _ in range(REPEATS):
+        compressed = compression.compress_body(data, encoding_name)
+    elapsed = time.process_time() - start
+
+    return len(compressed), elapsed / REPEATS * 1000
+
+
+def main():
+    """
+    Prints compressed size, ratio and CPU time per payload and level
+    :return:
+    """
+    settings = [('gzip', level) for level in GZIP_LEVELS]
+    if compression.brotli is not None:
+        settings += [('br', level) for level in BR_LEVELS]
+
+    with app.app_context():
+        print('{:>18} | {:>8} | {:>7} | {:>10} | {:>7} | {:>8}'.format(
+            'payload', 'bytes', 'codec', 'compressed', 'saved', 'cpu ms'))
+
+        for expand in (False, True):
+            for size in PAGE_SIZES:
+                data = page(size, expand)
+                name = '{} rows{}'.format(size, ' +expand' if expand else '')
+
+                for encoding_name, level in settings:
+                    compressed, cpu_ms = measure(data, encoding_name, level)
+
+                    print('{:>18} | {:>8} | {:>4}-{:<2} | {:>10} | {:>6.1f}% | {:>8.3f}'.format(
+                        name, len(data), encoding_name, level, compressed,
+                        100 - compressed * 100 / len(data), cpu_ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Benchmarks concurrent Google and Facebook logins on sync and gevent gunicorn workers
+The providers are answered by a local fake server after LATENCY seconds, as Google and Facebook
+would be over the internet. CONCURRENCY clients log in LOGINS times in total against
+gunicorn.conf.py with WORKERS workers of each class, and logins/s, p50/p99 latency and the
+failed logins are reported. A sync worker waits on the provider with nothing else to do, a
+gevent worker serves its other logins meanwhile
+
+Logins only read the database, which is the SQLite file of the config unless DATABASE_URL says
+otherwise
+
+Usage: ENVIRONMENT=TESTING python -m benchmarks.concurrent_logins [--latency 0.2]
+           [--concurrency 50] [--logins 500] [--workers 3]
+"""
+
+# pylint: disable=no-member,invalid-name
+
+import argparse
+import os
+import signal
+import subprocess
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from app_name import create_app
+from app_name.database import clean_db, db
+from app_name.testing.providers import FakeProviders, facebook_email, patch_endpoints
+from app_name.users.models import OAuthConnection, OAuthConnectionType, User
+from benchmarks.preload_memory import GUNICORN, ROOT, free_port, wait_until_up
+
+app = create_app()
+
+WORKER_CLASSES = ('sync', 'gevent')
+
+LATENCY = 0.2
+CONCURRENCY = 50
+LOGINS = 500
+WORKERS = 3
+
+# Users of each provider, logged in in turn
+USERS = 100
+
+GOOGLE_CLIENT_ID = 'bench.apps.googleusercontent.com'
+
+
+def served_app():
+    """
+    The app gunicorn serves, calling the fake providers at PROVIDERS_URL
+    :return: Flask
+    """
+    patch_endpoints(os.environ['PROVIDERS_URL'])
+
+    return app
+
+
+def google_email(i):
+    return 'google-{}@example.com'.format(i)
+
+
+def facebook_id(i):
+    return 'fb-{}'.format(i)
+
+
+def seed():
+    """
+    Recreates the tables with USERS users connected to each provider
+    :return:
+    """
+    with app.app_context():
+        clean_db(app)
+
+        for i in range(USERS):
+            user = User(email=google_email(i))
+            user.oauth_connections.append(OAuthConnection(
+                type=OAuthConnectionType.GOOGLE, email_address=user.email,
+                ext_user_id=user.email, ext_access_token='access', ext_refresh_token='refresh'))
+            db.session.add(user)
+
+            user = User(email=facebook_email(facebook_id(i)))
+            user.oauth_connections.append(OAuthConnection(
+                type=OAuthConnectionType.FACEBOOK, email_address=user.email,
+                ext_user_id=facebook_id(i), ext_access_token=facebook_id(i)))
+            db.session.add(user)
+
+        db.session.commit()
+
+
+def login(url, i):
+    """
+    Logs the i'th user in, with Google or Facebook in turn
+    :return: seconds it took, or None if it failed
+    """
+    if i % 2:
+        path, data = '/auth/login/facebook', {'user_token': facebook_id(i // 2 % USERS)}
+    else:
+        path, data = '/auth/google/login', {'code': google_email(i // 2 % USERS)}
+
+    start = time.perf_counter()
+
+    try:
+        response = requests.post(url + path, json=data, timeout=60)
+    except requests.RequestException:
+        return None
+
+    return time.perf_counter() - start if response.status_code == 200 else None
+
+
+def measure(worker_class, providers_url, args):
+    """
+    Starts gunicorn with worker_class workers and logs in args.logins times
+    :return: logins/s, latencies of the successful logins (sorted list of float), failed logins
+    """
+    port = free_port()
+    url = 'http://127.0.0.1:{}'.format(port)
+
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=worker_class, WEB_CONCURRENCY=str(args.workers),
+               PROVIDERS_URL=providers_url, GOOGLE_CLIENT_ID=GOOGLE_CLIENT_ID)
+
+    process = subprocess.Popen(
+        [GUNICORN, '-c', 'gunicorn.conf.py', '--bind', '127.0.0.1:{}'.format(port),
+         '--log-level', 'warning', 'benchmarks.concurrent_logins:served_app()'],
+        cwd=ROOT, env=env)
+
+    try:
+        wait_until_up(url, process)
+
+        # Each worker fetches Google's keys and Facebook's app token once, outside of the timing
+        with ThreadPoolExecutor(args.workers * 4) as executor:
+            list(executor.map(lambda i: login(url, i), range(args.workers * 4)))
+
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(args.concurrency) as executor:
+            results = list(executor.map(lambda i: login(url, i), range(args.logins)))
+
+        elapsed = time.perf_counter() - start
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait()
+
+    latencies = sorted(result for result in results if result is not None)
+
+    return len(latencies) / elapsed, latencies, len(results) - len(latencies)
+
+
+def percentile(values, p):
+    """
+    :param values: sorted list of float
+    :param p: float -- between 0 and 1
+    :return: float
+    """
+    return values[min(int(len(values) * p), len(values) - 1)] if values else float('nan')
+
+
+def main():
+    """
+    Prints the results of each worker class
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks concurrent logins')
+    parser.add_argument('--latency', type=float, default=LATENCY,
+                        help='Seconds each provider call takes')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY,
+                        help='Clients logging in at once')
+    parser.add_argument('--logins', type=int, default=LOGINS, help='Logins per worker class')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Gunicorn workers')
+    args = parser.parse_args()
+
+    seed()
+
+    print('{:>7} | {:>8} | {:>9} | {:>9} | {:>6}'.format(
+        'workers', 'logins/s', 'p50', 'p99', 'failed'))
+
+    with FakeProviders(latency=args.latency, google_client_id=GOOGLE_CLIENT_ID) as providers:
+        for worker_class in WORKER_CLASSES:
+            throughput, latencies, failed = measure(worker_class, providers.url, args)
+
+            print('{:>7} | {:>8.1f} | {:>6.0f} ms | {:>6.0f} ms | {:>6}'.format(
+                worker_class, throughput, percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.99) * 1000, failed))
+
+
+if __name__ == '__main__':
+    main()
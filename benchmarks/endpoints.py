@@ -0,0 +1,573 @@
+"""
+Benchmarks every route of auth, users and resources against a seeded dataset
+Each endpoint is called REQUESTS times through app.test_client, after a warm up pass whose
+allocations are traced. Reports throughput, p50/p99 latency, queries per request and peak
+memory, and saves them as JSON so the results of two commits can be compared
+
+The dataset is generated by flask seed: SIZE users and SIZE resource A's with
+CHILDREN_PER_RESOURCE resource B's each on average, kept in its own SQLite file between runs.
+Seeding drops every table first, so a database given with --database-url is only seeded with
+--reset. Whatever the benchmark creates belongs to bench+ users and is deleted afterwards. OAuth
+providers are answered locally, without latency
+
+Usage: ENVIRONMENT=TESTING python -m benchmarks.endpoints --size 1k [--requests 200]
+           [--database-url URL [--reset]] [--output PATH] [--compare PATH]
+"""
+
+# pylint: disable=no-member,invalid-name
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+from datetime import datetime
+
+import mock
+
+from flask_jwt_extended import create_access_token, create_refresh_token
+from sqlalchemy import func
+
+from app_name import create_app
+from app_name.auth.google import keys
+from app_name.database import db
+from app_name.database.seed import seed as generate
+from app_name.outbox.models import OutboxEmail
+from app_name.resources.models import ResourceA, ResourceB
+from app_name.testing.google import GoogleKeySet
+from app_name.users.models import OAuthConnection, OAuthConnectionType, User, roles_users
+from app_name.util import outbound
+from app_name.util.queries import record_queries
+
+app = create_app()
+
+SIZES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+CHILDREN_PER_RESOURCE = 2
+
+REQUESTS = 200
+# Warm up requests, run with tracemalloc to measure peak memory
+MEMORY_REQUESTS = 20
+
+PASSWORD = 'pass12345'
+GOOGLE_CLIENT_ID = 'bench.apps.googleusercontent.com'
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def parse_size(value):
+    """
+    :param value: str -- '1k', '100k', '1m' or a number of rows
+    :return: int
+    """
+    return SIZES[value.lower()] if value.lower() in SIZES else int(value)
+
+
+def bench_email(name):
+    """
+    :param name: str
+    :return: str -- address of a user the benchmark creates, deleted by cleanup
+    """
+    return 'bench+{}@example.com'.format(name)
+
+
+def is_seeded(size):
+    """
+    :param size: int
+    :return: bool -- whether the database holds the dataset of that size
+    """
+    # Nothing is created in a database that isn't the benchmark's yet
+    if not all(db.engine.has_table(model.__table__.name) for model in (User, ResourceA)):
+        return False
+
+    users = db.session.query(func.count(User.id)).filter(~User.email.like('bench+%')).scalar()
+
+    return users == size and db.session.query(func.count(ResourceA.id)).scalar() == size
+
+
+def seed(size):
+    """
+    Recreates the tables with size users and size resource A's, ids starting at 1
+    :param size: int
+    :return:
+    """
+    generate(size, resources=size, children=CHILDREN_PER_RESOURCE, reset=True)
+
+
+def cleanup():
+    """
+    Deletes every row created by the benchmark
+    :return:
+    """
+    bench_user_ids = db.session.query(User.id).filter(User.email.like('bench+%')).subquery()
+    bench_resource_ids = db.session.query(ResourceA.id) \
+        .filter(ResourceA.owner_id.in_(bench_user_ids)).subquery()
+
+    ResourceB.query.filter(ResourceB.resource_a_id.in_(bench_resource_ids)) \
+        .delete(synchronize_session=False)
+    ResourceA.query.filter(ResourceA.owner_id.in_(bench_user_ids)) \
+        .delete(synchronize_session=False)
+    OAuthConnection.query.filter(OAuthConnection.owner_id.in_(bench_user_ids)) \
+        .delete(synchronize_session=False)
+    db.session.execute(roles_users.delete().where(roles_users.c.user_id.in_(bench_user_ids)))
+    OutboxEmail.query.filter(OutboxEmail.recipients.like('%bench+%')) \
+        .delete(synchronize_session=False)
+    User.query.filter(User.email.like('bench+%')).delete(synchronize_session=False)
+
+    db.session.commit()
+
+
+class FakeResponse(object):
+    """
+    Provider response answered locally
+    """
+    def __init__(self, data):
+        self.data = data
+        self.ok = True
+        self.status_code = 200
+        self.headers = {}
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        pass
+
+
+class Fixtures(object):
+    """
+    Users, tokens and ids the requests are built from
+    """
+    def __init__(self, size, count):
+        """
+        :param size: int -- rows in the dataset
+        :param count: int -- requests made per endpoint
+        """
+        self.size = size
+        self.count = count
+        self.run = int(time.time())
+        self.random = random.Random(size)
+
+        self.key_set = GoogleKeySet()
+        self.google_tokens = {}
+
+    def create_user(self, name, password=None):
+        """
+        :param name: str
+        :param password: str -- passwordless users are quicker to create
+        :return: User, access token (str)
+        """
+        user = User(email=bench_email(name), password=password, first_name='Bench',
+                    last_name=name)
+        db.session.add(user)
+        db.session.commit()
+
+        return user, create_access_token(identity=user.id)
+
+    def create(self):
+        """
+        Creates what the requests need, except the per request fixtures of ENDPOINTS
+        :return:
+        """
+        owner, self.token = self.create_user('owner', PASSWORD)
+        self.owner_id = owner.id
+        self.refresh_token = create_refresh_token(identity=owner.id)
+
+        owner.oauth_connections.append(OAuthConnection(
+            type=OAuthConnectionType.FACEBOOK, email_address=owner.email,
+            ext_user_id='fb-owner', ext_access_token='long-lived-token'))
+
+        resource_a = ResourceA(name='Bench resource')
+        resource_a.owner_id = owner.id
+        db.session.add(resource_a)
+        db.session.commit()
+
+        self.owned_resource_id = resource_a.id
+        self.google_tokens['owner'] = self.key_set.sign(GOOGLE_CLIENT_ID, email=owner.email)
+
+    def random_id(self):
+        """
+        :return: int -- id of a seeded user or resource A
+        """
+        return self.random.randint(1, self.size)
+
+    def auth(self, token=None):
+        """
+        :return: dict -- headers authenticating as the owner, or as the token's user
+        """
+        return {'Authorization': 'Bearer {}'.format(token or self.token)}
+
+    def fake_post(self, url, endpoint, data=None, **kwargs):
+        """
+        Answers Google's token endpoint with the ID token signed for the code
+        """
+        return FakeResponse({'access_token': 'access', 'refresh_token': 'refresh',
+                             'id_token': self.google_tokens[data['code']]})
+
+    def fake_get(self, url, endpoint, params=None, headers=None, **kwargs):
+        """
+        Answers the Graph API, user tokens being 'fb-<name>'
+        """
+        if endpoint == 'facebook.debug_token':
+            return FakeResponse({'data': {'is_valid': True, 'user_id': params['input_token']}})
+
+        if endpoint == 'facebook.user_info':
+            user_token = headers['Authorization'].split()[-1]
+            return FakeResponse({'id': user_token, 'first_name': 'Bench', 'last_name': 'Facebook',
+                                 'email': bench_email(user_token)})
+
+        return FakeResponse({'access_token': 'long-lived-token'})
+
+
+def post_json(url, data, headers=None):
+    """
+    :return: (method, url, test client kwargs)
+    """
+    return 'POST', url, {'data': json.dumps(data), 'content_type': 'application/json',
+                         'headers': headers or {}}
+
+
+def signup_email(fx, i):
+    return post_json('/auth/signup/email', {
+        'email': bench_email('signup-{}-{}'.format(fx.run, i)), 'password': PASSWORD,
+        'first_name': 'Bench', 'last_name': str(i)})
+
+
+def login_email(fx, i):
+    return post_json('/auth/login/email', {'email': bench_email('owner'), 'password': PASSWORD})
+
+
+def refresh(fx, i):
+    return 'POST', '/auth/refresh', {'headers': fx.auth(fx.refresh_token)}
+
+
+def prepare_google_signup(fx, count):
+    for i in range(count):
+        code = 'google-signup-{}'.format(i)
+        fx.google_tokens[code] = fx.key_set.sign(
+            GOOGLE_CLIENT_ID, email=bench_email('google-{}-{}'.format(fx.run, i)))
+
+
+def google_signup(fx, i):
+    return post_json('/auth/google/signup', {'code': 'google-signup-{}'.format(i),
+                                             'invite_nonce': 'nonce'})
+
+
+def google_login(fx, i):
+    return post_json('/auth/google/login', {'code': 'owner'})
+
+
+def facebook_signup(fx, i):
+    return post_json('/auth/signup/facebook', {
+        'user_token': 'fb-signup-{}-{}'.format(fx.run, i), 'user_type': 'user'})
+
+
+def facebook_login(fx, i):
+    return post_json('/auth/login/facebook', {'user_token': 'fb-owner'})
+
+
+def get_users(fx, i):
+    ids = ','.join(str(fx.random_id()) for _ in range(20))
+    return 'GET', '/users?ids={}'.format(ids), {}
+
+
+def get_user(fx, i):
+    return 'GET', '/users/{}'.format(fx.random_id()), {}
+
+
+def get_me(fx, i):
+    return 'GET', '/users/me', {'headers': fx.auth()}
+
+
+def update_me(fx, i):
+    data = {'first_name': 'Bench {}'.format(i)}
+    return 'PUT', '/users/me', {'data': json.dumps(data), 'content_type': 'application/json',
+                                'headers': fx.auth()}
+
+
+def prepare_delete_me(fx, count):
+    fx.victim_tokens = [fx.create_user('victim-{}-{}'.format(fx.run, i))[1]
+                        for i in range(count)]
+
+
+def delete_me(fx, i):
+    return 'DELETE', '/users/me', {'headers': fx.auth(fx.victim_tokens[i])}
+
+
+def create_resource_a(fx, i):
+    return post_json('/resource-a', {'name': 'Bench resource {}'.format(i)}, fx.auth())
+
+
+def get_resource_a_page(fx, i):
+    return 'GET', '/resource-a', {}
+
+
+def get_resource_a_page_expanded(fx, i):
+    return 'GET', '/resource-a?expand=resource_b', {}
+
+
+def get_resource_a(fx, i):
+    return 'GET', '/resource-a/{}'.format(fx.random_id()), {}
+
+
+def get_resource_a_expanded(fx, i):
+    return 'GET', '/resource-a/{}?expand=resource_b'.format(fx.random_id()), {}
+
+
+def update_resource_a(fx, i):
+    data = {'name': 'Bench resource {}'.format(i)}
+    return 'PUT', '/resource-a/{}'.format(fx.owned_resource_id), {
+        'data': json.dumps(data), 'content_type': 'application/json', 'headers': fx.auth()}
+
+
+def prepare_delete_resource_a(fx, count):
+    resources = [ResourceA(name='Bench victim {}'.format(i)) for i in range(count)]
+
+    for resource_a in resources:
+        resource_a.owner_id = fx.owner_id
+
+    db.session.add_all(resources)
+    db.session.commit()
+
+    fx.victim_resource_ids = [resource_a.id for resource_a in resources]
+
+
+def delete_resource_a(fx, i):
+    return 'DELETE', '/resource-a/{}'.format(fx.victim_resource_ids[i]), {'headers': fx.auth()}
+
+
+# name, prepare(fixtures, count) creating per request fixtures or None, build(fixtures, i)
+ENDPOINTS = [
+    ('POST /auth/signup/email', None, signup_email),
+    ('POST /auth/login/email', None, login_email),
+    ('POST /auth/refresh', None, refresh),
+    ('POST /auth/google/signup', prepare_google_signup, google_signup),
+    ('POST /auth/google/login', None, google_login),
+    ('POST /auth/signup/facebook', None, facebook_signup),
+    ('POST /auth/login/facebook', None, facebook_login),
+    ('GET /users?ids=', None, get_users),
+    ('GET /users/<id>', None, get_user),
+    ('GET /users/me', None, get_me),
+    ('PUT /users/me', None, update_me),
+    ('DELETE /users/me', prepare_delete_me, delete_me),
+    ('POST /resource-a', None, create_resource_a),
+    ('GET /resource-a', None, get_resource_a_page),
+    ('GET /resource-a?expand=resource_b', None, get_resource_a_page_expanded),
+    ('GET /resource-a/<id>', None, get_resource_a),
+    ('GET /resource-a/<id>?expand=resource_b', None, get_resource_a_expanded),
+    ('PUT /resource-a/<id>', None, update_resource_a),
+    ('DELETE /resource-a/<id>', prepare_delete_resource_a, delete_resource_a),
+]
+
+
+def percentile(sorted_values, percent):
+    """
+    Nearest rank percentile
+    :param sorted_values: list of float
+    :param percent: int
+    :return: float
+    """
+    index = max(0, -(-len(sorted_values) * percent // 100) - 1)
+
+    return sorted_values[index]
+
+
+def call(client, fx, build, i):
+    """
+    Makes one request
+    :return: status code (int), latency in seconds (float), queries (int)
+    """
+    method, url, kwargs = build(fx, i)
+
+    with record_queries() as log:
+        start = time.perf_counter()
+        response = client.open(url, method=method, **kwargs)
+        elapsed = time.perf_counter() - start
+
+    response.close()
+
+    return response.status_code, elapsed, log.count
+
+
+def measure(client, fx, build, count):
+    """
+    Calls an endpoint MEMORY_REQUESTS times under tracemalloc, then count times
+    :return: dict
+    """
+    tracemalloc.start()
+    for i in range(MEMORY_REQUESTS):
+        call(client, fx, build, i)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies, queries, statuses = [], [], {}
+
+    for i in range(MEMORY_REQUESTS, MEMORY_REQUESTS + count):
+        status_code, elapsed, query_count = call(client, fx, build, i)
+
+        latencies.append(elapsed)
+        queries.append(query_count)
+        statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+
+    latencies.sort()
+
+    return {
+        'requests': count,
+        'throughput': count / sum(latencies),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'mean_ms': sum(latencies) / count * 1000,
+        'queries': sum(queries) / count,
+        'peak_memory_kb': peak / 1024,
+        'statuses': statuses,
+    }
+
+
+def git_commit():
+    """
+    :return: str or None -- short hash of the checked out commit
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(size, count):
+    """
+    Benchmarks every endpoint
+    :param size: int
+    :param count: int -- requests per endpoint
+    :return: dict of endpoint name -> results
+    """
+    fx = Fixtures(size, count)
+    total = MEMORY_REQUESTS + count
+
+    with app.app_context():
+        fx.create()
+
+        for _, prepare, _ in ENDPOINTS:
+            if prepare is not None:
+                prepare(fx, total)
+
+    key_cache = keys.GoogleKeyCache()
+    key_cache.load(fx.key_set.jwks(), max_age=3600)
+
+    results = {}
+    client = app.test_client()
+
+    with mock.patch.object(keys, 'key_cache', key_cache), \
+            mock.patch.object(outbound, 'post', fx.fake_post), \
+            mock.patch.object(outbound, 'get', fx.fake_get):
+        for name, _, build in ENDPOINTS:
+            results[name] = measure(client, fx, build, count)
+
+            print('{:>40} | {:>8.1f} | {:>8.2f} | {:>8.2f} | {:>7.1f} | {:>9.0f} | {}'.format(
+                name, results[name]['throughput'], results[name]['p50_ms'],
+                results[name]['p99_ms'], results[name]['queries'],
+                results[name]['peak_memory_kb'], results[name]['statuses']))
+
+    return results
+
+
+def compare(base, current):
+    """
+    Prints the change of every endpoint between two result files
+    :param base: dict -- saved results
+    :param current: dict -- saved results
+    :return:
+    """
+    print('\nCompared to {} ({} rows):'.format(base.get('commit'), base.get('size')))
+    print('{:>40} | {:>16} | {:>16} | {:>12}'.format('endpoint', 'req/s', 'p99 ms', 'queries'))
+
+    def change(old, new):
+        return '{:>+7.1f}%'.format((new - old) * 100 / old) if old else '       -'
+
+    for name, result in current['endpoints'].items():
+        old = base['endpoints'].get(name)
+
+        if old is None:
+            continue
+
+        print('{:>40} | {:>7.1f} {} | {:>7.2f} {} | {:>4.1f} -> {:>4.1f}'.format(
+            name, result['throughput'], change(old['throughput'], result['throughput']),
+            result['p99_ms'], change(old['p99_ms'], result['p99_ms']),
+            old['queries'], result['queries']))
+
+
+def main():
+    """
+    Seeds the dataset if needed, benchmarks every endpoint and saves the results
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks every API endpoint')
+    parser.add_argument('--size', default='1k', help="1k, 100k, 1m or a number of rows")
+    parser.add_argument('--requests', type=int, default=REQUESTS,
+                        help='Timed requests per endpoint')
+    parser.add_argument('--database-url', help='Defaults to a SQLite file per size. Its tables '
+                        'are dropped to seed the dataset, which needs --reset')
+    parser.add_argument('--reset', action='store_true',
+                        help='Drop the tables of --database-url if it lacks the dataset')
+    parser.add_argument('--output', help='Results file, defaults to benchmarks/results/')
+    parser.add_argument('--compare', help='Results file of an earlier run to compare with')
+    args = parser.parse_args()
+
+    size = parse_size(args.size)
+
+    # The engine is only created on first use, so it picks this up
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url or \
+        'sqlite:///benchmarks-{}.db'.format(size)
+    app.config['GOOGLE_CLIENT_ID'] = GOOGLE_CLIENT_ID
+
+    with app.app_context():
+        if not is_seeded(size):
+            if args.database_url and not args.reset:
+                parser.error('{} does not hold the {} rows dataset, pass --reset to drop its '
+                             'tables and seed it'.format(args.database_url, size))
+
+            print('Seeding {} users and resources...'.format(size))
+            start = time.perf_counter()
+            seed(size)
+            print('Seeded in {:.1f}s'.format(time.perf_counter() - start))
+
+        cleanup()
+
+    print('{:>40} | {:>8} | {:>8} | {:>8} | {:>7} | {:>9} | {}'.format(
+        'endpoint', 'req/s', 'p50 ms', 'p99 ms', 'queries', 'peak KiB', 'statuses'))
+
+    try:
+        endpoints = run(size, args.requests)
+    finally:
+        with app.app_context():
+            cleanup()
+
+    results = {
+        'commit': git_commit(),
+        'time': datetime.utcnow().isoformat(),
+        'size': size,
+        'requests': args.requests,
+        'database': db.get_engine(app).dialect.name,
+        'python': platform.python_version(),
+        'endpoints': endpoints,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, 'endpoints-{}-{}.json'.format(
+        size, results['commit'] or int(time.time())))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print('\nSaved to {}'.format(output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmarks GET /resource-a?expand=resource_b against a lazy load of each parent's children
+Shows that the number of queries stays constant as the page size grows
+
+The tables are recreated in a SQLite file of their own unless --database-url says otherwise
+
+Usage: ENVIRONMENT=TESTING python -m benchmarks.expand_queries [--database-url URL]
+"""
+
+# pylint: disable=no-member,invalid-name
+
+import argparse
+import time
+
+from app_name import create_app
+from app_name.database import db
+from app_name.resources.models import ResourceA, ResourceB
+from app_name.users.models import User
+from app_name.util.queries import record_queries
+
+app = create_app()
+
+PAGE_SIZES = (10, 50, 100, 200)
+CHILDREN_PER_PARENT = 5
+REPEATS = 20
+
+
+def seed():
+    """
+    Creates one owner with max(PAGE_SIZES) resource A's, each with CHILDREN_PER_PARENT children
+    :return:
+    """
+    db.drop_all()
+    db.create_all()
+
+    owner = User(email='owner@example.com', password='pass12345')
+    db.session.add(owner)
+    db.session.commit()
+
+    for i in range(max(PAGE_SIZES)):
+        resource_a = ResourceA(name='Resource {}'.format(i))
+        resource_a.owner_id = owner.id
+        resource_a.resource_b_set = [ResourceB(name='Child {}'.format(j))
+                                     for j in range(CHILDREN_PER_PARENT)]
+        db.session.add(resource_a)
+
+    db.session.commit()
+
+
+def measure(request_fn):
+    """
+    Runs request_fn REPEATS times
+    :param request_fn: function
+    :return: queries per call (int), mean latency in ms (float)
+    """
+    with record_queries() as log:
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            db.session.expire_all()
+            request_fn()
+        elapsed = time.perf_counter() - start
+
+    return log.count // REPEATS, elapsed / REPEATS * 1000
+
+
+def main():
+    """
+    Prints queries and latency per request for each page size
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks expanding resource B')
+    parser.add_argument('--database-url', help='Recreated, defaults to a SQLite file of its own')
+    args = parser.parse_args()
+
+    # The engine is only created on first use, so it picks this up
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url or \
+        'sqlite:///benchmarks-expand-queries.db'
+
+    with app.app_context():
+        seed()
+
+        client = app.test_client()
+
+        print('{:>9} | {:>22} | {:>22}'.format('page size', 'expand=resource_b',
+                                               'per-parent lazy load'))
+
+        for page_size in PAGE_SIZES:
+            expanded = measure(lambda: client.get(
+                '/resource-a?expand=resource_b&limit={}'.format(page_size)))
+
+            def lazy():
+                items = client.get('/resource-a?limit={}'.format(page_size)).json['items']
+                for item in items:
+                    for child in ResourceA.query.get(item['id']).resource_b_set:
+                        child.to_dict()
+
+            lazy_loaded = measure(lazy)
+
+            print('{:>9} | {:>3} queries {:>7.2f} ms | {:>3} queries {:>7.2f} ms'.format(
+                page_size, expanded[0], expanded[1], lazy_loaded[0], lazy_loaded[1]))
+
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmarks POST /auth/login/email throughput against the password hashing pool size
+Logins are issued from CONCURRENCY threads, standing in for concurrent requests in a worker, and
+hashed with the scheme of the config, pbkdf2_sha512 under TESTING
+
+The tables are recreated in a SQLite file of their own unless --database-url says otherwise
+
+Usage: ENVIRONMENT=TESTING python -m benchmarks.login_throughput [--database-url URL]
+"""
+
+# pylint: disable=no-member,invalid-name
+
+import argparse
+import json
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from app_name import create_app
+from app_name.database import db
+from app_name.users.models import User
+from app_name.util import passwords
+
+app = create_app()
+
+POOL_SIZES = (0, 1, 2, 4, os.cpu_count())
+CONCURRENCY = 8
+LOGINS = 200
+
+
+def login(_):
+    """
+    Logs the benchmark user in once
+    :return: status code (int)
+    """
+    with app.test_client() as client:
+        return client.post('/auth/login/email', data=json.dumps({
+            'email': 'bench@example.com',
+            'password': 'pass12345'
+        }), content_type='application/json').status_code
+
+
+def main():
+    """
+    Prints logins per second for each pool size
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks email logins')
+    parser.add_argument('--database-url', help='Recreated, defaults to a SQLite file of its own')
+    args = parser.parse_args()
+
+    # The engine is only created on first use, so it picks this up
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url or \
+        'sqlite:///benchmarks-login-throughput.db'
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        db.session.add(User(email='bench@example.com', password='pass12345'))
+        db.session.commit()
+
+    print('{:>9} | {:>10} | {:>8}'.format('pool size', 'logins/s', 'rejected'))
+
+    for pool_size in sorted(set(POOL_SIZES)):
+        app.config['PASSWORD_HASH_POOL_SIZE'] = pool_size
+        app.config['PASSWORD_HASH_QUEUE_DEPTH'] = CONCURRENCY
+
+        # Warm up the pool's processes outside of the timing
+        with ThreadPoolExecutor(CONCURRENCY) as executor:
+            list(executor.map(login, range(CONCURRENCY)))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(CONCURRENCY) as executor:
+            statuses = list(executor.map(login, range(LOGINS)))
+        elapsed = time.perf_counter() - start
+
+        print('{:>9} | {:>10.1f} | {:>8}'.format(pool_size, LOGINS / elapsed,
+                                                  statuses.count(503)))
+
+        with app.app_context():
+            passwords.shutdown_pool()
+
+    with app.app_context():
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
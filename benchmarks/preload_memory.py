@@ -0,0 +1,189 @@
+"""
+Measures the memory of gunicorn workers with and without preloading the app
+Starts gunicorn with gunicorn.conf.py on a local port, once loading the app in every worker and
+once in the master only, and warms the workers up with REQUESTS requests to the API. Then
+reports, from /proc, each process' unique memory (USS: pages no other process maps) and
+proportional share (PSS: its unique memory plus its share of the pages it maps with others)
+
+Linux only. The database is seeded with USERS users in the SQLite file of the config
+
+Usage: ENVIRONMENT=TESTING python -m benchmarks.preload_memory [--workers 4] [--requests 400]
+"""
+
+# pylint: disable=no-member,invalid-name
+
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+from flask_jwt_extended import create_access_token
+
+from app_name import create_app
+from app_name.database.seed import seed
+
+app = create_app()
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Installed next to the interpreter, gunicorn 20.0 can't be run with -m
+GUNICORN = os.path.join(os.path.dirname(sys.executable), 'gunicorn')
+
+WORKERS = 4
+REQUESTS = 400
+USERS = 1000
+
+# Every one of them goes through the database
+PATHS = ('/users?ids=1,2,3', '/users/me', '/users/2', '/resource-a?expand=resource_b')
+
+STARTUP_TIMEOUT = 60
+
+
+def free_port():
+    """
+    :return: int -- a local port nothing listens on
+    """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, process):
+    """
+    :param url: str
+    :param process: Popen -- gunicorn's master
+    :return:
+    """
+    deadline = time.time() + STARTUP_TIMEOUT
+
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn exited with {}'.format(process.returncode))
+
+        try:
+            requests.get(url + '/internal/metrics', timeout=5)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+
+    raise RuntimeError('gunicorn did not start in {} s'.format(STARTUP_TIMEOUT))
+
+
+def children(pid):
+    """
+    :param pid: int
+    :return: list of int -- pids of the processes whose parent is pid
+    """
+    found = []
+
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+
+        try:
+            with open('/proc/{}/stat'.format(entry)) as f:
+                # The command name in parentheses may hold spaces, the parent's pid follows it
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+
+        if int(fields[1]) == pid:
+            found.append(int(entry))
+
+    return sorted(found)
+
+
+def memory(pid):
+    """
+    :param pid: int
+    :return: dict of 'rss', 'pss' and 'uss' -> kB
+    """
+    totals = {}
+
+    # smaps_rollup sums smaps over every mapping (Linux 4.14+)
+    path = '/proc/{}/smaps_rollup'.format(pid)
+
+    if not os.path.exists(path):
+        path = '/proc/{}/smaps'.format(pid)
+
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+
+            if len(parts) == 3 and parts[2] == 'kB':
+                totals[parts[0][:-1]] = totals.get(parts[0][:-1], 0) + int(parts[1])
+
+    return {'rss': totals['Rss'], 'pss': totals['Pss'],
+            'uss': totals['Private_Clean'] + totals['Private_Dirty']}
+
+
+def measure(preload, workers, count, token):
+    """
+    Starts gunicorn, warms its workers up and reads their memory
+    :param preload: bool
+    :param workers: int
+    :param count: int -- requests to warm the workers up with
+    :param token: str -- access token of a seeded user
+    :return: tuple of the master's memory (dict) and each worker's (list of dict)
+    """
+    port = free_port()
+    url = 'http://127.0.0.1:{}'.format(port)
+
+    env = dict(os.environ, GUNICORN_PRELOAD='1' if preload else '0',
+               WEB_CONCURRENCY=str(workers))
+
+    process = subprocess.Popen(
+        [GUNICORN, '-c', 'gunicorn.conf.py', '--bind',
+         '127.0.0.1:{}'.format(port), '--log-level', 'warning', 'app_name:create_app()'],
+        cwd=ROOT, env=env)
+
+    try:
+        wait_until_up(url, process)
+
+        # A new connection each time, so the requests are spread over the workers
+        headers = {'Authorization': 'Bearer {}'.format(token), 'Connection': 'close'}
+
+        for i in range(count):
+            response = requests.get(url + PATHS[i % len(PATHS)], headers=headers)
+            assert response.status_code == 200, response.status_code
+
+        return memory(process.pid), [memory(pid) for pid in children(process.pid)]
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait()
+
+
+def main():
+    """
+    Prints the memory of each mode
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Measures the memory of gunicorn workers')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Workers to start')
+    parser.add_argument('--requests', type=int, default=REQUESTS, help='Warm up requests')
+    args = parser.parse_args()
+
+    with app.app_context():
+        seed(USERS, reset=True)
+        token = create_access_token(identity=1)
+
+    print('{:>10} | {:>11} | {:>15} | {:>15} | {:>15}'.format(
+        'preload', 'master USS', 'worker USS mean', 'worker PSS mean', 'total PSS'))
+
+    for preload in (False, True):
+        master, workers = measure(preload, args.workers, args.requests, token)
+
+        print('{:>10} | {:>8.1f} MB | {:>12.1f} MB | {:>12.1f} MB | {:>12.1f} MB'.format(
+            'on' if preload else 'off', master['uss'] / 1024,
+            sum(worker['uss'] for worker in workers) / len(workers) / 1024,
+            sum(worker['pss'] for worker in workers) / len(workers) / 1024,
+            (master['pss'] + sum(worker['pss'] for worker in workers)) / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmarks responses per second of each helper in util/responses.py
+"before" rebuilds the helper's payload and runs it through jsonify, as every helper used to;
+"after" calls the helper with the stdlib encoder and, if it's installed, orjson
+
+Usage: ENVIRONMENT=TESTING python -m benchmarks.responses
+"""
+
+# pylint: disable=no-member,invalid-name
+
+import json
+import time
+
+from datetime import datetime
+
+from flask import jsonify
+
+from app_name import create_app
+from app_name.util import encoding, responses
+
+app = create_app()
+
+CALLS = 20000
+
+# A page of API_DEFAULT_PAGE_SIZE rows, shaped like GET /resource-a?expand=resource_b
+PAGE = {
+    'items': [{'id': i, 'name': 'Resource {}'.format(i), 'owner_id': 1,
+               'created_at': datetime(2020, 1, 1), 'updated_at': None,
+               'resource_b': [{'id': j, 'name': 'Child {}'.format(j), 'resource_a_id': i}
+                              for j in range(5)]}
+              for i in range(50)],
+    'next_cursor': 'NTA'
+}
+
+HELPERS = [
+    ('missing_params', responses.missing_params, ()),
+    ('unauthorized', responses.unauthorized, ()),
+    ('user_not_found', responses.user_not_found, ()),
+    ('invalid_password', responses.invalid_password, ()),
+    ('user_updated', responses.user_updated, ()),
+    ('resource_not_found', responses.resource_not_found, ('ResourceA',)),
+    ('invalid_request_keys', responses.invalid_request_keys, ({'foo', 'bar'},)),
+    ('user_logged_in', responses.user_logged_in, ('a' * 300, 'b' * 300, 1, {'id': 1})),
+    ('json_response (page of 50)', responses.json_response, (PAGE,)),
+]
+
+
+def rate(fn, args):
+    """
+    Calls fn(*args) CALLS times
+    :return: calls per second (float)
+    """
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        fn(*args)
+
+    return CALLS / (time.perf_counter() - start)
+
+
+def main():
+    """
+    Prints responses per second of each helper before and after
+    :return:
+    """
+    backends = ['json'] + (['orjson'] if encoding.orjson is not None else [])
+
+    with app.test_request_context():
+        print('{:>28} | {:>10} | {}'.format('helper', 'jsonify', ' | '.join(
+            '{:>18}'.format(backend) for backend in backends)))
+
+        for name, helper, args in HELPERS:
+            encoding.set_backend(backends[0])
+            response, status_code = helper(*args)
+            payload = PAGE if helper is responses.json_response else json.loads(
+                response.get_data())
+
+            before = rate(lambda: (jsonify(payload), status_code), ())
+
+            after = []
+            for backend in backends:
+                encoding.set_backend(backend)
+                after.append(rate(helper, args))
+
+            print('{:>28} | {:>10.0f} | {}'.format(name, before, ' | '.join(
+                '{:>10.0f} ({:>4.1f}x)'.format(value, value / before) for value in after)))
+
+        encoding.set_backend(None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Profiles what importing and creating the app costs for each set of enabled subsystems
+Every run is a fresh interpreter started with -X importtime, so nothing is already imported.
+Reports the median time to create_app, the modules loaded, whether Flask-Admin was, and the
+packages whose imports take the longest
+
+Usage: ENVIRONMENT=TESTING python -m benchmarks.startup [--runs 5] [--top 12]
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from collections import defaultdict
+
+# name -> BLUEPRINTS
+VARIANTS = (
+    ('full', 'auth,users,resources,admin'),
+    ('api', 'auth,users,resources'),
+    ('bare', ''),
+)
+
+RUNS = 5
+TOP = 12
+
+# Run by each child interpreter, prints its measurements as JSON on the last line
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+from app_name import create_app
+create_app(blueprints=[name for name in sys.argv[1].split(',') if name])
+print(json.dumps({'seconds': time.perf_counter() - start, 'modules': len(sys.modules),
+                  'flask_admin': 'flask_admin' in sys.modules}))
+'''
+
+# e.g. 'import time:       412 |       1873 |   flask_admin.base'
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def parse_import_times(stderr):
+    """
+    Adds up the self time of every imported module by top level package
+    :param stderr: str -- output of python -X importtime
+    :return: dict of package -> seconds
+    """
+    packages = defaultdict(float)
+
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+
+        if match:
+            packages[match.group(4).split('.')[0]] += int(match.group(1)) / 1e6
+
+    return packages
+
+
+def profile(blueprints):
+    """
+    Creates the app in a fresh interpreter
+    :param blueprints: str -- comma separated
+    :return: dict of the child's measurements, with its import times by package
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD, blueprints],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True, env=dict(os.environ), check=True)
+
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result['packages'] = parse_import_times(process.stderr)
+
+    return result
+
+
+def main():
+    """
+    Profiles every variant and prints a report
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Profiles import time of the app')
+    parser.add_argument('--runs', type=int, default=RUNS, help='Runs per variant')
+    parser.add_argument('--top', type=int, default=TOP, help='Packages listed per variant')
+    args = parser.parse_args()
+
+    # Compiles the bytecode, so the first measured run doesn't pay for it
+    profile(VARIANTS[0][1])
+
+    for name, blueprints in VARIANTS:
+        runs = [profile(blueprints) for _ in range(args.runs)]
+        packages = runs[-1]['packages']
+
+        print('{} (BLUEPRINTS={!r}): create_app in {:.0f} ms median, {} modules, '
+              'Flask-Admin {}loaded, {:.0f} ms importing'.format(
+                  name, blueprints, statistics.median(run['seconds'] for run in runs) * 1000,
+                  runs[-1]['modules'], '' if runs[-1]['flask_admin'] else 'not ',
+                  sum(packages.values()) * 1000))
+
+        for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print('{:>30} {:>8.1f} ms'.format(package, seconds * 1000))
+
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Gunicorn settings, read from the working directory by `gunicorn 'app_name:create_app()'`
+The master imports and creates the app once, then forks the workers, which share its memory
+copy-on-write instead of each loading their own. Whatever the master may have opened is
+closed before each fork, and each worker drops the per-process clients it inherited.
+GUNICORN_PRELOAD=0 loads the app in every worker instead
+
+GUNICORN_WORKER_CLASS=gevent runs cooperative workers, each serving up to
+GUNICORN_WORKER_CONNECTIONS requests at once: logins mostly wait on Google or Facebook, and
+a sync worker waiting on them serves nothing else. See app_name/util/cooperative.py
+"""
+
+# pylint: disable=invalid-name,unused-argument
+
+import gc
+import os
+
+workers = int(os.getenv('WEB_CONCURRENCY', '3'))
+timeout = 60
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '100'))
+
+if worker_class == 'gevent':
+    # Before the app is loaded, by the master too when it preloads, so every socket, lock and
+    # thread the app creates yields to the other greenlets
+    from gevent import monkey
+
+    monkey.patch_all()
+
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') != '0'
+
+
+def pre_fork(server, worker):
+    """
+    Runs in the master before each fork
+    :return:
+    """
+    if not server.cfg.preload_app:
+        return
+
+    from app_name import before_fork
+
+    before_fork(server.app.wsgi())
+
+    # Moves everything loaded so far out of the collector's reach, so collections in the workers
+    # don't write to, and so copy, the pages they share (Python 3.7+)
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    """
+    Runs in each worker right after the fork
+    :return:
+    """
+    if not server.cfg.preload_app:
+        return
+
+    from app_name import after_fork
+
+    after_fork(server.app.wsgi())
@@ -0,0 +1,42 @@
+"""add outbox email
+
+Revision ID: 252558ad62fb
+Revises: df8f61a77a86
+Create Date: 2026-10-18 18:31:41.902644
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '252558ad62fb'
+down_revision = 'df8f61a77a86'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outbox_email',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('subject', sa.Text(), nullable=False),
+    sa.Column('sender', sa.Text(), nullable=True),
+    sa.Column('recipients', sa.Text(), nullable=False),
+    sa.Column('body', sa.Text(), nullable=True),
+    sa.Column('html', sa.Text(), nullable=True),
+    sa.Column('status', sa.Enum('PENDING', 'SENT', 'FAILED', name='outboxemailstatus'), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_outbox_email_status_next_attempt_at', 'outbox_email', ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_outbox_email_status_next_attempt_at', table_name='outbox_email')
+    op.drop_table('outbox_email')
+    # Postgres keeps the enum type the table created
+    sa.Enum(name='outboxemailstatus').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,33 @@
+"""add version columns
+
+Revision ID: ab61dee7c0c4
+Revises: 252558ad62fb
+Create Date: 2026-10-18 18:31:44.137529
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ab61dee7c0c4'
+down_revision = '252558ad62fb'
+branch_labels = None
+depends_on = None
+
+# Rows ETags are derived from
+TABLES = ('user', 'resourceA', 'resourceB')
+
+
+def upgrade():
+    # Existing rows start at version 1 through the server default
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1',
+                                       nullable=False))
+
+
+def downgrade():
+    # SQLite can't drop a column in place, batch mode recreates the table
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('version')
@@ -0,0 +1,47 @@
+"""null passwordless users' password
+
+Revision ID: cf31cccd29ed
+Revises: e93259101c83
+Create Date: 2026-10-18 19:42:07.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from flask_security.utils import hash_password, verify_password
+
+
+# revision identifiers, used by Alembic.
+revision = 'cf31cccd29ed'
+down_revision = 'e93259101c83'
+branch_labels = None
+depends_on = None
+
+user = sa.table('user', sa.column('id', sa.Integer), sa.column('password', sa.Text))
+oauth_connection = sa.table('oauth_connection', sa.column('owner_id', sa.Integer))
+
+
+def upgrade():
+    # SQLite can't alter a column in place, batch mode recreates the table
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.alter_column('password', existing_type=sa.Text(), nullable=True)
+
+    # Passwordless accounts were stored with the hash of the empty password, which then logged
+    # them in. Only OAuth signups had none, so only their hashes are checked
+    connection = op.get_bind()
+    rows = connection.execute(sa.select([user.c.id, user.c.password]).where(
+        user.c.id.in_(sa.select([oauth_connection.c.owner_id])))).fetchall()
+
+    passwordless = [user_id for user_id, password in rows
+                    if password and verify_password('', password)]
+
+    if passwordless:
+        connection.execute(user.update().where(user.c.id.in_(passwordless))
+                           .values(password=None))
+
+
+def downgrade():
+    op.execute(user.update().where(user.c.password.is_(None)).values(password=hash_password('')))
+
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.alter_column('password', existing_type=sa.Text(), nullable=False)
@@ -0,0 +1,29 @@
+"""add resource A keyset index
+
+Revision ID: df8f61a77a86
+Revises: 5cd0faa9d95b
+Create Date: 2026-10-18 18:31:38.418203
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'df8f61a77a86'
+down_revision = '5cd0faa9d95b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keyset pagination of GET /resource-a walks this index. Built CONCURRENTLY on Postgres so
+    # the table stays writable, which can't happen inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_resource_a_created_at_id', 'resourceA', ['created_at', 'id'],
+                        unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_resource_a_created_at_id', table_name='resourceA',
+                      postgresql_concurrently=True)
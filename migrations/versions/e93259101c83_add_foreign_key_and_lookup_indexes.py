@@ -0,0 +1,41 @@
+"""add foreign key and lookup indexes
+
+Revision ID: e93259101c83
+Revises: ab61dee7c0c4
+Create Date: 2026-10-18 18:31:47.800295
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e93259101c83'
+down_revision = 'ab61dee7c0c4'
+branch_labels = None
+depends_on = None
+
+
+# name, table, columns
+INDEXES = [
+    ('ix_oauth_connection_owner_id', 'oauth_connection', ['owner_id']),
+    ('ix_oauth_connection_type_email_address', 'oauth_connection', ['type', 'email_address']),
+    ('ix_oauth_connection_type_ext_user_id', 'oauth_connection', ['type', 'ext_user_id']),
+    ('ix_resource_a_owner_id', 'resourceA', ['owner_id']),
+    ('ix_resource_b_resource_a_id', 'resourceB', ['resource_a_id']),
+    ('ix_roles_users_role_id', 'roles_users', ['role_id']),
+    ('ix_roles_users_user_id_role_id', 'roles_users', ['user_id', 'role_id']),
+]
+
+
+def upgrade():
+    # On Postgres the indexes are built CONCURRENTLY so the tables stay writable, which can't
+    # happen inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)